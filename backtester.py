@@ -0,0 +1,386 @@
+import os
+import time
+import sqlite3
+import click
+import numpy as np
+import pandas as pd
+from loguru import logger
+from binance.helpers import interval_to_milliseconds
+from market_data import Candles
+from kline_store import KlineStore
+from position import Position
+from utils import kernels
+from utils.config import Config
+from utils.constants import Constants
+from utils.trade_logger import chart_log_table
+
+try:
+    # optional, compiles the simulation loop to machine code when installed
+    from numba import njit
+except ImportError:
+    njit = None
+
+# the columns of the trades the simulation writes, one row per closed position
+trade_columns = ('entry_index', 'exit_index', 'side', 'entry_price', 'exit_price', 'volume', 'fee', 'profit', 'exit')
+# the close order that filled
+exit_tp = 1
+exit_sl = 2
+
+
+def simulate(
+    open_, high, low, close, atr, adx, uptrend,
+    adx_threshold, sl_tp_multiplier, trigger_multiplier, use_trailing_sl_tp, intrabar,
+    balance, margin_pct, leverage, fee_rate, slippage_rate, trades, equity
+):
+    '''
+    Replays Trader's position handling over the candles, one candle at a time.
+
+    Between the closes, the react_to_price runs check the take profit and stop loss
+    triggers against the candle's range with the signal of the last close (when
+    intrabar is set). On every close the strategy's signal is taken from the closed
+    candle, close_tp_sl runs on its close and a position is opened at market when there
+    is none. Closing a position places its take profit and stop loss orders like
+    Position.try_close_once does, and it's closed when the price reaches one of them,
+    the stop loss first when a candle reaches both.
+
+    Writes the closed positions into "trades" and the equity at every close into
+    "equity", returns the number of trades.
+    '''
+    count = 0
+    cash = balance
+    # the open position, side is 1 for a long, -1 for a short and 0 without one
+    side = 0
+    closing = False
+    placed = 0
+    entry_index = 0
+    entry = volume = entry_fee = 0.0
+    tp = sl = tp_trigger = sl_trigger = trigger_rate = 0.0
+    tp_order = sl_order = 0.0
+    # the signal of the last close and the take profit/stop loss rates it came with
+    signal = 0
+    signal_close = signal_rate = signal_trigger_rate = 0.0
+    for i in range(len(close)):
+        # the runs between the closes, then the run on the close
+        for run in range(2):
+            if run == 1:
+                signal = 0
+                if adx[i] >= adx_threshold:
+                    signal = 1 if uptrend[i] else -1
+                    signal_close = close[i]
+                    signal_rate = sl_tp_multiplier * atr[i]
+                    signal_trigger_rate = trigger_multiplier * atr[i]
+
+            if side != 0 and not closing and (run == 1 or intrabar):
+                if run == 0:
+                    sl_price = low[i] if side > 0 else high[i]
+                    tp_price = high[i] if side > 0 else low[i]
+                else:
+                    sl_price = tp_price = close[i]
+                price = np.nan
+                if side * (sl_trigger - sl_price) >= 0:
+                    price = sl_trigger if run == 0 else close[i]
+                elif side * (tp_price - tp_trigger) >= 0:
+                    if signal == side and use_trailing_sl_tp:
+                        # trailing tp and sl
+                        tp = signal_close + side * signal_rate
+                        sl = signal_close - side * signal_rate
+                        tp_trigger = signal_close + side * signal_trigger_rate
+                        sl_trigger = signal_close - side * signal_trigger_rate
+                        trigger_rate = signal_trigger_rate
+                    elif signal != 0 or not use_trailing_sl_tp:
+                        price = tp_trigger if run == 0 else close[i]
+                if price == price:
+                    closing = True
+                    placed = i
+                    tp_order, sl_order = tp, sl
+                    # a price already past the take profit or stop loss gets new ones around it
+                    if side * (price - tp) >= 0 or side * (sl - price) >= 0:
+                        tp_order = price + side * trigger_rate / 1.5
+                        sl_order = price - side * trigger_rate / 1.5
+
+            if closing and run == 0:
+                sl_price = low[i] if side > 0 else high[i]
+                tp_price = high[i] if side > 0 else low[i]
+                # orders placed before this candle fill at its open when it gaps past them
+                gapped = placed < i
+                exit_price = np.nan
+                reason = 0
+                if side * (sl_order - sl_price) >= 0:
+                    exit_price = open_[i] if gapped and side * (sl_order - open_[i]) >= 0 else sl_order
+                    reason = exit_sl
+                elif side * (tp_price - tp_order) >= 0:
+                    exit_price = open_[i] if gapped and side * (open_[i] - tp_order) >= 0 else tp_order
+                    reason = exit_tp
+                if reason != 0:
+                    exit_price = exit_price * (1 - side * slippage_rate)
+                    exit_fee = exit_price * volume * fee_rate
+                    profit = side * (exit_price - entry) * volume
+                    cash = cash + profit - exit_fee
+                    trades[count, 0] = entry_index
+                    trades[count, 1] = i
+                    trades[count, 2] = side
+                    trades[count, 3] = entry
+                    trades[count, 4] = exit_price
+                    trades[count, 5] = volume
+                    trades[count, 6] = entry_fee + exit_fee
+                    trades[count, 7] = profit - entry_fee - exit_fee
+                    trades[count, 8] = reason
+                    count = count + 1
+                    side = 0
+                    closing = False
+
+        if side == 0 and signal != 0 and cash > 0:
+            side = signal
+            entry_index = i
+            entry = close[i] * (1 + side * slippage_rate)
+            volume = (margin_pct * cash / 100) * leverage / close[i]
+            entry_fee = entry * volume * fee_rate
+            cash = cash - entry_fee
+            # the take profit and stop loss are set from the fill price, as on_position_order_filled does
+            trigger_rate = signal_trigger_rate
+            tp = entry + side * signal_rate
+            sl = entry - side * signal_rate
+            tp_trigger = entry + side * signal_trigger_rate
+            sl_trigger = entry - side * signal_trigger_rate
+
+        equity[i] = cash + side * (close[i] - entry) * volume if side != 0 else cash
+    return count
+
+
+simulate_compiled = njit(cache=True, nogil=True)(simulate) if njit is not None else None
+
+
+# a candles column as a contiguous float64 array, copied only when it isn't one already
+def column(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+# the candles of a symbol from the kline store the bot saves them to
+def load_store(symbol, timeframe, directory=None):
+    store = KlineStore(Constants.klines_dir_name if directory is None else directory)
+    gaps = store.gaps(symbol, timeframe, interval_to_milliseconds(timeframe))
+    if len(gaps) > 0:
+        # the backtests run over them as if the candles were next to each other
+        missing = sum(count for _, count in gaps)
+        logger.warning(f'KlineStoreError: {symbol} {timeframe} has {len(gaps)} gaps, {missing} candles missing')
+    return store.candles(symbol, timeframe)
+
+
+# the candles of a symbol's chart log table, its close times in milliseconds
+def load_chart_log(symbol, timeframe, path=None):
+    path = f'{Constants.log_dir_name}/{Constants.chart_log_db_filename}' if path is None else path
+    with sqlite3.connect(path) as connection:
+        df = pd.read_sql_query(
+            f'SELECT time, open, high, low, close, volume FROM "{chart_log_table(symbol)}" ORDER BY time', connection
+        )
+    close_time = df['time'].to_numpy(dtype=np.float64)
+    rows = np.column_stack([
+        close_time - interval_to_milliseconds(timeframe) + 1,
+        df['open'], df['high'], df['low'], df['close'], df['volume'], close_time
+    ])
+    return Candles.from_rows(symbol, timeframe, rows)
+
+
+# the candles of a klines CSV file, as dumped from the exchange (open time, open, high,
+# low, close, volume and close time first, with or without a header)
+def load_csv(symbol, timeframe, path):
+    df = pd.read_csv(path, header=None)
+    rows = df.iloc[:, :7].apply(pd.to_numeric, errors='coerce').dropna().to_numpy(dtype=np.float64)
+    return Candles.from_rows(symbol, timeframe, rows)
+
+
+class BacktestResult:
+    '''
+    The closed positions of a backtest as a trades table, and its equity curve at every
+    candle close.
+    '''
+
+    def __init__(self, symbol, trades, equity, balance):
+        self.symbol = symbol
+        self.trades = trades
+        self.equity = equity
+        self.balance = balance
+
+    def summary(self):
+        trades = self.trades
+        equity = self.equity.to_numpy()
+        final = float(equity[-1]) if len(equity) > 0 else self.balance
+        peaks = np.maximum.accumulate(equity) if len(equity) > 0 else equity
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdown = float(np.nanmax((peaks - equity) / peaks)) if len(equity) > 0 else 0.0
+        wins = int((trades['profit'] > 0).sum())
+        return {
+            'symbol': self.symbol,
+            'candles': len(equity),
+            'trades': len(trades),
+            'wins': wins,
+            'win_rate': wins / len(trades) if len(trades) > 0 else 0.0,
+            'profit': float(trades['profit'].sum()),
+            'fees': float(trades['fee'].sum()),
+            'final_equity': final,
+            'return_pct': (final - self.balance) / self.balance * 100,
+            'max_drawdown_pct': drawdown * 100,
+        }
+
+
+class Backtester:
+    '''
+    Runs the Trader strategy over historical candles offline.
+
+    The indicators the strategy reads (ATR, ADX, the volume weighted supertrend and
+    VWAP) are computed once over the whole history with the array kernels, giving the
+    values the live IndicatorEngine gives every candle as it closes: the supertrend
+    weighs the prices by the mean volume of the last max_positions_per_chart candles
+    like the engine does. The positions are then replayed by "simulate", compiled with
+    numba when it's installed, with fees and slippage on every fill.
+
+    The strategy runs on each closed candle, where the live trader runs on the forming
+    candle a few seconds after the close. Prices and volumes are not rounded to the
+    symbol's tick and step sizes, and liquidations aren't simulated.
+    '''
+
+    def __init__(
+        self, period=None, factor=None, adx_threshold=None, sl_tp_multiplier=None, trigger_multiplier=None,
+        use_trailing_sl_tp=True, intrabar=True, balance=1000, margin_pct=10, leverage=10,
+        fee_rate=None, slippage_rate=None, window=None
+    ):
+        self.period = Config.indicator_period if period is None else period
+        self.factor = Config.indicator_factor if factor is None else factor
+        self.adx_threshold = Config.adx_threshold if adx_threshold is None else adx_threshold
+        self.sl_tp_multiplier = Config.sl_tp_atr_multiplier if sl_tp_multiplier is None else sl_tp_multiplier
+        self.trigger_multiplier = Config.sl_tp_trigger_atr_multiplier if trigger_multiplier is None else trigger_multiplier
+        self.use_trailing_sl_tp = use_trailing_sl_tp
+        self.intrabar = intrabar
+        self.balance = balance
+        self.margin_pct = margin_pct
+        self.leverage = leverage
+        self.fee_rate = Config.backtest_fee_rate if fee_rate is None else fee_rate
+        self.slippage_rate = Config.backtest_slippage_rate if slippage_rate is None else slippage_rate
+        self.window = Config.max_positions_per_chart if window is None else window
+
+    # the indicator columns logic() reads, for every candle. With a cache (a dict kept for
+    # one candles array) the columns that don't depend on every parameter, like the atr
+    # and adx of a period, are computed once for all the backtests sharing them
+    def indicators(self, candles, cache=None):
+        cache = {} if cache is None else cache
+        high, low, close, volume = column(candles.high), column(candles.low), column(candles.close), column(candles.volume)
+
+        def cached(key, compute):
+            if key not in cache:
+                cache[key] = compute()
+            return cache[key]
+
+        atr = cached(('atr', self.period), lambda: kernels.atr(high, low, self.period))
+        adx = cached(('adx', self.period), lambda: kernels.adx(high, low, atr, 14))
+        volume_mean = cached(('volume_mean', self.window), lambda: self.volume_mean(volume))
+        direction, trend, vwc = cached(
+            ('supertrend', self.period, self.factor),
+            lambda: self.supertrend(high, low, close, volume, volume_mean, atr)
+        )
+        # vwap is anchored to the day of the candle close
+        vwap = cached(('vwap',), lambda: kernels.vwap(
+            high, low, close, volume, (column(candles.close_time) // 86400000).astype(np.int64)
+        ))
+        return {
+            'atr': atr,
+            'adx': adx,
+            'supertrend_is_uptrend': direction == 1,
+            'supertrend_trend': trend,
+            'supertrend_vwc': vwc,
+            'vwap': vwap,
+        }
+
+    # the mean volume of the chart window ending on every candle
+    def volume_mean(self, volume):
+        total = np.cumsum(volume)
+        volume_sum = total.copy()
+        volume_sum[self.window:] -= total[:-self.window]
+        return volume_sum / np.minimum(np.arange(1, volume.size + 1), self.window)
+
+    def supertrend(self, high, low, close, volume, volume_mean, atr):
+        typical_price = (high + low + close) / 3
+        hl_avg = typical_price * volume / volume_mean
+        vwc = close * volume / volume_mean
+        matr = self.factor * atr
+        direction, trend, _, _ = kernels.supertrend(vwc, hl_avg + matr, hl_avg - matr)
+        return direction, trend, vwc
+
+    def run(self, candles, indicators=None):
+        indicators = self.indicators(candles) if indicators is None else indicators
+        close = column(candles.close)
+        trades = np.empty((close.size, len(trade_columns)), dtype=np.float64)
+        equity = np.empty(close.size, dtype=np.float64)
+        arrays = (
+            column(candles.open), column(candles.high), column(candles.low), close,
+            indicators['atr'], indicators['adx'], indicators['supertrend_is_uptrend']
+        )
+        settings = (
+            float(self.adx_threshold), float(self.sl_tp_multiplier), float(self.trigger_multiplier),
+            bool(self.use_trailing_sl_tp), bool(self.intrabar), float(self.balance), float(self.margin_pct),
+            float(self.leverage), float(self.fee_rate), float(self.slippage_rate)
+        )
+        if simulate_compiled is not None:
+            count = simulate_compiled(*arrays, *settings, trades, equity)
+        else:
+            # plain python floats are far cheaper to index than numpy scalars
+            count = simulate(*[array.tolist() for array in arrays], *settings, trades, equity)
+        return self.result(candles, trades[:count], equity)
+
+    def result(self, candles, rows, equity):
+        times = pd.DatetimeIndex(column(candles.close_time).astype(np.int64).astype('datetime64[ms]'))
+        entry_index = rows[:, 0].astype(np.int64)
+        exit_index = rows[:, 1].astype(np.int64)
+        trades = pd.DataFrame({
+            'entry_time': times[entry_index],
+            'exit_time': times[exit_index],
+            'side': np.where(rows[:, 2] > 0, 'buy', 'sell'),
+            'entry_price': rows[:, 3],
+            'exit_price': rows[:, 4],
+            'volume': rows[:, 5],
+            'fee': rows[:, 6],
+            'profit': rows[:, 7],
+            'exit': np.where(rows[:, 8] == exit_tp, Position.TP, Position.SL),
+        })
+        return BacktestResult(candles.symbol, trades, pd.Series(equity, index=times, name='equity'), self.balance)
+
+
+@click.command()
+@click.argument('symbols', nargs=-1, required=True)
+@click.option('--timeframe', default=None, help='Candle timeframe, Config.timeframe by default.')
+@click.option('--source', type=click.Choice(['store', 'chart-log', 'csv']), default='store', help='Where the candles are read from.')
+@click.option('--path', default=None, help='The kline store directory, chart log database, or directory of <SYMBOL>.csv files.')
+@click.option('--out', default=Constants.backtests_dir_name, help='Directory the trades and equity curves are written to.')
+@click.option('--balance', default=1000.0)
+@click.option('--margin-pct', default=10.0)
+@click.option('--leverage', default=10.0)
+def main(symbols, timeframe, source, path, out, balance, margin_pct, leverage):
+    timeframe = Config.timeframe if timeframe is None else timeframe
+    backtester = Backtester(balance=balance, margin_pct=margin_pct, leverage=leverage)
+    os.makedirs(out, exist_ok=True)
+    summaries = []
+    for symbol in symbols:
+        symbol = symbol.upper()
+        if source == 'store':
+            candles = load_store(symbol, timeframe, path)
+        elif source == 'chart-log':
+            candles = load_chart_log(symbol, timeframe, path)
+        else:
+            candles = load_csv(symbol, timeframe, os.path.join('.' if path is None else path, f'{symbol}.csv'))
+        if len(candles.close) == 0:
+            logger.warning(f'BacktestError: no {timeframe} candles of {symbol}')
+            continue
+        started = time.perf_counter()
+        result = backtester.run(candles)
+        elapsed = time.perf_counter() - started
+        result.trades.to_csv(os.path.join(out, f'{symbol}-{timeframe}-trades.csv'), index=False)
+        result.equity.to_csv(os.path.join(out, f'{symbol}-{timeframe}-equity.csv'))
+        summary = result.summary()
+        summary['seconds'] = elapsed
+        summaries.append(summary)
+        logger.info(f'Backtest {symbol}: {summary}')
+    if len(summaries) > 0:
+        pd.DataFrame(summaries).to_csv(os.path.join(out, f'summary-{timeframe}.csv'), index=False)
+
+
+if __name__ == '__main__':
+    main()
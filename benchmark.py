@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+import click
+import numpy as np
+from loguru import logger
+from binance.helpers import interval_to_milliseconds
+from bot import TradeBot
+from utils.config import Config
+from utils.constants import Constants
+from utils.fake_exchange import FakeExchange
+from utils.fake_telegram import FakeContext, FakeUpdater, fake_update
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+    values = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # the peak instead, where there's no /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# a random walk of "count" klines rows ending at no particular time, the fake exchange re-stamps them
+def synthetic_klines(random, count, timeframe, price=100.0, volatility=0.002):
+    timeframe_ms = interval_to_milliseconds(timeframe)
+    close = price * np.exp(np.cumsum(random.normal(0, volatility, count)))
+    open_ = np.concatenate(([price], close[:-1]))
+    spread = np.abs(random.normal(0, volatility, count)) * close
+    open_time = np.arange(count, dtype=np.float64) * timeframe_ms
+    return np.column_stack([
+        open_time, open_, np.maximum(open_, close) + spread, np.minimum(open_, close) - spread, close,
+        random.uniform(10, 1000, count), open_time + timeframe_ms - 1
+    ])
+
+
+class LoadBenchmark:
+    '''
+    Finds how many trades one TradeBot process sustains: the bot runs against a
+    FakeExchange replaying synthetic candles and a FakeUpdater instead of Telegram, and
+    the load is ramped up by levels of users, each trading every one of the symbols.
+
+    At each level, once the new trades have warmed up, it measures for "duration" seconds
+    the durations and lags of the trader runs, the runs longer than fetch_interval_seconds
+    and the overruns, the /status reply times of a user asking every status_interval
+    seconds, the CPU used, the RSS, the threads and the REST calls per minute.
+
+    The candles are replayed in real time: the bot's scheduler follows the wall clock,
+    so on a faster exchange clock the traders would skip candles and the numbers of
+    the levels wouldn't compare.
+    '''
+
+    def __init__(
+        self, symbols=10, levels=(1, 5, 10), duration=180, warm_up=30, latency=0,
+        telegram_latency=0, status_interval=10, margin_pct=1, leverage=5, seed=None
+    ):
+        self.symbols = [f'SYN{index}USDT' for index in range(symbols)]
+        self.levels = levels
+        self.duration = duration
+        self.warm_up = warm_up
+        self.latency = latency
+        self.telegram_latency = telegram_latency
+        self.status_interval = status_interval
+        self.margin_pct = margin_pct
+        self.leverage = leverage
+        self.seed = seed
+        self.bot = None
+        self.exchange = None
+        self.users = []
+        self.status_durations = []
+        self.polling = False
+
+    def setup(self):
+        random = np.random.default_rng(self.seed)
+        self.exchange = FakeExchange(
+            balance=Config.simulated_exchange_balance, latency=self.latency,
+            fee_rate=Config.backtest_fee_rate, slippage_rate=Config.backtest_slippage_rate,
+            weight_limit=Config.request_weight_limit, order_limit=Config.order_count_limit, seed=self.seed
+        )
+        for symbol in self.symbols:
+            # enough candles for the charts and the benchmark not to get to their end
+            count = Config.max_positions_per_chart + int(len(self.levels) * (self.duration + self.warm_up) / Config.timeframe_in_seconds) + 10
+            klines = synthetic_klines(random, count, Config.timeframe, price=random.uniform(1, 1000))
+            self.exchange.replay(symbol, Config.timeframe, klines, start=Config.max_positions_per_chart)
+        self.exchange.start()
+        self.bot = TradeBot(config=Config, updater=FakeUpdater(self.telegram_latency), exchange=self.exchange)
+        self.context = FakeContext(self.bot.updater.bot)
+
+    # users up to "count", each with a trade of every symbol
+    def add_users(self, count):
+        while len(self.users) < count:
+            chat_id = 100000 + len(self.users)
+            api_key, api_secret = f'key{chat_id}', f'secret{chat_id}'
+            update = fake_update(chat_id, f'/{Constants.Commands.addtrade}')
+            self.bot.adduser(str(chat_id), api_key, api_secret, update, self.context)
+            self.bot.setupuser(update)
+            for symbol in self.symbols:
+                self.bot.addtrade(api_key, api_secret, symbol, self.margin_pct, self.leverage, update, self.context)
+            self.users.append(chat_id)
+
+    # the users ask for their /status in turn, every status_interval seconds
+    def poll_status(self):
+        turn = 0
+        while self.polling:
+            started = time.time()
+            if len(self.users) > 0:
+                chat_id = self.users[turn % len(self.users)]
+                turn = turn + 1
+                try:
+                    self.bot.command_status(fake_update(chat_id, f'/{Constants.Commands.status}'), self.context)
+                    self.status_durations.append(time.time() - started)
+                except Exception as e:
+                    logger.warning(f'BenchmarkError: {e}')
+            time.sleep(max(0, self.status_interval - (time.time() - started)))
+
+    def measure(self):
+        scheduler = self.bot.runtime.scheduler
+        scheduler.reset()
+        self.status_durations = []
+        calls = sum(self.exchange.stats()['calls'].values())
+        telegram = sum(self.bot.updater.bot.stats()['sent'].values())
+        cpu, started = cpu_seconds(), time.time()
+        time.sleep(self.duration)
+        elapsed = time.time() - started
+        with scheduler.lock:
+            durations, lags = list(scheduler.durations), list(scheduler.lags)
+            runs, overruns = scheduler.runs, scheduler.overruns
+        exchange = self.exchange.stats()
+        alive = sum(
+            1 for trades in self.bot.trades.values() for trader in trades[Constants.TradeType.futures].values() if trader.alive
+        )
+        return {
+            'users': len(self.users),
+            'symbols': len(self.symbols),
+            'trades': len(self.users) * len(self.symbols),
+            'alive': alive,
+            'seconds': elapsed,
+            'runs': runs,
+            'run_ms': percentiles(durations),
+            'lag_ms': percentiles(lags),
+            'runs_over_fetch_interval': sum(1 for duration in durations if duration > Config.fetch_interval_seconds),
+            'overruns': overruns,
+            'status_ms': percentiles(self.status_durations),
+            'cpu_pct': (cpu_seconds() - cpu) / elapsed * 100,
+            'rss_mb': rss_mb(),
+            'threads': threading.active_count(),
+            'rest_calls_per_minute': (sum(exchange['calls'].values()) - calls) / elapsed * 60,
+            'telegram_sends_per_minute': (sum(self.bot.updater.bot.stats()['sent'].values()) - telegram) / elapsed * 60,
+            'used_weight': exchange['used_weight'],
+            'rate_limiter_waits': self.bot.runtime.rate_limiter.waits,
+            'client_pool': self.bot.runtime.client_pool.stats(),
+        }
+
+    def run(self):
+        results = []
+        self.setup()
+        self.polling = True
+        threading.Thread(target=self.poll_status, name='benchmark-status', daemon=True).start()
+        try:
+            for users in self.levels:
+                self.add_users(users)
+                logger.info(f'Benchmark: {len(self.users)} users x {len(self.symbols)} symbols, warming up for {self.warm_up}s')
+                time.sleep(self.warm_up)
+                level = self.measure()
+                results.append(level)
+                logger.info(
+                    f'Benchmark: {level["trades"]} trades, runs p50 {level["run_ms"]["p50"]} p99 {level["run_ms"]["p99"]} ms, '
+                    f'cpu {level["cpu_pct"]:.0f}%, rss {level["rss_mb"]:.0f}MB, {level["rest_calls_per_minute"]:.0f} calls/min'
+                )
+        finally:
+            self.polling = False
+            self.stop()
+        return results
+
+    def stop(self):
+        for trades in self.bot.trades.values():
+            for trader in trades[Constants.TradeType.futures].values():
+                if trader.alive:
+                    try:
+                        trader.stop()
+                    except Exception as e:
+                        logger.warning(f'BenchmarkError: {e}')
+        self.exchange.stop()
+
+    def settings(self):
+        return {
+            'symbols': len(self.symbols),
+            'levels': list(self.levels),
+            'duration': self.duration,
+            'warm_up': self.warm_up,
+            'latency': self.latency,
+            'telegram_latency': self.telegram_latency,
+            'status_interval': self.status_interval,
+            'timeframe': Config.timeframe,
+            'fetch_interval_seconds': Config.fetch_interval_seconds,
+            'market_data_mode': Config.market_data_mode,
+            'order_tracking_mode': Config.order_tracking_mode,
+            'engine_mode': Config.engine_mode,
+            'cpus': os.cpu_count(),
+        }
+
+
+@click.command()
+@click.option('--users', default='1,5,10', help='Comma separated numbers of users, the load levels.')
+@click.option('--symbols', type=int, default=10, help='Symbols each user trades.')
+@click.option('--duration', type=float, default=180, help='Seconds each level is measured for.')
+@click.option('--warm-up', type=float, default=30, help='Seconds the new trades of a level run before it is measured.')
+@click.option('--latency', type=float, default=0, help='Seconds each exchange call takes.')
+@click.option('--telegram-latency', type=float, default=0, help='Seconds each Telegram call takes.')
+@click.option('--status-interval', type=float, default=10, help='Seconds between the /status requests of the users.')
+@click.option('--seed', type=int, default=None)
+@click.option('--out', default=None, help='The JSON file the results are written to.')
+def main(users, symbols, duration, warm_up, latency, telegram_latency, status_interval, seed, out):
+    benchmark = LoadBenchmark(
+        symbols=symbols, levels=[int(level) for level in users.split(',')], duration=duration, warm_up=warm_up,
+        latency=latency, telegram_latency=telegram_latency, status_interval=status_interval, seed=seed
+    )
+    started = time.time()
+    levels = benchmark.run()
+    report = {'commit': commit(), 'started': started, 'settings': benchmark.settings(), 'levels': levels}
+    if out is None:
+        os.makedirs(Constants.benchmarks_dir_name, exist_ok=True)
+        out = os.path.join(Constants.benchmarks_dir_name, f'benchmark-{time.strftime("%Y%m%d-%H%M%S")}-{report["commit"]}.json')
+    with open(out, 'w') as file:
+        json.dump(report, file, indent=2)
+    logger.info(f'Benchmark results written to {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,20 @@
 import os
-import datetime as DT
 from loguru import logger
 import pandas as pd
 import sqlalchemy
-from binance.client import Client
 from binance import BinanceSocketManager
 from symbol_info import SymbolInfo
-from utils.asiko import time_diff_now
+from trading_runtime import TradingRuntime
+from trade_shards import TradeShards
 from utils.config import Config
 
-from utils.core import update_to_chat_id
+from utils.core import is_admin, update_to_chat_id
 from utils.constants import Constants
 from utils.generic import chat_message, check_chat_id, get_trade_path, get_trades_keyboard_layout, only_admin
 from utils.msg import MSG
 
 import time
+import datetime
 from typing import Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, Update
 from telegram.ext import CallbackContext, CallbackQueryHandler, CommandHandler, ConversationHandler, Defaults, Updater
@@ -24,13 +24,18 @@ from conversations.updatetrade import UpdateTradeConversation
 from conversations.adduser import AddUserConversation
 
 from trader import Trader
+from trade_journal import journal_user
+from trade_state import account_of, fetch_account
 
 # user database
 db = sqlalchemy.create_engine('sqlite:///accounts.db')
 
 class TradeBot:
-    def __init__(self, config: Config):
+    # an "updater" and an "exchange" replace the Telegram updater and the exchange, as the
+    # benchmark does with fakes
+    def __init__(self, config: Config, updater=None, exchange=None):
         self.config = config
+        self.exchange = exchange
         self.is_test = config.is_test
         self.use_trailing_sl_tp = True
 
@@ -47,15 +52,9 @@ class TradeBot:
         self.trades = {}
         self.users = {}
 
-        self.spot_market = {}
-        self.last_spot_market_update_time = 0
-
-        self.futures_market = {}
-        self.last_futures_market_update_time = 0
-
         defaults = Defaults(parse_mode=ParseMode.HTML, disable_web_page_preview=True, timeout=120)
         # persistence = PicklePersistence(filename='botpersistence')
-        self.updater = Updater(token=config.secrets.telegram_token, persistence=None, defaults=defaults)
+        self.updater = Updater(token=config.secrets.telegram_token, persistence=None, defaults=defaults) if updater is None else updater
         self.dispatcher = self.updater.dispatcher
         self.convos = {
             'addtrade': AddTradeConversation(parent=self, config=self.config),
@@ -72,7 +71,14 @@ class TradeBot:
         }
 
     def init(self):
-        self.client = Client(Config.Binance.key, Config.Binance.secret)
+        # what the traders of the bot's process share to reach the exchange, the bot's own
+        # exchange calls included
+        self.runtime = TradingRuntime(exchange=self.exchange)
+        # the processes running the trades in the "sharded" execution mode
+        self.shards = None
+        if Config.execution_mode == Constants.ExecutionMode.sharded:
+            self.shards = TradeShards(runtime=self.runtime)
+            self.shards.start()
         if not os.path.isdir(Constants.chart_photos_dir_name):
             os.mkdir(Constants.chart_photos_dir_name)
         if not os.path.isdir(Constants.log_dir_name):
@@ -99,14 +105,10 @@ class TradeBot:
     def get_user_trades_by_type(self, type: str, update: Update):
         user_key = self.get_user_key(update)
         user_trades = None
-        logger.info("UserTrades101")
-        logger.info(self.trades)
         if user_key not in self.trades:
             user_trades = {}
         else:
             user_trades = self.trades[user_key][self.get_trade_key(type)]
-        logger.info("UserTrades")
-        logger.info(user_trades)
         return user_trades
 
     def trade_exists(self, symbol: str, trade_type: str, update: Update):
@@ -115,76 +117,21 @@ class TradeBot:
     def get_trade(self, symbol: str, trade_type: str, update: Update):
         return self.get_user_trades_by_type(trade_type, update)[symbol.upper()]
 
-    '''
-    {
-        "symbol": "BTCUSDT",
-        "pair": "BTCUSDT",
-        "contractType": "PERPETUAL",
-        "deliveryDate": 4133404800000,
-        "onboardDate": 1569398400000,
-        "status": "TRADING",
-        "maintMarginPercent": "2.5000",
-        "requiredMarginPercent": "5.0000",
-        "baseAsset": "BTC", # Note
-        "quoteAsset": "USDT", # Note
-        "marginAsset": "USDT", # Note
-        "pricePrecision": 2, # Note
-        "quantityPrecision": 3, # Note
-        "baseAssetPrecision": 8, # Note
-        "quotePrecision": 8, # Note
-        ...
-    }
-    '''
-    def update_futures_market(self):
-        t_diff = time_diff_now(self.last_futures_market_update_time)
-        if len(self.futures_market) == 0 or t_diff is None or t_diff.seconds > Config.market_info_update_interval_seconds:
-            market = self.client.futures_exchange_info()
-            for symbol in market['symbols']:
-                if symbol['contractType'] == 'PERPETUAL':
-                    self.futures_market[symbol['symbol']] = symbol
-            self.last_futures_market_update_time = DT.datetime.now()
-
-    '''
-    {
-        'symbol': 'ETHBTC',
-        'status': 'TRADING',
-        'baseAsset': 'ETH',
-        'baseAssetPrecision': 8,
-        'quoteAsset': 'BTC',
-        'quotePrecision': 8,
-        'quoteAssetPrecision': 8
-        ...
-    }
-    '''
-    def update_spot_market(self):
-        t_diff = time_diff_now(self.last_spot_market_update_time)
-        if len(self.spot_market) == 0 or t_diff is None or t_diff.seconds > Config.market_info_update_interval_seconds:
-            market = self.client.get_exchange_info()
-            for symbol in market['symbols']:
-                self.spot_market[symbol['symbol']] = symbol
-            self.last_spot_market_update_time = DT.datetime.now()
-
     # checks the symbol on the list of binance futures pairs, and return true if the symbol exists
     def futures_has_symbol(self, symbol):
-        self.update_futures_market()
-
-        has_it = symbol.upper() in self.futures_market
-        if has_it is False:
+        symbol_info = self.runtime.symbols.futures(symbol)
+        if symbol_info is None:
             return False
         else:
-            symbol_info = SymbolInfo.from_dict(self.futures_market[symbol.upper()])
             return self.symbol_info_allowed(symbol_info)
 
 
     # checks the symbol on the list of binance spot pairs, and return true if the symbol exists
     def spot_has_symbol(self, symbol):
-        self.update_spot_market()
-
-        has_it = symbol.upper() in self.spot_market
-        if has_it is False:
+        symbol_info = self.runtime.symbols.spot(symbol)
+        if symbol_info is None:
             return False
         else:
-            symbol_info = SymbolInfo.from_dict(self.spot_market[symbol.upper()])
             return self.symbol_info_allowed(symbol_info)
 
     def symbol_info_allowed(self, symbol_info: SymbolInfo):
@@ -217,6 +164,7 @@ class TradeBot:
         #self.dispatcher.add_handler(CommandHandler('about', self.command_about))
         #self.dispatcher.add_handler(CommandHandler('dev', self.command_dev))
         self.dispatcher.add_handler(CommandHandler('logs', self.command_logs))
+        self.dispatcher.add_handler(CommandHandler(Constants.Commands.journal, self.command_journal))
 
         self.dispatcher.add_handler(
             CallbackQueryHandler(
@@ -246,7 +194,8 @@ class TradeBot:
             ('removeuser', 'Remove a user'),
             #('about', 'About the bot and its workings'),
             #('dev', 'About the developer and contact'),
-            ('logs', 'Get bot log files')
+            ('logs', 'Get bot log files'),
+            (Constants.Commands.journal, 'Sum up the journaled trades: [user ID|all] [symbol|all] [days]')
         ]
         self.dispatcher.bot.set_my_commands(commands=commands)
         self.dispatcher.add_error_handler(self.error_handler)
@@ -257,6 +206,7 @@ class TradeBot:
         except Exception:  # chat doesn't exist yet, do nothing
             logger.info('Chat with user doesn\'t exist yet.')
         logger.info('Bot started')
+        self.recover()
         self.updater.start_polling()
         self.updater.idle()
 
@@ -359,7 +309,7 @@ class TradeBot:
                         text=status,
                         reply_markup=reply_markup,
                         edit=False,
-                        photo_up=trader.chart_photo_path
+                        photo_up=trader.get_chart_photo()
                     )
                     time.sleep(0.2)
             if len(futures_trades) > 0:
@@ -378,9 +328,19 @@ class TradeBot:
                         text=status,
                         reply_markup=reply_markup,
                         edit=False,
-                        photo_up=trader.chart_photo_path
+                        photo_up=trader.get_chart_photo()
                     )
                     time.sleep(0.2)
+        if is_admin(chat_id):
+            # how well the traders share their connections to the exchange
+            pool = self.runtime.client_pool.stats()
+            chat_message(
+                update,
+                context,
+                text=f'🔌 {pool["requests"]} exchange requests over {pool["connections"]} connections '
+                     f'({pool["reused"]} reused) by {pool["built"]} of {pool["clients"]} clients',
+                edit=False,
+            )
 
     @check_chat_id
     def command_restart_trade(self, update: Update, context: CallbackContext):
@@ -422,18 +382,61 @@ class TradeBot:
 
     @only_admin
     def command_logs(self, update: Update, context: CallbackContext):
+        files = [
+            f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
+            f'{Constants.log_dir_name}/{Constants.warning_log_filename}', 
+            f'{Constants.log_dir_name}/{Constants.error_log_filename}', 
+            f'{Constants.log_dir_name}/{Constants.pos_log_filename}', 
+        ]
+        docs = list(files)
+        if self.shards is not None:
+            # and those of the trade shards, that have their own
+            for index in range(self.shards.count):
+                for path in files:
+                    root, extension = os.path.splitext(path)
+                    if os.path.isfile(f'{root}.shard-{index}{extension}'):
+                        docs.append(f'{root}.shard-{index}{extension}')
         chat_message(
             update=update,
             context=context,
             text=MSG.log_files,
             edit=False,
-            docs=[
-                f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
-                f'{Constants.log_dir_name}/{Constants.warning_log_filename}', 
-                f'{Constants.log_dir_name}/{Constants.error_log_filename}', 
-                f'{Constants.log_dir_name}/{Constants.pos_log_filename}', 
-                f'{Constants.log_dir_name}/{Constants.chart_log_db_filename}',
-            ]
+            docs=docs + [f'{Constants.log_dir_name}/{Constants.chart_log_db_filename}']
+        )
+
+    # /journal [user ID|all] [symbol|all] [days], the closed trades of the last "days" (30) days
+    @only_admin
+    def command_journal(self, update: Update, context: CallbackContext):
+        args = list(context.args or [])
+        try:
+            user_id = args[0] if len(args) > 0 and args[0].lower() != 'all' else None
+            symbol = args[1].upper() if len(args) > 1 and args[1].lower() != 'all' else None
+            days = float(args[2]) if len(args) > 2 else 30
+        except ValueError:
+            chat_message(update, context, text=MSG.input_error, edit=False)
+            return
+        journal = self.runtime.journal
+        users = {
+            journal_user(user['key']): user['id']
+            for user in [self.getuser(Config.secrets.admin_chat_id)] + list(self.users.values())
+        }
+        journal_user_id = None
+        if user_id is not None:
+            user = self.getuser(user_id)
+            if user is None:
+                chat_message(update, context, text='⛔️ User does not exist.', edit=False)
+                return
+            journal_user_id = journal_user(user['key'])
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+        lines = []
+        for (user, symbol_), records in journal.query(user=journal_user_id, symbol=symbol, since=since).items():
+            summary = journal.summary(records)
+            lines.append(
+                f'<b>{users.get(user, user)} {symbol_}</b>: {summary["closed"]} closed, {summary["wins"]} won, '
+                f'{summary["longs"]} longs, {summary["shorts"]} shorts, profit {summary["profit"]:.4f}'
+            )
+        chat_message(
+            update, context, text='\n'.join(lines) if len(lines) > 0 else f'No trade journaled in the last {days:g} days.', edit=False
         )
 
     @check_chat_id
@@ -503,28 +506,79 @@ class TradeBot:
         )
 
     def get_symbol_info(self, symbol: str, is_futures: bool):
-        symbol_dict = (self.futures_market if is_futures else self.spot_market)[symbol.upper()]
-        return SymbolInfo.from_dict(symbol_dict)
+        return self.runtime.get_symbol_info(symbol, is_futures)
 
     def addtrade(self, api_key: str, api_secret: str, symbol: str, margin_pct: float, leverage: int, update: Update, context: CallbackContext):
         try:
-            trader = Trader(
-                self,
+            args = (
                 api_key, api_secret,
                 symbol,
                 self.use_trailing_sl_tp, 
                 self.weak_trend, self.strong_trend, self.very_strong_trend, self.extremely_strong_trend,
                 margin_pct, leverage
             )
+            user_key = self.get_user_key(update)
+            store = self.runtime.state_store
+            if store is not None:
+                store.save_trade(self.get_state_key(user_key, symbol), user_key, symbol, args)
+            trader = self.new_trader(user_key, args)
             if trader is not None:
-                self.trades[self.get_user_key(update)][Constants.TradeType.futures][symbol.upper()] = trader
-            logger.info(self.trades)
+                self.trades[user_key][Constants.TradeType.futures][symbol.upper()] = trader
             trader.trade()
             self.send_feedback(update, context, trader.feedback)
         except Exception as e:
             context.error = e
             self.error_handler(update, context)
 
+    # a futures Trader of the user with the arguments "args" after its parent, in the trade
+    # shards in the "sharded" execution mode
+    def new_trader(self, user_key, args):
+        if self.shards is not None:
+            return self.shards.add(user_key, *args)
+        trader = Trader(self.runtime, *args)
+        trader.state_key = self.get_state_key(user_key, trader.symbol)
+        return trader
+
+    # the key of a futures trade in the TradeStateStore, the same as its shards key
+    def get_state_key(self, user_key, symbol):
+        return f'{user_key}|{symbol.upper()}'
+
+    # restores the users and trades saved before the bot's restart, fetching the balances,
+    # positions and open orders of each API key's account once for all its trades, and
+    # resumes the trades that were running
+    def recover(self):
+        store = self.runtime.state_store
+        if store is None:
+            return
+        started = time.time()
+        users, trades = store.load()
+        for user_key, id, api_key, api_secret in users:
+            self.users[user_key] = {'id': id, 'key': api_key, 'secret': api_secret}
+        accounts = {}
+        for trade in trades:
+            accounts.setdefault((trade[3][0], trade[3][1]), []).append(trade)
+        resumed = 0
+        for (api_key, api_secret), account_trades in accounts.items():
+            account = fetch_account(self.runtime.client_pool.client(api_key, api_secret))
+            for key, user_key, symbol, args, state in account_trades:
+                try:
+                    if user_key not in self.trades:
+                        self.trades[user_key] = {Constants.TradeType.spot: {}, Constants.TradeType.futures: {}}
+                    trader = self.new_trader(user_key, args)
+                    self.trades[user_key][Constants.TradeType.futures][symbol] = trader
+                    if state is None:
+                        continue
+                    trader.restore(state, *account_of(account, symbol))
+                    if state['alive']:
+                        trader.trade(resume=True)
+                        resumed = resumed + 1
+                except Exception as e:
+                    logger.error(f'RecoveryError: {key}: {e}')
+        logger.info(
+            f'Recovered {len(users)} users and {len(trades)} trades of {len(accounts)} accounts, '
+            f'{resumed} resumed, in {time.time() - started:.1f}s'
+        )
+
     def updatetrade(self, symbol: str, is_futures: bool, margin_pct: float, leverage: int, use_order_book: bool, update: Update, context: CallbackContext):
         trade_type = Constants.TradeType.futures if is_futures else Constants.TradeType.spot
         trader = self.get_trade(symbol=symbol, trade_type=trade_type, update=update)
@@ -537,8 +591,11 @@ class TradeBot:
         trader = self.get_trade(symbol=symbol, trade_type=trade_type, update=update)
         trader.stop()
         if delete:
+            if self.shards is not None:
+                self.shards.remove(trader)
+            if self.runtime.state_store is not None:
+                self.runtime.state_store.remove_trade(self.get_state_key(self.get_user_key(update), symbol))
             del self.trades[self.get_user_key(update)][trade_type][symbol]
-        logger.info(self.trades)
         self.send_feedback(update, context, trader.feedback)
 
     def error_handler(self, update: Update, context: CallbackContext) -> None:
@@ -552,6 +609,8 @@ class TradeBot:
             'key': key,
             'secret': secret
         }
+        if self.runtime.state_store is not None:
+            self.runtime.state_store.save_user(self.get_user_key_from_id(id), id, key, secret)
         chat_message(update, context, text=f'✅ {id} added.', edit=False)
 
     def getuser(self, id: str):
@@ -570,9 +629,15 @@ class TradeBot:
         if user_key in self.trades:
             for trade in self.trades[user_key][Constants.TradeType.futures].values():
                 trade.stop()
+                if self.shards is not None:
+                    self.shards.remove(trade)
             for trade in self.trades[user_key][Constants.TradeType.spot].values():
                 trade.stop()
+                if self.shards is not None:
+                    self.shards.remove(trade)
             del self.trades[user_key]
+        if self.runtime.state_store is not None:
+            self.runtime.state_store.remove_user(user_key)
         del self.users[id]
         chat_message(update, context, text=f'✅ {id} Removed.', edit=False)
 
@@ -0,0 +1,196 @@
+import os
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from loguru import logger
+from utils.config import Config
+from utils.constants import Constants
+
+
+class Chart:
+    '''
+    What a chart photo shows: the close and vwap lines of the candles and a line from the
+    entry to the exit of each closed trade, green for a profit and red for a loss.
+    '''
+
+    def __init__(self, title, time, close, vwap, trades):
+        self.title = title
+        self.time = time
+        self.close = close
+        self.vwap = vwap
+        # (entry time, entry price, exit time, exit price, profitable)
+        self.trades = trades
+
+
+def plotly_backend(chart, path):
+    import plotly.express as px
+    df = pd.DataFrame({'time': chart.time, 'close': chart.close, 'vwap': chart.vwap})
+    fig = px.line(df, x='time', y=['close', 'vwap'], title=chart.title)
+    for x0, y0, x1, y1, profitable in chart.trades:
+        fig.add_shape(type='line', x0=x0, y0=y0, x1=x1, y1=y1, line=dict(color='green' if profitable else 'red', width=3))
+    fig.write_image(path)
+
+
+# the png of an (height, width, 3) image of bytes
+def png(image):
+    height, width, _ = image.shape
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)], axis=1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(rows.tobytes(), 6))
+        + chunk(b'IEND', b'')
+    )
+
+
+# a polyline through the (xs, ys) points, all its pixels at once
+def draw_line(image, xs, ys, color, width=1):
+    height, image_width, _ = image.shape
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    if len(xs) < 2:
+        return
+    steps = np.maximum(np.abs(np.diff(xs)), np.abs(np.diff(ys))).astype(np.int64) + 1
+    segments = np.repeat(np.arange(len(steps)), steps)
+    fractions = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    x = np.rint(np.append(xs[segments] + (xs[segments + 1] - xs[segments]) * fractions, xs[-1])).astype(np.int64)
+    y = np.rint(np.append(ys[segments] + (ys[segments + 1] - ys[segments]) * fractions, ys[-1])).astype(np.int64)
+    for offset in range(-(width // 2), width - width // 2):
+        image[np.clip(y + offset, 0, height - 1), np.clip(x, 0, image_width - 1)] = color
+
+
+def raster_backend(chart, path, width=1000, height=500, margin=20):
+    '''
+    Draws the chart straight into a PNG with numpy, without plotly, kaleido or any text,
+    at a fraction of their cost: the close in blue, the vwap in orange over a light grid.
+    '''
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    times = pd.to_datetime(pd.Series(chart.time)).astype('int64').to_numpy(dtype=np.float64)
+    prices = np.concatenate([
+        np.asarray(chart.close, dtype=np.float64), np.asarray(chart.vwap, dtype=np.float64),
+        np.asarray([price for trade in chart.trades for price in (trade[1], trade[3])], dtype=np.float64)
+    ])
+    prices = prices[np.isfinite(prices)]
+    if len(times) < 2 or len(prices) == 0:
+        raise ValueError('nothing to draw')
+    low, high = prices.min(), prices.max()
+    span = (high - low) or 1
+    start, end = times[0], times[-1]
+
+    def x(values):
+        return margin + (np.asarray(values, dtype=np.float64) - start) / ((end - start) or 1) * (width - 2 * margin)
+
+    def y(values):
+        return height - margin - (np.asarray(values, dtype=np.float64) - low) / span * (height - 2 * margin)
+
+    for line in range(5):
+        image[int(margin + line * (height - 2 * margin) / 4), margin:width - margin] = (230, 230, 230)
+    for values, color in ((chart.vwap, (255, 127, 14)), (chart.close, (31, 119, 180))):
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        draw_line(image, x(times[finite]), y(values[finite]), color, width=2)
+    for entry_time, entry_price, exit_time, exit_price, profitable in chart.trades:
+        entry_time, exit_time = pd.Timestamp(entry_time).value, pd.Timestamp(exit_time).value
+        draw_line(image, x([entry_time, exit_time]), y([entry_price, exit_price]), (0, 160, 0) if profitable else (214, 39, 40), width=3)
+    with open(path, 'wb') as file:
+        file.write(png(image))
+
+
+backends = {
+    Constants.ChartBackend.plotly: plotly_backend,
+    Constants.ChartBackend.raster: raster_backend,
+}
+
+
+class ChartRenderer:
+    '''
+    Renders the chart photos of the traders when /status asks for them, on a pool of
+    chart_render_workers threads, instead of on every trader run.
+
+    The photos are cached by a key that changes with what they show (the trader, its last
+    candle and its last position change), so asking again before a new candle closes or a
+    position closes sends the same file. Asking for a chart being rendered waits for that
+    render instead of starting another one. The chart_render_cache_size latest photos are
+    kept, the older ones are deleted.
+    '''
+
+    def __init__(self, backend=None, workers=None, cache_size=None, directory=None):
+        self.backend = backends[Config.chart_render_backend if backend is None else backend]
+        self.cache_size = Config.chart_render_cache_size if cache_size is None else cache_size
+        self.directory = Constants.chart_photos_dir_name if directory is None else directory
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.chart_render_workers if workers is None else workers, thread_name_prefix='chart-render'
+        )
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.renders = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{hashlib.sha1(repr(key).encode()).hexdigest()}.png')
+
+    # the photo of the chart "chart" returns, None if it couldn't be rendered
+    def render(self, key, chart, timeout=None):
+        with self.lock:
+            path = self.cache.get(key)
+            if path is not None and os.path.isfile(path):
+                self.cache.move_to_end(key)
+                self.hits = self.hits + 1
+                return path
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.executor.submit(self.draw, key, chart)
+                self.renders = self.renders + 1
+            else:
+                self.coalesced = self.coalesced + 1
+        try:
+            return future.result(timeout=Config.chart_render_timeout_seconds if timeout is None else timeout)
+        except Exception as e:
+            logger.warning(f'ChartPhotoError: {e}')
+            return None
+
+    def draw(self, key, chart):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path(key)
+            self.backend(chart(), path)
+        except Exception:
+            with self.lock:
+                self.pending.pop(key, None)
+                self.errors = self.errors + 1
+            raise
+        with self.lock:
+            self.pending.pop(key, None)
+            self.cache[key] = path
+            self.cache.move_to_end(key)
+            evicted = []
+            while len(self.cache) > self.cache_size:
+                evicted.append(self.cache.popitem(last=False)[1])
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return path
+
+    def stats(self):
+        with self.lock:
+            return {
+                'cached': len(self.cache),
+                'rendering': len(self.pending),
+                'renders': self.renders,
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'errors': self.errors
+            }
@@ -0,0 +1,100 @@
+import threading
+from requests.adapters import HTTPAdapter
+from binance.client import Client
+from utils.config import Config
+
+
+class LazyClient:
+    '''
+    A shared binance Client of a ClientPool, built on its first use.
+    '''
+
+    def __init__(self, pool, api_key, api_secret):
+        self.pool = pool
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.client = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client = self.pool.build(self.api_key, self.api_secret)
+        return self.client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class ClientPool:
+    '''
+    Hands out one binance Client per (api_key, api_secret), shared by every trader using
+    those keys, so they share one keep-alive connection pool to the exchange instead of
+    holding a session each.
+
+    Clients are built on their first call and without the ping the Client constructor
+    makes by default, so adding a trade doesn't wait on the network. With a RateLimiter
+    the clients' calls go through it. A "factory" builds the clients instead of the binance
+    Client, like a FakeExchange's client for the simulated exchange mode.
+    '''
+
+    def __init__(self, limiter=None, pool_size=None, factory=None):
+        self.limiter = limiter
+        self.factory = factory
+        self.pool_size = Config.client_pool_size if pool_size is None else pool_size
+        self.clients = {}
+        self.built = 0
+        self.adapters = []
+        self.lock = threading.Lock()
+
+    def client(self, api_key, api_secret):
+        key = (api_key, api_secret)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = LazyClient(self, api_key, api_secret)
+                if self.limiter is not None:
+                    client = self.limiter.wrap(client, api_key)
+                self.clients[key] = client
+            return client
+
+    def build(self, api_key, api_secret):
+        with self.lock:
+            self.built = self.built + 1
+        if self.factory is not None:
+            client = self.factory(api_key, api_secret)
+            if self.limiter is not None:
+                self.limiter.watch(client.session, api_key)
+            return client
+        client = Client(api_key=api_key, api_secret=api_secret, ping=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        client.session.mount('https://', adapter)
+        if self.limiter is not None:
+            self.limiter.watch(client.session, api_key)
+        with self.lock:
+            self.adapters.append(adapter)
+        return client
+
+    # the requests sent by the clients built so far and the connections they opened to
+    # send them, every request past the connections reused one
+    def stats(self):
+        with self.lock:
+            adapters = list(self.adapters)
+            clients = len(self.clients)
+            built = self.built
+        requests, connections = 0, 0
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests = requests + pool.num_requests
+                    connections = connections + pool.num_connections
+        return {
+            'clients': clients,
+            'built': built,
+            'requests': requests,
+            'connections': connections,
+            'reused': requests - connections
+        }
@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+import numpy as np
+from market_data import Candles
+
+
+class KlineStore:
+    '''
+    On-disk store of the closed candles of every (symbol, timeframe) the bot follows.
+
+    Each kline field is kept in its own file of float64 values under
+    <directory>/<SYMBOL>/<timeframe>/<field>.f64, appended as candles close and read
+    back through memory maps, so a restarted feed warms up from disk and the same
+    files can be replayed by offline backtests. Candles are only ever appended in
+    open time order, the ones missed while the bot was down are fetched by the market
+    data hub before a feed starts again. The exchange's own gaps are kept, "gaps" finds
+    them.
+    '''
+    fields = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.last_open_times = {}
+
+    def path(self, symbol, timeframe, field):
+        return os.path.join(self.directory, symbol.upper(), timeframe, f'{field}.f64')
+
+    def size(self, symbol, timeframe):
+        sizes = []
+        for field in self.fields:
+            path = self.path(symbol, timeframe, field)
+            sizes.append(os.path.getsize(path) // 8 if os.path.isfile(path) else 0)
+        size = min(sizes)
+        if size != max(sizes):
+            # an append was cut short, drop the candles not written to every field
+            for field in self.fields:
+                path = self.path(symbol, timeframe, field)
+                if os.path.isfile(path):
+                    os.truncate(path, size * 8)
+        return size
+
+    # read only memory maps of the stored candles, one per field, from the
+    # "start" (inclusive) to the "end" (exclusive) candle
+    def columns(self, symbol, timeframe, start=0, end=None):
+        with self.lock:
+            size = self.size(symbol, timeframe)
+        start, end, _ = slice(start, end).indices(size)
+        if end <= start:
+            return [np.empty(0, dtype=np.float64) for _ in self.fields]
+        return [
+            np.memmap(self.path(symbol, timeframe, field), dtype=np.float64, mode='r', shape=(size,))[start:end]
+            for field in self.fields
+        ]
+
+    def candles(self, symbol, timeframe, start=0, end=None):
+        return Candles(symbol.upper(), timeframe, time.time(), *self.columns(symbol, timeframe, start, end))
+
+    # the latest "limit" candles as klines rows
+    def rows(self, symbol, timeframe, limit):
+        columns = self.columns(symbol, timeframe, start=-limit)
+        return np.column_stack(columns) if len(columns[0]) > 0 else np.empty((0, len(self.fields)))
+
+    def last_open_time(self, symbol, timeframe):
+        key = (symbol.upper(), timeframe)
+        if key not in self.last_open_times:
+            open_times = self.columns(symbol, timeframe, start=-1)[0]
+            self.last_open_times[key] = int(open_times[-1]) if len(open_times) > 0 else None
+        return self.last_open_times[key]
+
+    # append the klines rows (sorted by open time) that are newer than the stored ones
+    def append(self, symbol, timeframe, rows):
+        key = (symbol.upper(), timeframe)
+        with self.lock:
+            last_open_time = self.last_open_time(symbol, timeframe)
+            if last_open_time is not None:
+                rows = rows[rows[:, 0] > last_open_time]
+            if len(rows) == 0:
+                return 0
+            os.makedirs(os.path.dirname(self.path(symbol, timeframe, self.fields[0])), exist_ok=True)
+            for index, field in enumerate(self.fields):
+                with open(self.path(symbol, timeframe, field), 'ab') as file:
+                    file.write(np.ascontiguousarray(rows[:, index], dtype=np.float64).tobytes())
+            self.last_open_times[key] = int(rows[-1, 0])
+            return len(rows)
+
+    # the open times after which candles are missing, and how many are, as (open time, count)
+    def gaps(self, symbol, timeframe, timeframe_ms):
+        open_time = self.columns(symbol, timeframe)[0]
+        if len(open_time) < 2:
+            return []
+        steps = np.diff(open_time)
+        indices = np.flatnonzero(steps != timeframe_ms)
+        return [(int(open_time[index]), int(steps[index] // timeframe_ms) - 1) for index in indices]
+
+    # the symbols with stored candles of the timeframe
+    def symbols(self, timeframe):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            symbol for symbol in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, symbol, timeframe))
+        )
@@ -0,0 +1,388 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from loguru import logger
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+from utils.config import Config
+from utils.constants import Constants
+from market_stream import MarketStream
+from scheduler import candle_open
+
+
+# A view of the candles of a symbol at a point in time. The same snapshot is handed to
+# every trader following the symbol, so its arrays are read only
+class Candles(NamedTuple):
+    symbol: str
+    timeframe: str
+    fetched_at: float
+    open_time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    close_time: np.ndarray
+
+    # rows are klines as returned by the exchange, only their first 7 fields are kept
+    def from_rows(symbol, timeframe, rows, fetched_at=None):
+        columns = []
+        for index in range(7):
+            column = np.ascontiguousarray(rows[:, index], dtype=float)
+            column.flags.writeable = False
+            columns.append(column)
+        return Candles(symbol, timeframe, time.time() if fetched_at is None else fetched_at, *columns)
+
+    def from_klines(symbol, timeframe, klines, fetched_at=None):
+        return Candles.from_rows(symbol, timeframe, np.array(klines, dtype=float).reshape(-1, 12), fetched_at)
+
+
+class CandleRing:
+    '''
+    Fixed capacity store of the latest candles of a feed, one float64 row per kline field
+    (open time, open, high, low, close, volume and close time).
+
+    Every candle is written twice, at i and i + capacity, so the latest "window" candles
+    are always one contiguous slice of the buffer and are handed out as views without
+    copying. New candles are appended in place, and so is the forming candle until a
+    view showing it is handed out. Once one is, the next update of the forming candle,
+    or a replacement of the candles, first moves the ring to a new buffer holding only
+    the latest window, so the views keep the old one as it was. A view stays intact
+    until capacity - window more candles are appended after it.
+    '''
+
+    def __init__(self, window, capacity=None):
+        self.window = window
+        self.capacity = max(window, 2 * window if capacity is None else capacity)
+        self.data = np.zeros((7, 2 * self.capacity), dtype=np.float64)
+        # the number of candles appended since the last clear
+        self.count = 0
+        # the count when the last view was handed out, its last row is the forming candle
+        self.viewed_count = None
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def clear(self):
+        self.count = 0
+        self.viewed_count = None
+
+    def position(self, index):
+        return index % self.capacity
+
+    def open_time(self, index):
+        return int(self.data[0, self.position(index)])
+
+    def first_open_time(self):
+        return None if self.count == 0 else self.open_time(self.count - len(self))
+
+    def last_open_time(self):
+        return None if self.count == 0 else self.open_time(self.count - 1)
+
+    def write(self, index, row):
+        position = self.position(index)
+        self.data[:, position] = row
+        self.data[:, position + self.capacity] = row
+
+    # replace the stored candles with the "columns" (one per kline field), in a new buffer
+    # when views of the current one were handed out since it was filled
+    def fill(self, columns):
+        size = columns.shape[1]
+        if self.viewed_count is not None:
+            # the rest of the new buffer is written before it's read
+            self.data = np.empty_like(self.data)
+            self.viewed_count = None
+        self.data[:, :size] = columns
+        self.data[:, self.capacity:self.capacity + size] = columns
+        self.count = size
+
+    # store the klines rows (sorted by open time), replacing what is stored when they
+    # don't follow on from the stored candles
+    def merge(self, rows, timeframe_ms):
+        first, last = self.first_open_time(), self.last_open_time()
+        if last is None or rows[0, 0] <= first or rows[0, 0] > last + timeframe_ms:
+            self.fill(rows[-self.window:].T)
+            return
+        for row in rows:
+            last = self.last_open_time()
+            if row[0] > last:
+                self.write(self.count, row)
+                self.count = self.count + 1
+            elif row[0] == last:
+                if self.viewed_count == self.count:
+                    # a view handed out shows the forming candle, the latest window
+                    # (7 x window floats) is copied to a new buffer before it's updated
+                    self.fill(self.columns())
+                # the forming candle, updated in place
+                self.write(self.count - 1, row)
+
+    # the latest candles, one row per kline field, a writable view for the feed's own use
+    def columns(self):
+        size = len(self)
+        start = self.position(self.count - size)
+        return self.data[:, start:start + size]
+
+    # read only views of the latest candles, one per kline field, to hand out
+    def view(self):
+        columns = []
+        for column in self.columns():
+            column.flags.writeable = False
+            columns.append(column)
+        self.viewed_count = self.count
+        return columns
+
+
+class MarketFeed:
+
+    def __init__(self, symbol, timeframe, store=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.timeframe_ms = interval_to_milliseconds(timeframe)
+        self.subscribers = set()
+        self.ring = CandleRing(Config.max_positions_per_chart, Config.candle_ring_capacity)
+        # the KlineStore the closed candles are saved to
+        self.store = store
+        # the time of the last merge, None until the feed has candles
+        self.fetched_at = None
+        # the Candles snapshot of the last merge, made when a trader first asks for it
+        self.candles = None
+        self.mark_price = None
+        self.mark_price_time = 0
+        self.condition = threading.Condition()
+        self.fetches = 0
+        self.errors = 0
+
+    def last_open_time(self):
+        with self.condition:
+            return self.ring.last_open_time()
+
+    # merge klines rows into the feed, rows for a candle already in the feed (like
+    # the forming one) overwrite it, then publish the new candles
+    def merge(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(len(rows), -1)[:, :7]
+        if len(rows) == 0:
+            return
+        with self.condition:
+            self.ring.merge(rows, self.timeframe_ms)
+            self.fetched_at = time.time()
+            self.candles = None
+            self.condition.notify_all()
+            if self.store is not None:
+                self.save(self.ring.columns())
+
+    # save the closed candles the store doesn't have yet, every candle but the forming one
+    def save(self, columns):
+        try:
+            last_open_time = self.store.last_open_time(self.symbol, self.timeframe)
+            start = 0 if last_open_time is None else int(np.searchsorted(columns[0], last_open_time, side='right'))
+            if start < len(columns[0]) - 1:
+                self.store.append(self.symbol, self.timeframe, np.column_stack([column[start:-1] for column in columns]))
+        except Exception as e:
+            logger.warning(f'KlineStoreError: {self.symbol} {self.timeframe} {e}')
+
+    # fill the empty feed with the candles saved in the store, without publishing them
+    # since they're behind the market until the missing ones are fetched
+    def warm_up(self):
+        if self.store is None:
+            return
+        try:
+            rows = self.store.rows(self.symbol, self.timeframe, self.ring.window)
+        except Exception as e:
+            logger.warning(f'KlineStoreError: {self.symbol} {self.timeframe} {e}')
+            return
+        if len(rows) > 0:
+            with self.condition:
+                if self.ring.count == 0:
+                    self.ring.merge(rows, self.timeframe_ms)
+
+    def update_mark_price(self, price, at=None):
+        self.mark_price = price
+        self.mark_price_time = time.time() if at is None else at
+
+    # the latest snapshot, waiting up to "timeout" seconds for one newer than "newer_than"
+    def wait(self, newer_than=None, timeout=None):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.fetched_at is not None and (newer_than is None or self.fetched_at > newer_than),
+                timeout=timeout
+            )
+            if self.candles is None and self.fetched_at is not None:
+                # the updates of the forming candle until now were written in place, the
+                # ones after this view is handed out aren't
+                self.candles = Candles(self.symbol, self.timeframe, self.fetched_at, *self.ring.view())
+            return self.candles
+
+
+class MarketDataHub:
+    '''
+    Keeps one candle feed per (symbol, timeframe), fetched with the bot's own client,
+    and publishes each fetch as an immutable Candles snapshot to the traders subscribed
+    to it. Market data REST weight then grows with the number of unique symbols being
+    traded rather than with the number of traders.
+
+    The candles of a feed are kept in a CandleRing, so once a feed is filled only the
+    candles from its forming one onwards are fetched. With a KlineStore the closed
+    candles are also saved to disk and a new feed starts from the saved ones, only
+    fetching the candles since the last saved one. When the bot was down longer than
+    a window, the candles missed are first fetched into the store a window at a time,
+    so it has no gap.
+
+    In the "poll" mode the candles are fetched every fetch_interval_seconds. In the
+    "stream" mode they come from the futures kline and mark price streams and REST is
+    only used to fill the feeds when they are added or the stream reconnects.
+    '''
+
+    def __init__(self, client, interval=None, workers=None, mode=None, stream_url=None, store=None, limiter=None):
+        self.client = client
+        self.store = store
+        # the RateLimiter of the client, the fetch rounds are spaced out as its limit gets near
+        self.limiter = limiter
+        self.mode = Config.market_data_mode if mode is None else mode
+        self.interval = Config.fetch_interval_seconds if interval is None else interval
+        if self.mode == Constants.MarketDataMode.stream:
+            self.interval = Config.stream_rest_refresh_seconds
+        self.feeds = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.alive = False
+        self.thread = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.market_data_workers if workers is None else workers,
+            thread_name_prefix='market-data'
+        )
+        self.stream = None
+        if self.mode == Constants.MarketDataMode.stream:
+            self.stream = MarketStream(self, Config.stream_url if stream_url is None else stream_url)
+
+    def start(self):
+        if self.thread is None:
+            self.alive = True
+            self.thread = threading.Thread(target=self.run, name='market-data-hub', daemon=True)
+            self.thread.start()
+            if self.stream is not None:
+                self.stream.start()
+
+    def stop(self):
+        self.alive = False
+        self.wake.set()
+        if self.stream is not None:
+            self.stream.stop()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def subscribe(self, symbol, timeframe, subscriber):
+        key = (symbol.upper(), timeframe)
+        with self.lock:
+            feed = self.feeds.get(key)
+            if feed is None:
+                feed = self.feeds[key] = MarketFeed(*key, store=self.store)
+            is_new = len(feed.subscribers) == 0
+            feed.subscribers.add(subscriber)
+        if is_new:
+            if self.stream is not None:
+                self.stream.subscribe(feed)
+            # fetch the new feed right away instead of waiting for the next round
+            self.wake.set()
+        return feed
+
+    def unsubscribe(self, symbol, timeframe, subscriber):
+        key = (symbol.upper(), timeframe)
+        with self.lock:
+            feed = self.feeds.get(key)
+            if feed is None:
+                return
+            feed.subscribers.discard(subscriber)
+            if len(feed.subscribers) > 0:
+                return
+            del self.feeds[key]
+        if self.stream is not None:
+            self.stream.unsubscribe(feed)
+
+    def feed(self, symbol, timeframe):
+        with self.lock:
+            return self.feeds.get((symbol.upper(), timeframe))
+
+    def feeds_of(self, symbol):
+        with self.lock:
+            return [feed for feed in self.feeds.values() if feed.symbol == symbol.upper()]
+
+    def all_feeds(self):
+        with self.lock:
+            return list(self.feeds.values())
+
+    def candles(self, symbol, timeframe, newer_than=None, timeout=None):
+        feed = self.feed(symbol, timeframe)
+        return None if feed is None else feed.wait(newer_than=newer_than, timeout=timeout)
+
+    # the streamed mark price of a symbol, None when there's no recent one
+    def mark_price(self, symbol):
+        for feed in self.feeds_of(symbol):
+            if feed.mark_price is not None and time.time() - feed.mark_price_time <= Config.mark_price_max_age_seconds:
+                return feed.mark_price
+        return None
+
+    # fetch the closed candles the store misses since its last one into it, until the
+    # rest fits in the window of the feed's first fetch
+    def fill_gap(self, feed):
+        if self.store is None:
+            return
+        try:
+            last_open_time = self.store.last_open_time(feed.symbol, feed.timeframe)
+            while self.alive and last_open_time is not None:
+                now = time.time() * 1000
+                if now - last_open_time < Config.max_positions_per_chart * feed.timeframe_ms:
+                    return
+                klines = self.client.futures_klines(
+                    symbol=feed.symbol, interval=feed.timeframe,
+                    startTime=last_open_time + feed.timeframe_ms, limit=Config.max_positions_per_chart
+                )
+                feed.fetches = feed.fetches + 1
+                rows = np.asarray(klines, dtype=float).reshape(len(klines), -1)[:, :7]
+                # not the forming candle
+                rows = rows[rows[:, 6] < now]
+                if len(rows) == 0 or self.store.append(feed.symbol, feed.timeframe, rows) == 0:
+                    return
+                last_open_time = self.store.last_open_time(feed.symbol, feed.timeframe)
+        except Exception as e:
+            logger.warning(f'KlineStoreError: {feed.symbol} {feed.timeframe} {e}')
+
+    def fetch(self, feed):
+        try:
+            if feed.fetched_at is None:
+                self.fill_gap(feed)
+                feed.warm_up()
+            params = {'symbol': feed.symbol, 'interval': feed.timeframe, 'limit': Config.max_positions_per_chart}
+            last_open_time = feed.last_open_time()
+            if last_open_time is not None and time.time() * 1000 - last_open_time < Config.max_positions_per_chart * feed.timeframe_ms:
+                # only the candles from the last one the feed has (the forming one) are
+                # fetched, when they all fit in one request
+                params['startTime'] = last_open_time
+            klines = self.client.futures_klines(**params)
+            feed.fetches = feed.fetches + 1
+            if klines is not None and len(klines) > 0:
+                feed.merge(klines)
+        except Exception as e:
+            feed.errors = feed.errors + 1
+            logger.warning(f'MarketDataError: {feed.symbol} {feed.timeframe} {e}')
+
+    def fill(self, feeds=None):
+        list(self.executor.map(self.fetch, self.all_feeds() if feeds is None else feeds))
+
+    def run(self):
+        next_round = 0
+        while self.alive:
+            now = time.time()
+            feeds = self.all_feeds()
+            if now >= next_round:
+                next_round = now + self.interval * (1 if self.limiter is None else self.limiter.slowdown())
+                if self.stream is None:
+                    # a round also runs right after each candle closes, ahead of the traders
+                    next_round = min(next_round, candle_open(now) + Config.timeframe_in_seconds + Config.candle_close_delay_seconds / 2)
+            else:
+                # woken early by a new subscription, only fetch the feeds that have no candles yet
+                feeds = [feed for feed in feeds if feed.fetched_at is None]
+            self.wake.clear()
+            self.fill(feeds)
+            self.wake.wait(max(0, next_round - time.time()))
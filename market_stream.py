@@ -0,0 +1,122 @@
+import json
+import time
+import threading
+from loguru import logger
+from websockets.sync.client import connect
+from utils.config import Config
+
+
+class MarketStream:
+    '''
+    Keeps the feeds of a MarketDataHub up to date from the futures market streams:
+    <symbol>@kline_<timeframe> for the candles and <symbol>@markPrice@1s for the mark
+    price. Streams are added and removed on the open connection as feeds come and go.
+
+    The connection is reopened with a growing delay whenever it drops, and the hub
+    refills every feed through REST once it is back, so candles missed while it was
+    down are not lost.
+    '''
+
+    def __init__(self, hub, url):
+        self.hub = hub
+        self.url = url.rstrip('/')
+        self.streams = set()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.alive = False
+        self.thread = None
+        self.request_id = 0
+        self.connects = 0
+        self.messages = 0
+
+    def start(self):
+        if self.thread is None:
+            self.alive = True
+            self.thread = threading.Thread(target=self.run, name='market-stream', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.alive = False
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stream_names(self, feed):
+        symbol = feed.symbol.lower()
+        return [f'{symbol}@kline_{feed.timeframe}', f'{symbol}@markPrice@1s']
+
+    def send(self, method, streams):
+        connection = self.connection
+        if connection is None or len(streams) == 0:
+            return
+        with self.lock:
+            self.request_id = self.request_id + 1
+            request = {'method': method, 'params': sorted(streams), 'id': self.request_id}
+        try:
+            connection.send(json.dumps(request))
+        except Exception as e:
+            # the reconnect subscribes again to every stream
+            logger.warning(f'MarketStreamError: {method} {e}')
+
+    def subscribe(self, feed):
+        names = self.stream_names(feed)
+        with self.lock:
+            self.streams.update(names)
+        self.send('SUBSCRIBE', names)
+
+    def unsubscribe(self, feed):
+        # the mark price stream is kept while another timeframe of the symbol is followed
+        others = [other for other in self.hub.feeds_of(feed.symbol) if other is not feed]
+        names = [self.stream_names(feed)[0]] if len(others) > 0 else self.stream_names(feed)
+        with self.lock:
+            self.streams.difference_update(names)
+        self.send('UNSUBSCRIBE', names)
+
+    def on_message(self, message):
+        message = json.loads(message)
+        event = message.get('data')
+        if event is None:
+            return
+        self.messages = self.messages + 1
+        if event.get('e') == 'kline':
+            kline = event['k']
+            feed = self.hub.feed(event['s'], kline['i'])
+            if feed is not None and feed.fetched_at is not None:
+                feed.merge([[
+                    kline['t'], kline['o'], kline['h'], kline['l'], kline['c'], kline['v'], kline['T']
+                ]])
+        elif event.get('e') == 'markPriceUpdate':
+            price = float(event['p'])
+            for feed in self.hub.feeds_of(event['s']):
+                feed.update_mark_price(price)
+
+    def run(self):
+        delay = 1
+        while self.alive:
+            try:
+                with connect(f'{self.url}/stream') as connection:
+                    self.connection = connection
+                    self.connects = self.connects + 1
+                    delay = 1
+                    with self.lock:
+                        streams = set(self.streams)
+                    self.send('SUBSCRIBE', streams)
+                    # catch up on the candles missed while the stream was down
+                    if self.connects > 1:
+                        self.hub.fill()
+                    while self.alive:
+                        try:
+                            message = connection.recv(timeout=1)
+                        except TimeoutError:
+                            continue
+                        self.on_message(message)
+            except Exception as e:
+                if self.alive:
+                    logger.warning(f'MarketStreamError: {e}')
+            self.connection = None
+            if self.alive:
+                time.sleep(delay)
+                delay = min(delay * 2, Config.stream_reconnect_max_seconds)
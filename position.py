@@ -1,5 +1,7 @@
 import time
+import asyncio
 import threading
+import pandas as pd
 from loguru import logger
 from sqlalchemy import true
 from utils.constants import Constants
@@ -53,6 +55,19 @@ class Position:
         self.update_tp_sl()
         self.thread = None
 
+    # a position of the "parent" trader from its asdict, as the TradeStateStore keeps it
+    @staticmethod
+    def restore(parent, state):
+        position = Position.__new__(Position)
+        position.parent = parent
+        position.thread = None
+        for name, value in state.items():
+            setattr(position, name, value)
+        for name in ('entry_time', 'exit_time'):
+            if getattr(position, name) is not None:
+                setattr(position, name, pd.Timestamp(getattr(position, name)))
+        return position
+
     def update_tp_sl(self):
         if self.order_type == 'buy':
             self.tp = self.parent.get_precise_price(self.entry_price + self.tp_sl_rate)
@@ -75,55 +90,57 @@ class Position:
     def change_price(self, price, percentage):
         return self.parent.get_precise_price(price + (price * percentage) / 100)
 
-    def try_close(self):
+    # one attempt at sending the take profit and stop loss orders that close the position,
+    # returns whether the position is closed or its closing orders were sent
+    def try_close_once(self):
+        if self.is_closed:
+            return True
         closed = False
-        while closed is False:
-            if self.is_closed:
-                closed = True
+        try:
+            price = self.parent.get_current_price()
+            # If the current price is leading the take profit mark, use the tp/sl trigger rate
+            # with the current price to create another tp that leads the current price
+            if self.order_type == 'buy' and price >= self.tp:
+                self.tp = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
+                self.sl = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
+            elif self.order_type == 'sell' and price <= self.tp:
+                self.tp = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
+                self.sl = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
+            elif self.order_type == 'buy' and price <= self.sl:
+                self.sl = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
+                self.tp = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
+            elif self.order_type == 'sell' and price >= self.sl:
+                self.sl = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
+                self.tp = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
+            self.parent.take_profit(self)
+            self.parent.stop_loss(self)
+            closed = True
+        except Exception as e:
+            filelog(f'{Constants.log_dir_name}/{Constants.pos_log_filename}', '==NotClosed:TP.error==', level='ERROR', error=str(e))
+            # APIError(code=-4129): Time in Force (TIF) GTE can only be used with open positions or open orders. 
+            # Please ensure that open orders or positions are available.
+            if 'apierror(code=-4129)' in str(e).lower():
+                self.is_closed = True
             else:
-                try:
-                    price = self.parent.get_current_price()
-                    # If the current price is leading the take profit mark, use the tp/sl trigger rate
-                    # with the current price to create another tp that leads the current price
-                    if self.order_type == 'buy' and price >= self.tp:
-                        self.tp = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
-                        self.sl = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
-                    elif self.order_type == 'sell' and price <= self.tp:
-                        self.tp = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
-                        self.sl = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
-                    elif self.order_type == 'buy' and price <= self.sl:
-                        self.sl = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
-                        self.tp = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
-                    elif self.order_type == 'sell' and price >= self.sl:
-                        self.sl = self.parent.get_precise_price(price + self.tp_sl_trigger_rate / 1.5)
-                        self.tp = self.parent.get_precise_price(price - self.tp_sl_trigger_rate / 1.5)
-                    self.parent.take_profit(self)
-                    self.parent.stop_loss(self)
-                    closed = True
-                except Exception as e:
-                    log = f"==NotClosed:TP.error==\n{str(e)}"
-                    filelog(
-                        f'{Constants.log_dir_name}/{Constants.pos_log_filename}', log + Constants.log_text_nl
-                    )
-                    # APIError(code=-4129): Time in Force (TIF) GTE can only be used with open positions or open orders. 
-                    # Please ensure that open orders or positions are available.
-                    if 'apierror(code=-4129)' in str(e).lower():
-                        self.is_closed = True
-                    else:
-                        closed = False
-                if not closed:
-                    log = f"==NotClosed==\n{str(self.asdict())}"
-                    filelog(
-                        f'{Constants.log_dir_name}/{Constants.pos_log_filename}', log + Constants.log_text_nl
-                    )
-                    time.sleep(2)
-        self.thread.join()
+                closed = False
+        if not closed:
+            filelog(f'{Constants.log_dir_name}/{Constants.pos_log_filename}', '==NotClosed==', level='WARNING', position=self.asdict)
+        return closed
+
+    def on_closed(self):
         self.thread = None
-        log = f"==!Closed!==\n{str(self.asdict())}"
-        filelog(
-            f'{Constants.log_dir_name}/{Constants.pos_log_filename}', log + Constants.log_text_nl
-        )
-                
+        filelog(f'{Constants.log_dir_name}/{Constants.pos_log_filename}', '==!Closed!==', position=self.asdict)
+
+    def try_close(self):
+        while not self.try_close_once():
+            time.sleep(2)
+        self.on_closed()
+
+    # the close retries of the "asyncio" engine mode, waiting on the engine's event loop
+    async def try_close_async(self, engine):
+        while not await engine.call(self.try_close_once):
+            await asyncio.sleep(2)
+        self.on_closed()
 
     def close_position(self, action=None, trigger_exit_price=None):
         if trigger_exit_price is not None:
@@ -131,8 +148,12 @@ class Position:
             self.trigger_exit_price = trigger_exit_price
 
         if self.thread is None:
-            self.thread = threading.Thread(target = self.try_close)
-            self.thread.start()
+            engine = self.parent.get_engine()
+            if engine is not None:
+                self.thread = engine.submit(self.try_close_async(engine))
+            else:
+                self.thread = threading.Thread(target = self.try_close)
+                self.thread.start()
 
     def asdict(self):
         return {
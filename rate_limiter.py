@@ -0,0 +1,168 @@
+import time
+import threading
+from loguru import logger
+from utils.config import Config
+from utils.constants import Constants
+
+Priority = Constants.RequestPriority
+
+
+class RateLimiter:
+    '''
+    Keeps every Client call of the bot within the futures request limits: the request
+    weight used by the IP and the orders placed by each API key in the current minute.
+
+    The usage is estimated from the weight of each call before it's sent and corrected
+    from the X-MBX-USED-WEIGHT-1M and X-MBX-ORDER-COUNT-1M headers of the responses.
+    Calls are let through by priority: order placement and cancellation may use the
+    whole budget, fill checks a smaller share of it and status and market data calls
+    the smallest (Config.request_weight_shares), and a waiting call holds back the
+    calls of a lower priority. "slowdown" tells the polling loops how much to stretch
+    their intervals as the budget gets used up.
+    '''
+
+    # the calls by priority, any other call is a status or market data one
+    priorities = {
+        'futures_create_order': Priority.order,
+        'futures_cancel_order': Priority.order,
+        'futures_cancel_all_open_orders': Priority.order,
+        'futures_change_leverage': Priority.order,
+        'futures_change_margin_type': Priority.order,
+        'futures_get_open_orders': Priority.fill_check,
+        'futures_get_order': Priority.fill_check,
+        'futures_position_information': Priority.fill_check,
+    }
+    # the request weights of the calls the bot makes, the others weigh 1
+    weights = {
+        'futures_account_balance': 5,
+        'futures_position_information': 5,
+        'futures_exchange_info': 1,
+        'get_exchange_info': 20,
+    }
+    order_calls = ('futures_create_order',)
+
+    def __init__(self, weight_limit=None, order_limit=None):
+        self.weight_limit = Config.request_weight_limit if weight_limit is None else weight_limit
+        self.order_limit = Config.order_count_limit if order_limit is None else order_limit
+        self.condition = threading.Condition()
+        self.minute = int(time.time() // 60)
+        self.used_weight = 0
+        self.used_orders = {}
+        self.paused_until = 0
+        self.waiting = [0 for _ in Config.request_weight_shares]
+        self.calls = 0
+        self.waits = 0
+
+    def weight(self, name, kwargs):
+        if name == 'futures_klines':
+            limit = kwargs.get('limit', 500)
+            return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+        if name == 'futures_get_open_orders' and kwargs.get('symbol') is None:
+            return 40
+        return self.weights.get(name, 1)
+
+    def priority(self, name):
+        return self.priorities.get(name, Priority.status)
+
+    def roll(self, now):
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used_weight = 0
+            self.used_orders = {}
+
+    def fits(self, api_key, priority, weight, is_order):
+        if any(self.waiting[other] > 0 for other in range(priority)):
+            return False
+        if self.used_weight + weight > self.weight_limit * Config.request_weight_shares[priority]:
+            return False
+        return not is_order or self.used_orders.get(api_key, 0) < self.order_limit
+
+    # wait until the call fits in the budget of its priority, then count it
+    def acquire(self, api_key, name, kwargs):
+        priority, weight, is_order = self.priority(name), self.weight(name, kwargs), name in self.order_calls
+        with self.condition:
+            waited = False
+            while True:
+                now = time.time()
+                self.roll(now)
+                if now >= self.paused_until and self.fits(api_key, priority, weight, is_order):
+                    break
+                waited = True
+                self.waiting[priority] = self.waiting[priority] + 1
+                try:
+                    # until the end of the pause or the next minute, or until another call settles
+                    self.condition.wait((self.paused_until if now < self.paused_until else (self.minute + 1) * 60) - now)
+                finally:
+                    self.waiting[priority] = self.waiting[priority] - 1
+            self.used_weight = self.used_weight + weight
+            if is_order:
+                self.used_orders[api_key] = self.used_orders.get(api_key, 0) + 1
+            self.calls = self.calls + 1
+            if waited:
+                self.waits = self.waits + 1
+                # let the lower priority calls check again now this one is no longer waiting
+                self.condition.notify_all()
+
+    def on_response(self, api_key, response):
+        headers = response.headers
+        with self.condition:
+            self.roll(time.time())
+            used_weight = headers.get('X-MBX-USED-WEIGHT-1M')
+            if used_weight is not None:
+                self.used_weight = max(self.used_weight, int(used_weight))
+            used_orders = headers.get('X-MBX-ORDER-COUNT-1M')
+            if used_orders is not None:
+                self.used_orders[api_key] = max(self.used_orders.get(api_key, 0), int(used_orders))
+            if response.status_code in (418, 429):
+                # rate limited (429) or banned (418), nothing is sent until the exchange says so
+                retry_after = int(headers.get('Retry-After', 60))
+                self.paused_until = max(self.paused_until, time.time() + retry_after)
+                logger.warning(f'RateLimitError: {response.status_code}, pausing requests for {retry_after}s')
+            self.condition.notify_all()
+
+    # the share of the weight limit used in the current minute
+    def pressure(self):
+        with self.condition:
+            self.roll(time.time())
+            return self.used_weight / self.weight_limit
+
+    # how many times longer the polling intervals should be, 1 until the used weight
+    # reaches rate_limit_slowdown_at, then growing to rate_limit_max_slowdown at the limit
+    def slowdown(self):
+        pressure = self.pressure()
+        if time.time() < self.paused_until:
+            return Config.rate_limit_max_slowdown
+        if pressure <= Config.rate_limit_slowdown_at:
+            return 1
+        excess = min(1, (pressure - Config.rate_limit_slowdown_at) / (1 - Config.rate_limit_slowdown_at))
+        return 1 + excess * (Config.rate_limit_max_slowdown - 1)
+
+    # correct the usage from the responses of a client's requests session
+    def watch(self, session, api_key):
+        session.hooks['response'].append(lambda response, *args, **kwargs: self.on_response(api_key, response))
+
+    def wrap(self, client, api_key):
+        return LimitedClient(client, self, api_key)
+
+
+class LimitedClient:
+    '''
+    A binance Client whose calls go through a RateLimiter first. Everything else is the
+    wrapped client's. The client's session should be watched by the limiter too.
+    '''
+
+    def __init__(self, client, limiter, api_key):
+        self.client = client
+        self.limiter = limiter
+        self.api_key = api_key
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.limiter.acquire(self.api_key, name, kwargs)
+            return attribute(*args, **kwargs)
+        return call
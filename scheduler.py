@@ -0,0 +1,97 @@
+import time
+import zlib
+import threading
+from collections import deque
+from utils.config import Config
+
+
+# the open time of the candle "now" falls in, which is also the close time of the one before
+def candle_open(now, timeframe_seconds=None):
+    timeframe_seconds = Config.timeframe_in_seconds if timeframe_seconds is None else timeframe_seconds
+    return (now // timeframe_seconds) * timeframe_seconds
+
+
+class TradeScheduler:
+    '''
+    Decides when each trader runs next: shortly after its candle closes, offset by
+    candle_close_delay_seconds so the closed candle has been fetched, plus a jitter
+    derived from the symbol so traders of different symbols don't all call the exchange
+    at the same moment. While a trader has a position open it also runs every
+    position_check_interval_seconds in between, stretched by the rate limiter's slowdown.
+
+    It keeps the lag of the runs (how late they started) and their durations, and counts
+    the overruns (runs still going when the next one was due).
+    '''
+
+    def __init__(self, timeframe_seconds=None, limiter=None):
+        self.timeframe = Config.timeframe_in_seconds if timeframe_seconds is None else timeframe_seconds
+        self.limiter = limiter
+        self.lock = threading.Lock()
+        self.dues = {}
+        self.started = {}
+        self.lags = deque(maxlen=1000)
+        self.durations = deque(maxlen=1000)
+        self.runs = 0
+        self.overruns = 0
+
+    # the same symbol always gets the same jitter, less than half a candle
+    def jitter(self, symbol):
+        spread = min(Config.schedule_jitter_seconds, self.timeframe / 2)
+        return (zlib.crc32(symbol.encode()) % 1000) / 1000 * spread
+
+    def next_due(self, trader, after):
+        offset = Config.candle_close_delay_seconds + self.jitter(trader.symbol)
+        due = candle_open(after - offset, self.timeframe) + self.timeframe + offset
+        if trader.get_open_position() is not None:
+            slowdown = 1 if self.limiter is None else self.limiter.slowdown()
+            due = min(due, after + Config.position_check_interval_seconds * slowdown)
+        return due
+
+    # a trader run starts, returns its start time
+    def begin(self, trader):
+        now = time.time()
+        with self.lock:
+            due = self.dues.get(trader)
+            if due is not None:
+                self.lags.append(max(0, now - due))
+            self.started[trader] = now
+            self.runs = self.runs + 1
+        return now
+
+    # a trader run ended, returns the seconds until its next one
+    def end(self, trader):
+        now = time.time()
+        with self.lock:
+            started = self.started.pop(trader, now)
+            self.durations.append(now - started)
+        if now > self.next_due(trader, started):
+            with self.lock:
+                self.overruns = self.overruns + 1
+        due = self.next_due(trader, now)
+        with self.lock:
+            self.dues[trader] = due
+        return max(0, due - time.time())
+
+    def forget(self, trader):
+        with self.lock:
+            self.dues.pop(trader, None)
+            self.started.pop(trader, None)
+
+    # start the lags, durations and counts over, like for each load level of the benchmark
+    def reset(self):
+        with self.lock:
+            self.lags.clear()
+            self.durations.clear()
+            self.runs = 0
+            self.overruns = 0
+
+    def stats(self):
+        with self.lock:
+            lags = list(self.lags)
+            return {
+                'traders': len(self.dues),
+                'runs': self.runs,
+                'overruns': self.overruns,
+                'lag_avg': sum(lags) / len(lags) if len(lags) > 0 else 0,
+                'lag_max': max(lags) if len(lags) > 0 else 0
+            }
@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import click
+import numpy as np
+import pandas as pd
+from loguru import logger
+from market_data import Candles
+from backtester import Backtester, load_store
+from utils.config import Config
+from utils.constants import Constants
+
+# the parameters swept, as Backtester arguments
+parameters = ('period', 'factor', 'sl_tp_multiplier', 'trigger_multiplier', 'adx_threshold')
+# the columns of the ranking, the backtest summary columns are summed or averaged into
+metrics = (
+    'runs', 'candles', 'trades', 'wins', 'win_rate', 'profit', 'fees', 'final_equity', 'return_pct', 'max_drawdown_pct'
+)
+# the metrics the lower the better
+lower_metrics = ('fees', 'max_drawdown_pct')
+
+# the candles shared with this worker process, by symbol
+shared_candles = {}
+
+
+class SharedCandles:
+    '''
+    The candles of a symbol in a block of shared memory, one row per kline field, so the
+    sweep's worker processes read the same copy instead of each getting it pickled.
+    '''
+
+    def __init__(self, memory, size, symbol, timeframe):
+        self.memory = memory
+        self.size = size
+        self.symbol = symbol
+        self.timeframe = timeframe
+
+    @classmethod
+    def create(cls, candles):
+        size = len(candles.close)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, 7 * size * 8))
+        shared = cls(memory, size, candles.symbol, candles.timeframe)
+        rows = shared.rows()
+        for index, values in enumerate(candles[3:]):
+            rows[index] = values
+        return shared
+
+    @classmethod
+    def attach(cls, name, size, symbol, timeframe):
+        return cls(shared_memory.SharedMemory(name=name), size, symbol, timeframe)
+
+    # what a worker needs to attach to the block
+    def handle(self):
+        return (self.memory.name, self.size, self.symbol, self.timeframe)
+
+    def rows(self):
+        return np.ndarray((7, self.size), dtype=np.float64, buffer=self.memory.buf)
+
+    def candles(self, start=0, end=None):
+        rows = self.rows()[:, start:end]
+        return Candles(self.symbol, self.timeframe, time.time(), *rows)
+
+    def close(self, unlink=False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def attach(handles):
+    for handle in handles:
+        shared = SharedCandles.attach(*handle)
+        shared_candles[shared.symbol] = shared
+
+
+# the backtests of one symbol, date range and period: its atr, adx, volume mean and vwap
+# are computed once and shared by all of them, its supertrend once per factor
+def run_group(symbol, start, end, label, combinations, settings):
+    candles = shared_candles[symbol].candles(start, end)
+    cache = {}
+    results = []
+    for combination in combinations:
+        backtester = Backtester(**combination, **settings)
+        summary = backtester.run(candles, backtester.indicators(candles, cache)).summary()
+        summary.update(combination)
+        summary['range'] = label
+        results.append(summary)
+    return results
+
+
+class ParameterSweep:
+    '''
+    Backtests every combination of the strategy parameters (a grid, or a random sample
+    of it) over symbols and date ranges of the stored candles, on all the CPUs, and ranks
+    the combinations by their results over all of them.
+
+    The candles are put in shared memory once. The backtests are grouped by symbol,
+    range and period so the indicators they have in common are computed once per group,
+    the groups split in chunks of the same factor when there are fewer of them than
+    workers.
+    '''
+
+    def __init__(self, grid, samples=None, seed=None, workers=None, settings=None):
+        self.grid = grid
+        self.samples = samples
+        self.seed = seed
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        # the other Backtester arguments, the same for every backtest
+        self.settings = {} if settings is None else settings
+
+    def combinations(self):
+        names = [name for name in parameters if name in self.grid]
+        combinations = [dict(zip(names, values)) for values in itertools.product(*[self.grid[name] for name in names])]
+        if self.samples is not None and self.samples < len(combinations):
+            combinations = random.Random(self.seed).sample(combinations, self.samples)
+        return combinations
+
+    # the combinations by period, each split in at least "chunks" chunks when it has enough
+    # of them, so there are enough tasks for the workers
+    def groups(self, combinations, chunks=1):
+        groups = {}
+        for combination in combinations:
+            groups.setdefault(combination.get('period'), []).append(combination)
+        result = []
+        for group in groups.values():
+            # the combinations of a factor next to each other, so its supertrend stays cached
+            group = sorted(group, key=lambda combination: combination.get('factor') or 0)
+            size = -(-len(group) // min(len(group), -(-chunks // len(groups))))
+            result.extend(group[index:index + size] for index in range(0, len(group), size))
+        return result
+
+    # ranges are (label, start, end) with start and end as timestamps in milliseconds or None
+    def run(self, symbols, timeframe, ranges=None, directory=None):
+        ranges = [('all', None, None)] if ranges is None else ranges
+        combinations = self.combinations()
+        shared = {}
+        results = []
+        try:
+            for symbol in symbols:
+                candles = load_store(symbol, timeframe, directory)
+                if len(candles.close) == 0:
+                    logger.warning(f'SweepError: no {timeframe} candles of {symbol}')
+                    continue
+                shared[candles.symbol] = SharedCandles.create(candles)
+            handles = [candles.handle() for candles in shared.values()]
+            context = multiprocessing.get_context('spawn')
+            jobs = []
+            for symbol, candles in shared.items():
+                open_time = candles.rows()[0]
+                for label, start, end in ranges:
+                    first = 0 if start is None else int(np.searchsorted(open_time, start))
+                    last = candles.size if end is None else int(np.searchsorted(open_time, end))
+                    if last - first >= 2:
+                        jobs.append((symbol, first, last, label))
+            # at least as many tasks as workers
+            groups = self.groups(combinations, -(-self.workers // max(1, len(jobs))))
+            with ProcessPoolExecutor(self.workers, mp_context=context, initializer=attach, initargs=(handles,)) as executor:
+                futures = [
+                    executor.submit(run_group, symbol, first, last, label, group, self.settings)
+                    for symbol, first, last, label in jobs for group in groups
+                ]
+                for future in as_completed(futures):
+                    results.extend(future.result())
+        finally:
+            for candles in shared.values():
+                candles.close(unlink=True)
+        return pd.DataFrame(results)
+
+    # the combinations from the best, by "metric" (one of the metrics) over the symbols and
+    # ranges, summed for the counts and the profit and averaged for the others
+    def rank(self, results, metric='return_pct'):
+        names = [name for name in parameters if name in results.columns]
+        ranking = results.groupby(names).agg(
+            runs=('symbol', 'size'),
+            candles=('candles', 'sum'),
+            trades=('trades', 'sum'),
+            wins=('wins', 'sum'),
+            win_rate=('win_rate', 'mean'),
+            profit=('profit', 'sum'),
+            fees=('fees', 'sum'),
+            final_equity=('final_equity', 'mean'),
+            return_pct=('return_pct', 'mean'),
+            max_drawdown_pct=('max_drawdown_pct', 'mean'),
+        ).reset_index()
+        return ranking.sort_values(metric, ascending=metric in lower_metrics).reset_index(drop=True)
+
+
+def values(text, cast):
+    return [cast(value) for value in text.split(',')]
+
+
+def timestamp(date):
+    return int(pd.Timestamp(date).timestamp() * 1000) if date != '' else None
+
+
+def date_range(text):
+    start, _, end = text.partition(':')
+    return (text, timestamp(start), timestamp(end))
+
+
+@click.command()
+@click.argument('symbols', nargs=-1, required=True)
+@click.option('--timeframe', default=None, help='Candle timeframe, Config.timeframe by default.')
+@click.option('--path', default=None, help='The kline store directory.')
+@click.option('--range', 'ranges', multiple=True, help='A date range as START:END, either may be left out.')
+@click.option('--period', default=None, help='Comma separated indicator periods.')
+@click.option('--factor', default=None, help='Comma separated supertrend factors.')
+@click.option('--sl-tp', default=None, help='Comma separated take profit/stop loss ATR multipliers.')
+@click.option('--trigger', default=None, help='Comma separated take profit/stop loss trigger ATR multipliers.')
+@click.option('--adx', default=None, help='Comma separated ADX thresholds.')
+@click.option('--samples', type=int, default=None, help='Backtest this many random combinations of the grid.')
+@click.option('--seed', type=int, default=None)
+@click.option('--workers', type=int, default=None, help='Worker processes, one per CPU by default.')
+@click.option('--metric', type=click.Choice(metrics), default='return_pct', help='The column the combinations are ranked by.')
+@click.option('--out', default=Constants.backtests_dir_name, help='Directory the results are written to.')
+def main(symbols, timeframe, path, ranges, period, factor, sl_tp, trigger, adx, samples, seed, workers, metric, out):
+    timeframe = Config.timeframe if timeframe is None else timeframe
+    grid = {
+        'period': values(period, int) if period else [Config.indicator_period],
+        'factor': values(factor, float) if factor else [Config.indicator_factor],
+        'sl_tp_multiplier': values(sl_tp, float) if sl_tp else [Config.sl_tp_atr_multiplier],
+        'trigger_multiplier': values(trigger, float) if trigger else [Config.sl_tp_trigger_atr_multiplier],
+        'adx_threshold': values(adx, float) if adx else [Config.adx_threshold],
+    }
+    sweep = ParameterSweep(grid, samples=samples, seed=seed, workers=workers)
+    started = time.perf_counter()
+    results = sweep.run([symbol.upper() for symbol in symbols], timeframe, [date_range(text) for text in ranges] or None, path)
+    if len(results) == 0:
+        logger.warning('SweepError: nothing was backtested')
+        return
+    ranking = sweep.rank(results, metric)
+    os.makedirs(out, exist_ok=True)
+    results.to_csv(os.path.join(out, f'sweep-{timeframe}-results.csv'), index=False)
+    ranking.to_csv(os.path.join(out, f'sweep-{timeframe}-ranking.csv'), index=False)
+    logger.info(f'Sweep of {len(results)} backtests in {time.perf_counter() - started:.1f}s, best:\n{ranking.head(10)}')
+
+
+if __name__ == '__main__':
+    main()
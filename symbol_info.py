@@ -19,15 +19,27 @@
 }
 '''
 
+# the number of decimals a tickSize or stepSize like "0.00100" has
+def step_decimals(step):
+    step = step.rstrip('0')
+    return len(step.split('.')[1]) if '.' in step else 0
+
+
 class SymbolInfo:
+    # the symbols are shared by every trader, none of them should be changed once made
+    __slots__ = (
+        'name', 'type', 'status', 'is_futures', 'requiredMarginPercent', 'baseAsset', 'quoteAsset', 'marginAsset',
+        'pricePrecision', 'quantityPrecision', 'baseAssetPrecision', 'quotePrecision',
+        'tickSize', 'stepSize', 'price_decimals', 'quantity_decimals'
+    )
 
     def __init__(self,
     name, type, status, is_futures, requiredMarginPercent, baseAsset, quoteAsset, marginAsset, 
-    pricePrecision, quantityPrecision, baseAssetPrecision, quotePrecision
+    pricePrecision, quantityPrecision, baseAssetPrecision, quotePrecision, tickSize=None, stepSize=None
     ):
         self.name = name
         self.type = type
-        self.status = status,
+        self.status = status
         self.is_futures = is_futures
         self.requiredMarginPercent = requiredMarginPercent
         self.baseAsset = baseAsset
@@ -37,11 +49,25 @@ class SymbolInfo:
         self.quantityPrecision = quantityPrecision
         self.baseAssetPrecision = baseAssetPrecision
         self.quotePrecision = quotePrecision
+        # prices and quantities are rounded to the tick and step sizes of the symbol's
+        # PRICE_FILTER and LOT_SIZE filters, or to its precisions when it has none
+        self.price_decimals = step_decimals(tickSize) if tickSize is not None else int(pricePrecision or 0)
+        self.quantity_decimals = step_decimals(stepSize) if stepSize is not None else int(quantityPrecision or 0)
+        self.tickSize = float(tickSize) if tickSize is not None else 10 ** -self.price_decimals
+        self.stepSize = float(stepSize) if stepSize is not None else 10 ** -self.quantity_decimals
+
+    # the nearest price the exchange accepts for the symbol
+    def price(self, value):
+        return round(round(value / self.tickSize) * self.tickSize, self.price_decimals)
+
+    # the nearest order quantity the exchange accepts for the symbol
+    def quantity(self, value):
+        return round(round(value / self.stepSize) * self.stepSize, self.quantity_decimals)
     
     def from_dict(dict):
         name = dict['symbol']
         is_futures = 'contractType' in dict
-        status = dict['status'],
+        status = dict['status']
         requiredMarginPercent = None if 'requiredMarginPercent' not in dict else dict['requiredMarginPercent']
         baseAsset = None if 'baseAsset' not in dict else dict['baseAsset']
         quoteAsset = None if 'quoteAsset' not in dict else dict['quoteAsset']
@@ -50,12 +76,14 @@ class SymbolInfo:
         quantityPrecision = None if 'quantityPrecision' not in dict else dict['quantityPrecision']
         baseAssetPrecision = None if 'baseAssetPrecision' not in dict else dict['baseAssetPrecision']
         quotePrecision = None if 'quotePrecision' not in dict else dict['quotePrecision']
+        filters = {filter['filterType']: filter for filter in dict.get('filters', [])}
+        tickSize = filters['PRICE_FILTER']['tickSize'] if 'PRICE_FILTER' in filters else None
+        stepSize = filters['LOT_SIZE']['stepSize'] if 'LOT_SIZE' in filters else None
 
         return SymbolInfo(
             name=name, type=type, status=status, is_futures=is_futures, requiredMarginPercent=requiredMarginPercent, 
             baseAsset=baseAsset, quoteAsset=quoteAsset, marginAsset=marginAsset, 
             pricePrecision=pricePrecision, quantityPrecision=quantityPrecision, 
-            baseAssetPrecision=baseAssetPrecision, quotePrecision=quotePrecision
+            baseAssetPrecision=baseAssetPrecision, quotePrecision=quotePrecision,
+            tickSize=tickSize, stepSize=stepSize
         )
-        
-
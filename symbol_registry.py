@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import threading
+from types import MappingProxyType
+from loguru import logger
+from symbol_info import SymbolInfo
+from utils.config import Config
+from utils.constants import Constants
+
+
+class SymbolMarkets:
+    '''
+    The futures (perpetual) and spot symbols of the exchange at one point in time, as
+    read only maps of symbol name to SymbolInfo.
+    '''
+
+    def __init__(self, futures, spot, updated_at):
+        self.futures = MappingProxyType({symbol['symbol']: SymbolInfo.from_dict(symbol) for symbol in futures})
+        self.spot = MappingProxyType({symbol['symbol']: SymbolInfo.from_dict(symbol) for symbol in spot})
+        self.updated_at = updated_at
+        # kept to be saved as they came from the exchange
+        self.raw = {'futures': futures, 'spot': spot, 'updated_at': updated_at}
+
+
+class SymbolRegistry:
+    '''
+    The exchange symbols the bot trades, built once into SymbolInfo objects and shared.
+
+    A background thread refreshes them from the exchange info every
+    market_info_update_interval_seconds and swaps the new SymbolMarkets in whole, so
+    readers always see one consistent set without locking. The last set is saved to
+    disk and loaded on startup, so the symbols are there before the first refresh.
+    '''
+
+    def __init__(self, client, path=None):
+        self.client = client
+        self.path = Constants.symbols_filename if path is None else path
+        self.markets = SymbolMarkets([], [], 0)
+        self.lock = threading.Lock()
+        self.alive = False
+        self.thread = None
+        self.refreshes = 0
+
+    def start(self):
+        self.load()
+        if self.thread is None:
+            self.alive = True
+            self.thread = threading.Thread(target=self.run, name='symbol-registry', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.alive = False
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                raw = json.load(file)
+            self.markets = SymbolMarkets(raw['futures'], raw['spot'], raw['updated_at'])
+        except Exception as e:
+            logger.warning(f'SymbolRegistryError: {e}')
+
+    def save(self, markets):
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        # written aside then moved over the old file, so it's never left half written
+        with open(f'{self.path}.tmp', 'w') as file:
+            json.dump(markets.raw, file)
+        os.replace(f'{self.path}.tmp', self.path)
+
+    def refresh(self):
+        with self.lock:
+            futures = [
+                symbol for symbol in self.client.futures_exchange_info()['symbols']
+                if symbol['contractType'] == 'PERPETUAL'
+            ]
+            spot = self.client.get_exchange_info()['symbols']
+            markets = SymbolMarkets(futures, spot, time.time())
+            self.markets = markets
+            self.refreshes = self.refreshes + 1
+        try:
+            self.save(markets)
+        except Exception as e:
+            logger.warning(f'SymbolRegistryError: {e}')
+        return markets
+
+    # the symbols, refreshed right away when there are none yet
+    def current(self):
+        markets = self.markets
+        if len(markets.futures) == 0 and len(markets.spot) == 0:
+            markets = self.refresh()
+        return markets
+
+    def futures(self, symbol):
+        return self.current().futures.get(symbol.upper())
+
+    def spot(self, symbol):
+        return self.current().spot.get(symbol.upper())
+
+    def run(self):
+        while self.alive:
+            age = time.time() - self.markets.updated_at
+            if age >= Config.market_info_update_interval_seconds:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f'SymbolRegistryError: {e}')
+                    time.sleep(60)
+                continue
+            time.sleep(min(60, Config.market_info_update_interval_seconds - age))
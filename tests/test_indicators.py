@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import indicators
+
+# the pandas formulas of the indicators from before the array kernels, the wrappers must
+# give the same values
+
+
+def candles(size, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, size))
+    open_ = np.r_[close[0], close[:-1]]
+    index = pd.date_range('2024-01-01', periods=size, freq='15min')
+    series = (open_, close + rng.uniform(0, 2, size), close - rng.uniform(0, 2, size), close, rng.uniform(1, 100, size))
+    return [pd.Series(values, index=index) for values in series]
+
+
+def assert_same(result, expected, exact=False):
+    result, expected = result.to_numpy(dtype=float), expected.to_numpy(dtype=float)
+    if exact:
+        assert np.array_equal(result, expected, equal_nan=True)
+    else:
+        np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('size', [50, 3000])
+def test_atr(size):
+    _, high, low, _, _ = candles(size, 0)
+    assert_same(indicators.get_atr(high, low, 10)['atr'], (high - low).rolling(10).mean(), exact=True)
+
+
+@pytest.mark.parametrize('size', [50, 3000])
+def test_adx(size):
+    _, high, low, _, _ = candles(size, 1)
+    atr = indicators.get_atr(high, low, 10)['atr']
+    period = 14
+    plus_dm = high.diff()
+    minus_dm = low.diff()
+    plus_dm[plus_dm < 0] = 0
+    minus_dm[minus_dm > 0] = 0
+    plus_di = 100 * (plus_dm.ewm(alpha=1 / period).mean() / atr)
+    minus_di = abs(100 * (minus_dm.ewm(alpha=1 / period).mean() / atr))
+    dx = (abs(plus_di - minus_di) / abs(plus_di + minus_di)) * 100
+    adx = ((dx.shift(1) * (period - 1)) + dx) / period
+    result = indicators.get_adx(high, low, atr, period)
+    assert_same(result['pdi'], plus_di)
+    assert_same(result['ndi'], minus_di)
+    assert_same(result['adx'], adx.ewm(alpha=1 / period).mean())
+
+
+@pytest.mark.parametrize('size', [50, 3000])
+def test_rsi(size):
+    open_, _, _, close, _ = candles(size, 2)
+    change = close - open_
+    ema_gain = change.apply(lambda x: x if x > 0 else 0).ewm(span=10, min_periods=10).mean()
+    ema_loss = change.apply(lambda x: -x if x < 0 else 0).ewm(span=10, min_periods=10).mean()
+    assert_same(indicators.get_rsi(open_, close, 10)['rsi'], 100 - (100 / (ema_gain / ema_loss + 1)))
+
+
+@pytest.mark.parametrize('size', [50, 3000])
+def test_mfi(size):
+    _, high, low, close, volume = candles(size, 3)
+    typical_price = (close + high + low) / 3
+    raw_money_flow = typical_price * volume
+    change = typical_price.diff()
+    psum = raw_money_flow.where(change > 0, 0).rolling(7).sum()
+    nsum = raw_money_flow.where(change < 0, 0).rolling(7).sum()
+    assert_same(indicators.get_mfi(close, high, low, volume)['mfi'], 100 * psum / (psum + nsum))
+
+
+@pytest.mark.parametrize('size', [50, 3000])
+def test_vwap(size):
+    _, high, low, close, volume = candles(size, 4)
+    wp = (high + low + close) / 3 * volume
+    vwap = wp.groupby(wp.index.to_period('D')).cumsum() / volume.groupby(volume.index.to_period('D')).cumsum()
+    assert_same(indicators.get_vwap(high, low, close, volume)['vwap'], vwap)
@@ -0,0 +1,146 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from utils import indicators, kernels
+
+# get_supertrend and get_atr as they were before the array kernels, the reference the
+# kernels must match to the bit
+
+
+def baseline_verify_series(series, min_length=None):
+    has_length = min_length is not None and isinstance(min_length, int)
+    if series is not None and isinstance(series, pd.Series):
+        return None if has_length and series.size < min_length else series
+
+
+def baseline_get_offset(x):
+    return int(x) if isinstance(x, int) else 0
+
+
+def baseline_get_atr(high, low, period=None, length=None):
+    length = int(length) if length and length > 0 else 7
+    high = baseline_verify_series(high, length)
+    low = baseline_verify_series(low, length)
+    period = int(period) if period and period > 0 else 14
+
+    if high is None or low is None: return
+
+    range_ = high - low
+    atr_ = range_.rolling(period).mean()
+    return pd.DataFrame({
+        "high": high,
+        "low": low,
+        "atr": atr_
+    }, index=high.index)
+
+
+def baseline_get_supertrend(high, low, close, volume, atr_period=None, multiplier=None, length=None, offset=None):
+    atr_period = int(atr_period) if atr_period and atr_period > 0 else 14
+    length = int(length) if length and length > 0 else 7
+    multiplier = float(multiplier) if multiplier and multiplier > 0 else 3.0
+    high = baseline_verify_series(high, length)
+    low = baseline_verify_series(low, length)
+    close = baseline_verify_series(close, length)
+    volume = baseline_verify_series(volume, length)
+    offset = baseline_get_offset(offset)
+    atr = baseline_get_atr(high, low, atr_period)['atr']
+
+    if high is None or low is None or close is None: return
+
+    m = close.size
+    dir_, trend = [1] * m, [0] * m
+    long, short = [None] * m, [None] * m
+
+    hl_avg = (high + low + close) / 3
+
+    hl_avg = (hl_avg * volume) / volume.mean()
+    closeB4 = close
+    close = (close * volume) / volume.mean()
+
+    matr = multiplier * atr
+    upperband = hl_avg + matr
+    lowerband = hl_avg - matr
+
+    for i in range(1, m):
+        if close.iloc[i] > upperband.iloc[i - 1]:
+            dir_[i] = 1
+        elif close.iloc[i] < lowerband.iloc[i - 1]:
+            dir_[i] = -1
+        else:
+            dir_[i] = dir_[i - 1]
+            if dir_[i] > 0 and lowerband.iloc[i] < lowerband.iloc[i - 1]:
+                lowerband.iloc[i] = lowerband.iloc[i - 1]
+            if dir_[i] < 0 and upperband.iloc[i] > upperband.iloc[i - 1]:
+                upperband.iloc[i] = upperband.iloc[i - 1]
+
+        if dir_[i] > 0:
+            trend[i] = long[i] = lowerband.iloc[i]
+        else:
+            trend[i] = short[i] = upperband.iloc[i]
+
+    supertrend_return = pd.DataFrame({
+            "high": high,
+            "low": low,
+            "close": closeB4,
+            "volume_weighted_close": close,
+            "volume": volume,
+            "supertrend": trend,
+            "supertrend_direction": dir_,
+            "supertrend_long": long,
+            "supertrend_short": short,
+        }, index=close.index)
+    supertrend_return['supertrend_is_uptrend'] = supertrend_return['supertrend_direction'] == 1
+
+    if offset != 0:
+        supertrend_return = supertrend_return.shift(offset)
+
+    return supertrend_return
+
+
+# random walk candles, high, low, close and volume
+def candles(size, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, size))
+    index = pd.date_range('2024-01-01', periods=size, freq='min')
+    return [
+        pd.Series(values, index=index)
+        for values in (close + rng.uniform(0, 2, size), close - rng.uniform(0, 2, size), close, rng.uniform(1, 100, size))
+    ]
+
+
+def best_time(function, args, repeat):
+    function(*args)
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+@pytest.mark.parametrize('size', [1000, 100000])
+def test_supertrend_matches_baseline(monkeypatch, size, compiled):
+    if not compiled:
+        monkeypatch.setattr(kernels, 'rolling_mean_loop_compiled', None)
+        monkeypatch.setattr(kernels, 'supertrend_loop_compiled', None)
+    elif kernels.njit is None:
+        pytest.skip('numba is not installed')
+    for seed, (period, multiplier) in enumerate([(10, 3), (14, 2.5), (7, 1)]):
+        args = candles(size, seed)
+        result = indicators.get_supertrend(*args, period, multiplier)
+        expected = baseline_get_supertrend(*args, period, multiplier)
+        for column in ('supertrend', 'supertrend_direction', 'volume_weighted_close'):
+            assert result[column].dtype == expected[column].dtype
+            assert np.array_equal(result[column].to_numpy(), expected[column].to_numpy(), equal_nan=True)
+        assert result['supertrend_is_uptrend'].equals(expected['supertrend_is_uptrend'])
+
+
+@pytest.mark.skipif(kernels.njit is None, reason='numba is not installed')
+@pytest.mark.parametrize('size', [1000, 100000])
+def test_supertrend_speed(size):
+    args = candles(size, 0)
+    baseline = best_time(baseline_get_supertrend, args, 3 if size <= 1000 else 1)
+    kernel = best_time(indicators.get_supertrend, args, 20)
+    assert baseline / kernel >= 50
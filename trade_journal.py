@@ -0,0 +1,163 @@
+import os
+import time
+import hashlib
+import datetime
+import threading
+import click
+import numpy as np
+from utils.constants import Constants
+
+
+# the journal's name of the user of an API key, so the key itself isn't written to disk
+def journal_user(api_key):
+    return hashlib.sha1(api_key.encode()).hexdigest()[:16]
+
+
+class TradeJournal:
+    '''
+    Append-only journal of the lifecycle events of the traders' positions: opened, filled,
+    take profit and stop loss placed, trailed, closed and expired.
+
+    Each event is one fixed-width record of the "record" dtype, appended to the file of its
+    (user, symbol) at <directory>/<user>/<SYMBOL>.bin in time order, so the files are their
+    own index: the events of a user and symbol between two times are found by a binary
+    search of a read only memory map of the file, without reading anything else.
+    '''
+    events = ('open', 'fill', 'tp', 'sl', 'trail', 'close', 'expire')
+    sides = ('buy', 'sell')
+    record = np.dtype([
+        ('time', '<i8'),  # ms
+        ('position', '<i8'),  # the id of the order that opened the position
+        ('order', '<i8'),  # the order of the event, 0 if none
+        ('event', 'u1'),
+        ('side', 'u1'),
+        ('price', '<f8'),  # entry price when opened or filled, exit price when closed, the order's price otherwise
+        ('volume', '<f8'),
+        ('tp', '<f8'),
+        ('sl', '<f8'),
+        ('profit', '<f8'),
+    ])
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.last_times = {}
+
+    def path(self, user, symbol):
+        return os.path.join(self.directory, user, f'{symbol.upper()}.bin')
+
+    def size(self, user, symbol):
+        path = self.path(user, symbol)
+        if not os.path.isfile(path):
+            return 0
+        size, rest = divmod(os.path.getsize(path), self.record.itemsize)
+        if rest != 0:
+            # an append was cut short, drop the partial record
+            os.truncate(path, size * self.record.itemsize)
+        return size
+
+    # journal the "event" of the position
+    def log(self, user, symbol, event, position, price=None, order=None, at=None):
+        record = np.zeros(1, dtype=self.record)
+        record['position'] = position.orderId or 0
+        record['order'] = order or 0
+        record['event'] = self.events.index(event)
+        record['side'] = self.sides.index(position.order_type)
+        record['price'] = position.entry_price if price is None else price
+        record['volume'] = position.volume
+        record['tp'] = position.tp
+        record['sl'] = position.sl
+        record['profit'] = position.profit
+        key = (user, symbol.upper())
+        with self.lock:
+            if key not in self.last_times:
+                last = self.records(user, symbol, start=-1)
+                self.last_times[key] = int(last['time'][-1]) if len(last) > 0 else 0
+            # kept in time order, the order the records are searched by
+            at = max(int((time.time() if at is None else at) * 1000), self.last_times[key])
+            record['time'] = at
+            os.makedirs(os.path.dirname(self.path(user, symbol)), exist_ok=True)
+            with open(self.path(user, symbol), 'ab') as file:
+                file.write(record.tobytes())
+            self.last_times[key] = at
+
+    # a read only memory map of the records of the user and symbol, from the "start"
+    # (inclusive) to the "end" (exclusive) record
+    def records(self, user, symbol, start=0, end=None):
+        size = self.size(user, symbol)
+        start, end, _ = slice(start, end).indices(size)
+        if end <= start:
+            return np.empty(0, dtype=self.record)
+        return np.memmap(self.path(user, symbol), dtype=self.record, mode='r', shape=(size,))[start:end]
+
+    # the records of the user and symbol from the "since" to the "until" time (datetimes or ms)
+    def range(self, user, symbol, since=None, until=None):
+        records = self.records(user, symbol)
+        times = records['time']
+        start = 0 if since is None else int(np.searchsorted(times, to_ms(since), side='left'))
+        end = len(records) if until is None else int(np.searchsorted(times, to_ms(until), side='right'))
+        return records[start:end]
+
+    def users(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(user for user in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, user)))
+
+    def symbols(self, user):
+        directory = os.path.join(self.directory, user)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.bin')] for name in os.listdir(directory) if name.endswith('.bin'))
+
+    # the records of every (user, symbol) in the time range, only those of the user and
+    # symbol if given, as {(user, symbol): records}
+    def query(self, user=None, symbol=None, since=None, until=None):
+        result = {}
+        for user_ in [user] if user is not None else self.users():
+            for symbol_ in [symbol.upper()] if symbol is not None else self.symbols(user_):
+                records = self.range(user_, symbol_, since, until)
+                if len(records) > 0:
+                    result[(user_, symbol_)] = records
+        return result
+
+    # the totals of the positions closed in the records
+    def summary(self, records):
+        closed = records[records['event'] == self.events.index('close')]
+        return {
+            'events': len(records),
+            'opened': int(np.count_nonzero(records['event'] == self.events.index('open'))),
+            'closed': len(closed),
+            'wins': int(np.count_nonzero(closed['profit'] > 0)),
+            'longs': int(np.count_nonzero(closed['side'] == self.sides.index('buy'))),
+            'shorts': int(np.count_nonzero(closed['side'] == self.sides.index('sell'))),
+            'profit': float(closed['profit'].sum()),
+        }
+
+
+def to_ms(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+@click.command()
+@click.option('--directory', default=Constants.journal_dir_name, help='The journal directory.')
+@click.option('--api-key', default=None, help='Only the trades of this API key.')
+@click.option('--symbol', default=None, help='Only the trades of this symbol.')
+@click.option('--days', type=float, default=30, help='The trades of the last "days" days.')
+def main(directory, api_key, symbol, days):
+    journal = TradeJournal(directory)
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    started = time.time()
+    result = journal.query(user=None if api_key is None else journal_user(api_key), symbol=symbol, since=since)
+    for (user, symbol_), records in result.items():
+        summary = journal.summary(records)
+        click.echo(
+            f'{user} {symbol_}: {summary["closed"]} closed ({summary["wins"]} won, {summary["longs"]} longs, '
+            f'{summary["shorts"]} shorts), profit {summary["profit"]:.4f}, {summary["events"]} events'
+        )
+    click.echo(f'{sum(len(records) for records in result.values())} events read in {(time.time() - started) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
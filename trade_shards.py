@@ -0,0 +1,356 @@
+import os
+import time
+import zlib
+import bisect
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from loguru import logger
+from utils.config import Config
+from trade_state import account_of, fetch_account
+
+
+class HashRing:
+    '''
+    Consistent hashing of the trade keys over the shards: every shard has replicas points
+    on a ring of CRC32 values and a key goes to the shard of the first point after it.
+    '''
+
+    def __init__(self, nodes, replicas=160):
+        self.points = sorted(
+            (zlib.crc32(f'{node}:{replica}'.encode()), node) for node in nodes for replica in range(replicas)
+        )
+        self.hashes = [point[0] for point in self.points]
+
+    def node(self, key):
+        index = bisect.bisect(self.hashes, zlib.crc32(key.encode())) % len(self.points)
+        return self.points[index][1]
+
+
+# what the supervisor knows of a trader running in a shard
+def snapshot(trader):
+    try:
+        status = trader.get_status(None)
+    except Exception as e:
+        status = f'=== <b>{trader.name}</b> ===\n{e}'
+    return {
+        'name': trader.name,
+        'symbol': trader.symbol,
+        'alive': trader.alive,
+        'margin_pct': trader.margin_pct,
+        'leverage': trader.leverage,
+        'feedback': trader.feedback,
+        'chart_photo_path': trader.chart_photo_path,
+        'status': status,
+    }
+
+
+class ShardWorker:
+    '''
+    The trades of one shard process, with a TradingRuntime of their own. It runs the
+    commands the supervisor sends over the connection and sends back the snapshots of
+    its traders every shard_status_interval_seconds, only those that changed.
+    '''
+
+    def __init__(self, index, shards, connection):
+        # imported here so the supervisor doesn't load the strategy's modules
+        from trader import Trader
+        from trading_runtime import TradingRuntime
+        from utils.trade_logger import log_sink
+        # the shards don't write to the log files of the bot's process
+        log_sink.suffix = f'shard-{index}'
+        self.Trader = Trader
+        self.index = index
+        self.connection = connection
+        self.runtime = TradingRuntime(limit_share=1 / shards)
+        self.traders = {}
+        self.sent = {}
+        self.send_lock = threading.Lock()
+        # stopping a trade waits for its loop, the commands don't hold up the connection
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f'shard-{index}')
+
+    # the snapshots are taken under the lock they're sent with, so an older one never
+    # reaches the supervisor after a newer one
+    def send(self, message, traders=None):
+        with self.send_lock:
+            if traders is not None:
+                message = message + ({key: snapshot(trader) for key, trader in traders.items()},)
+            self.connection.send(message)
+
+    def run(self):
+        next_snapshots = time.time()
+        while True:
+            try:
+                if self.connection.poll(max(0, next_snapshots - time.time())):
+                    message = self.connection.recv()
+                    self.executor.submit(self.on_command, *message)
+                if time.time() >= next_snapshots:
+                    self.send_snapshots()
+                    next_snapshots = time.time() + Config.shard_status_interval_seconds
+            except (EOFError, OSError):
+                # the supervisor is gone
+                break
+        for trader in list(self.traders.values()):
+            if trader.alive:
+                trader.stop()
+        # the shard processes end without running the atexit handlers
+        from utils.trade_logger import flush_logs
+        flush_logs()
+
+    def on_command(self, request_id, command, key, args):
+        try:
+            if command == 'add':
+                old = self.traders.get(key)
+                if old is not None and old.alive:
+                    old.stop()
+                self.traders[key] = self.Trader(self.runtime, *args)
+                self.traders[key].state_key = key
+            elif command == 'remove':
+                self.sent.pop(key, None)
+                self.traders.pop(key, None)
+                self.send(('reply', request_id, None), {})
+                return
+            trader = self.traders[key]
+            if command == 'trade':
+                trader.trade(*args)
+            elif command == 'restore':
+                trader.restore(*args)
+            elif command == 'stop':
+                trader.stop(*args)
+            elif command == 'update':
+                trader.update(*args)
+            elif command == 'chart':
+                trader.get_chart_photo()
+            self.send(('reply', request_id, None), {key: trader})
+        except Exception as e:
+            logger.error(f'ShardError: {e}')
+            self.send(('reply', request_id, f'{type(e).__name__}: {e}'), {})
+
+    def send_snapshots(self):
+        with self.send_lock:
+            changed = {}
+            for key, trader in list(self.traders.items()):
+                state = snapshot(trader)
+                if self.sent.get(key) != state:
+                    self.sent[key] = state
+                    changed[key] = state
+            if len(changed) > 0:
+                self.connection.send(('snapshots', changed))
+
+
+def run_shard(index, shards, connection):
+    ShardWorker(index, shards, connection).run()
+
+
+class RemoteTrader:
+    '''
+    Stands in the bot for a Trader running in a shard process, with the attributes and
+    methods the bot and its conversations use. The attributes come from the last
+    snapshot of the trader, the methods run on it in its shard and wait for the result.
+    '''
+
+    def __init__(self, shards, key, args):
+        self.shards = shards
+        self.key = key
+        # the Trader arguments after its parent, to add it again to a restarted shard
+        self.args = args
+        self.symbol = args[2].upper()
+        self.name = self.symbol
+        self.alive = False
+        self.margin_pct = args[-2]
+        self.leverage = args[-1]
+        self.feedback = None
+        self.chart_photo_path = None
+        self.status = ''
+
+    def apply(self, state):
+        if state is not None:
+            self.name = state['name']
+            self.alive = state['alive']
+            self.margin_pct = state['margin_pct']
+            self.leverage = state['leverage']
+            self.feedback = state['feedback']
+            self.chart_photo_path = state['chart_photo_path']
+            self.status = state['status']
+
+    def get_status(self, caller_id):
+        return self.status
+
+    def trade(self, resume=False):
+        self.shards.request(self, 'trade', resume)
+
+    def restore(self, state, balances=None, positions=None, open_orders=None):
+        self.shards.request(self, 'restore', state, balances, positions, open_orders)
+
+    def stop(self, msg=None):
+        self.shards.request(self, 'stop', msg)
+
+    def update(self, margin_pct, leverage, use_order_book):
+        self.shards.request(self, 'update', margin_pct, leverage, use_order_book)
+
+    # rendered in the shard, the reply brings its path
+    def get_chart_photo(self):
+        self.shards.request(self, 'chart')
+        return self.chart_photo_path
+
+
+class Shard:
+    '''
+    A shard process of TradeShards and its end of the connection to it.
+    '''
+
+    def __init__(self, parent, index):
+        self.parent = parent
+        self.index = index
+        self.process = None
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.traders = {}
+        self.restarts = 0
+
+    def start(self):
+        connection, child_connection = self.parent.context.Pipe()
+        self.process = self.parent.context.Process(
+            target=run_shard, args=(self.index, self.parent.count, child_connection),
+            name=f'trade-shard-{self.index}', daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.connection = connection
+        threading.Thread(target=self.read, args=(connection,), name=f'trade-shard-{self.index}', daemon=True).start()
+
+    def send(self, request_id, command, key, args):
+        future = Future()
+        self.pending[request_id] = future
+        try:
+            with self.send_lock:
+                self.connection.send((request_id, command, key, args))
+        except Exception as e:
+            self.pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def read(self, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            for key, state in message[-1].items():
+                trader = self.traders.get(key)
+                if trader is not None:
+                    trader.apply(state)
+            if message[0] == 'reply':
+                _, request_id, error, _ = message
+                future = self.pending.pop(request_id, None)
+                if future is not None:
+                    if error is not None:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        future.set_result(None)
+        if connection is self.connection and self.parent.alive:
+            self.restart()
+
+    # the process died: its pending requests fail and its trades are added again to a new
+    # one, the running ones started again
+    def restart(self):
+        self.process.join(timeout=5)
+        logger.error(f'ShardError: shard {self.index} exited with code {self.process.exitcode}, restarting it')
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f'shard {self.index} exited'))
+        self.restarts = self.restarts + 1
+        # a shard failing on start isn't restarted in a tight loop
+        time.sleep(min(30, self.restarts))
+        self.start()
+        traders = list(self.traders.values())
+        # the trades pick up from the state the shard snapshotted, reconciled with the
+        # accounts fetched once for all the trades of each API key
+        store = None if self.parent.runtime is None else self.parent.runtime.state_store
+        states = {} if store is None else store.states([trader.key for trader in traders])
+        accounts = {}
+        for trader in traders:
+            was_alive = trader.alive
+            try:
+                self.parent.request(trader, 'add')
+                state = states.get(trader.key)
+                if state is not None:
+                    api_key, api_secret = trader.args[0], trader.args[1]
+                    if api_key not in accounts:
+                        accounts[api_key] = fetch_account(self.parent.runtime.client_pool.client(api_key, api_secret))
+                    self.parent.request(trader, 'restore', state, *account_of(accounts[api_key], trader.symbol))
+                if was_alive:
+                    self.parent.request(trader, 'trade', state is not None)
+            except Exception as e:
+                logger.error(f'ShardError: {e}')
+
+
+class TradeShards:
+    '''
+    Runs the trades in shard_workers processes (the number of CPUs by default) in the
+    "sharded" execution mode, so their strategies don't share one GIL, while the bot
+    process keeps Telegram and the users.
+
+    The trades are spread over the shards by consistent hashing of their symbol, so all
+    the trades of a symbol share one shard's candle feed, indicators and kline files.
+    Adding, starting, stopping and updating a trade go to its shard over a pipe, and
+    the shards stream back the snapshots of their traders, read by /status.
+    '''
+
+    # the bot's "runtime" restores the trades of a restarted shard from its state store
+    def __init__(self, count=None, runtime=None):
+        self.runtime = runtime
+        self.count = (Config.shard_workers or os.cpu_count() or 1) if count is None else count
+        # the shards don't inherit the bot's threads and connections
+        self.context = multiprocessing.get_context('spawn')
+        self.ring = HashRing(range(self.count))
+        self.shards = [Shard(self, index) for index in range(self.count)]
+        self.request_ids = itertools.count()
+        self.alive = False
+
+    def start(self):
+        if not self.alive:
+            self.alive = True
+            for shard in self.shards:
+                shard.start()
+
+    def stop(self):
+        self.alive = False
+        for shard in self.shards:
+            if shard.connection is not None:
+                shard.connection.close()
+                shard.process.join(timeout=30)
+
+    def shard_of(self, trader):
+        return self.shards[self.ring.node(trader.symbol)]
+
+    # a Trader, with the arguments after its parent, added to the shard of its symbol
+    def add(self, user_key, *args):
+        trader = RemoteTrader(self, f'{user_key}|{args[2].upper()}', args)
+        self.shard_of(trader).traders[trader.key] = trader
+        self.request(trader, 'add')
+        return trader
+
+    def remove(self, trader):
+        shard = self.shard_of(trader)
+        shard.traders.pop(trader.key, None)
+        self.request(trader, 'remove')
+
+    def request(self, trader, command, *args):
+        shard = self.shard_of(trader)
+        args = trader.args if command == 'add' else args
+        future = shard.send(next(self.request_ids), command, trader.key, args)
+        future.result(timeout=Config.shard_request_timeout_seconds)
+
+    def stats(self):
+        return [
+            {
+                'shard': shard.index,
+                'pid': shard.process.pid if shard.process is not None else None,
+                'traders': len(shard.traders),
+                'alive': sum(1 for trader in list(shard.traders.values()) if trader.alive),
+                'restarts': shard.restarts,
+            } for shard in self.shards
+        ]
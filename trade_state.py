@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from loguru import logger
+from utils.config import Config
+
+
+def encode(value):
+    # numpy numbers, then timestamps and whatever else
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+# the balances, positions and open orders of the account of an API key, fetched once for all
+# its trades, all None if they couldn't be so the trades' first runs reconcile them instead
+def fetch_account(client):
+    try:
+        return client.futures_account_balance(), client.futures_position_information(), client.futures_get_open_orders()
+    except Exception as e:
+        logger.error(f'RecoveryError: {e}')
+        return None, None, None
+
+
+# the fetched account with only the positions and open orders of the symbol
+def account_of(account, symbol):
+    balances, positions, open_orders = account
+    return (
+        balances,
+        None if positions is None else [position for position in positions if position['symbol'] == symbol],
+        None if open_orders is None else [order for order in open_orders if order['symbol'] == symbol]
+    )
+
+
+class TradeStateStore:
+    '''
+    Keeps the users, the trades and the state of their traders (counters, balance and
+    positions with their order ids) in a SQLite database in WAL mode, so a restarted bot
+    picks its trades up where they were.
+
+    The bot saves the users and the arguments of the trades as they're added, updated and
+    removed. The state of the tracked traders is snapshotted by a writer thread every
+    state_snapshot_interval_seconds, and soon after a trader says it changed, in one
+    transaction for all of them, and only when it's different from the last one written.
+    The shard processes track their own traders in the same database.
+
+    The users table holds the API keys and secrets in plain text, as the bot needs them
+    to resume the trades. The database is only readable by its owner (0600), with its
+    WAL files, and is kept out of git with the rest of data/. Back it up and move it
+    like any other credentials file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.traders = {}
+        self.dirty = set()
+        self.written = {}
+        self.wake = threading.Event()
+        self.thread = None
+        self.snapshots = 0
+        self.errors = 0
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        # created only readable by its owner, SQLite gives the WAL files the same mode
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        os.chmod(self.path, 0o600)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS users (user_key TEXT PRIMARY KEY, id TEXT, api_key TEXT, api_secret TEXT)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS trades '
+                '(key TEXT PRIMARY KEY, user_key TEXT, symbol TEXT, args TEXT, state TEXT, updated REAL)'
+            )
+
+    def execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def save_user(self, user_key, id, api_key, api_secret):
+        self.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)', (user_key, id, api_key, api_secret))
+
+    # the user and their trades
+    def remove_user(self, user_key):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM users WHERE user_key = ?', (user_key,))
+            self.connection.execute('DELETE FROM trades WHERE user_key = ?', (user_key,))
+
+    # the arguments of the trade's Trader after its parent
+    def save_trade(self, key, user_key, symbol, args):
+        self.execute(
+            'INSERT INTO trades (key, user_key, symbol, args, updated) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET args = excluded.args, updated = excluded.updated',
+            (key, user_key, symbol.upper(), json.dumps(list(args), default=encode), time.time())
+        )
+
+    def remove_trade(self, key):
+        self.execute('DELETE FROM trades WHERE key = ?', (key,))
+        with self.lock:
+            self.written.pop(key, None)
+
+    # the users and trades saved, the trades as (key, user_key, symbol, args, state) with the
+    # state None if it was never snapshotted
+    def load(self):
+        users = self.execute('SELECT user_key, id, api_key, api_secret FROM users')
+        trades = [
+            (key, user_key, symbol, json.loads(args), None if state is None else json.loads(state))
+            for key, user_key, symbol, args, state in self.execute(
+                'SELECT key, user_key, symbol, args, state FROM trades WHERE args IS NOT NULL ORDER BY key'
+            )
+        ]
+        return users, trades
+
+    # the last snapshotted states of the trades of the keys, by key
+    def states(self, keys):
+        states = {}
+        for key in keys:
+            rows = self.execute('SELECT state FROM trades WHERE key = ? AND state IS NOT NULL', (key,))
+            if len(rows) > 0:
+                states[key] = json.loads(rows[0][0])
+        return states
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='trade-state', daemon=True)
+                self.thread.start()
+
+    # snapshot the trader from now on, by its state_key
+    def track(self, trader):
+        with self.lock:
+            self.traders[trader.state_key] = trader
+        self.changed(trader)
+        self.start()
+
+    # the trader stopped, its last state is written before it's forgotten
+    def forget(self, trader):
+        self.snapshot([trader])
+        with self.lock:
+            if self.traders.get(trader.state_key) is trader:
+                del self.traders[trader.state_key]
+            self.dirty.discard(trader.state_key)
+
+    # the trader's state changed, it's written on the next wake of the writer
+    def changed(self, trader):
+        with self.lock:
+            self.dirty.add(trader.state_key)
+        self.wake.set()
+
+    def run(self):
+        while True:
+            woken = self.wake.wait(Config.state_snapshot_interval_seconds)
+            # the changes of the next moments go in the same transaction
+            time.sleep(Config.state_snapshot_delay_seconds if woken else 0)
+            self.wake.clear()
+            with self.lock:
+                keys = list(self.traders) if not woken else list(self.dirty)
+                self.dirty.clear()
+                traders = [self.traders[key] for key in keys if key in self.traders]
+            self.snapshot(traders)
+
+    def snapshot(self, traders):
+        rows = []
+        for trader in traders:
+            try:
+                state = json.dumps(trader.state(), default=encode)
+            except Exception as e:
+                self.errors = self.errors + 1
+                logger.warning(f'TradeStateError: {e}')
+                continue
+            if self.written.get(trader.state_key) != state:
+                rows.append((trader.state_key, state))
+        if len(rows) == 0:
+            return
+        now = time.time()
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany(
+                    'UPDATE trades SET state = ?, updated = ? WHERE key = ?', [(state, now, key) for key, state in rows]
+                )
+                for key, state in rows:
+                    self.written[key] = state
+                self.snapshots = self.snapshots + len(rows)
+        except Exception as e:
+            self.errors = self.errors + 1
+            logger.warning(f'TradeStateError: {e}')
+
+    def stats(self):
+        with self.lock:
+            return {'tracked': len(self.traders), 'dirty': len(self.dirty), 'snapshots': self.snapshots, 'errors': self.errors}
@@ -1,27 +1,27 @@
 import time
+import asyncio
 import threading
-import uuid
-import os
 from loguru import logger
 import pandas as pd
 import numpy as np
-import plotly.express as px
-from binance.client import Client
 from binance.enums import HistoricalKlinesType
-import plotly.express as px
 from position import Position
+from market_data import Candles
+from chart_renderer import Chart
+from trade_journal import journal_user
 from utils.config import Config
 
 from utils.constants import Constants
 from utils.core import is_admin
 from utils.trade_logger import filelog, chartlog
-from utils.indicators import get_adx, get_atr, get_mfi, get_rsi, get_supertrend, get_vwap
+from utils.indicator_cache import indicator_cache
+from scheduler import candle_open
 from utils.math import add, op_values_at_index, roundup
 from traderstatus import TraderStatus
 from utils.wallet import is_valid_wallet_address
 
-indicator_period = 10
-indicator_factor = 3
+indicator_period = Config.indicator_period
+indicator_factor = Config.indicator_factor
 
 class Trader:
 
@@ -40,7 +40,8 @@ class Trader:
         self.api_key = api_key
         self.api_secret = api_secret
         self.symbol = symbol.upper()
-        self.client = Client(api_key=self.api_key, api_secret=self.api_secret, testnet=False)
+        self.journal_user = journal_user(self.api_key)
+        self.client = self.parent.client_pool.client(self.api_key, self.api_secret)
         self.use_trailing_sl_tp = use_trailing_sl_tp
         self.tp_sl_ratio_weak = tp_sl_ratio_weak
         self.tp_sl_ratio_strong = tp_sl_ratio_strong
@@ -63,8 +64,14 @@ class Trader:
         self.feedback = None
         self.alive = False
         self.thread = None
+        # the trade's key in the bot's TradeStateStore, set by the bot or shard that owns it
+        self.state_key = None
+        # the trade was just reconciled by the bulk recovery on startup
+        self.reconciled = False
 
         self.chart_photo_path = None
+        # the chart of the last closed candle, drawn only when /status asks for it
+        self.chart_df = None
         self.positions = []
 
         # logs for all strategies
@@ -86,6 +93,18 @@ class Trader:
         self.current_price = 0
         self.run_counts = 0
 
+        # guards the positions against the user data stream applying order updates to
+        # them while the trading loop checks them
+        self.orders_lock = threading.RLock()
+        self.last_orders_check_time = 0
+        # set to cut the wait for the next run short
+        self.wake = threading.Event()
+
+        # the last closed candle the strategy ran on, with its last row and signal
+        self.last_closed_time = None
+        self.last_data = None
+        self.last_new_pos = None
+
     # calulate the volume of an unstable coin an amount of stable coin can buy
     # e.g, the volume/size of ETH a particular amount of BUSD can buy
     def amount_to_volume(self, amount, volume_price):
@@ -171,26 +190,40 @@ class Trader:
         self.build_key_value('supertrend_trend', round(self.supertrend_trend, 2))])
 
     def get_current_price(self):
+        # the streamed mark price when the bot's market data hub has a recent one
+        mark_price = self.parent.market_data.mark_price(self.symbol)
+        if mark_price is not None:
+            return mark_price
         return float(self.client.futures_mark_price(symbol=self.symbol)['markPrice'])
         # return float(self.client.futures_symbol_ticker(symbol=self.symbol)['price'])
 
+    # the bot's TradingEngine in the "asyncio" engine mode, None when trades run on their own threads
+    def get_engine(self):
+        return self.parent.engine if Config.engine_mode == Constants.EngineMode.asyncio else None
+
     def get_symbol(self):
         return self.parent.get_symbol_info(symbol=self.symbol, is_futures=True)
 
-    def update_balance(self):
-        balances = self.client.futures_account_balance()
+    # from the exchange, or from the "balances" of the user's account fetched for all their trades
+    def update_balance(self, balances=None):
+        if balances is None:
+            balances = self.client.futures_account_balance()
         balance_key = 'balance'
+        symbol_info = self.get_symbol()
         for balance in balances:
-            symbol_info = self.get_symbol()
             if balance['asset'] == symbol_info.quoteAsset:
                 self.balance = float(balance[balance_key])
                 self.pnl = self.balance
                 break
 
-    def update_current_position_info(self):
+    # from the exchange, or from the "positions" of the user's account fetched for all their trades
+    def update_current_position_info(self, positions=None):
         current_position = self.get_open_position()
         if current_position is not None:
-            info = self.client.futures_position_information(symbol=self.symbol)
+            if positions is None:
+                info = self.client.futures_position_information(symbol=self.symbol)
+            else:
+                info = [position for position in positions if position['symbol'] == self.symbol]
             if info is not None and len(info) > 0:
                 info = self.dict_to_object(info[0])
                 # if the entry price is not greater than zero, it means there's no position opened yet
@@ -208,12 +241,50 @@ class Trader:
                     current_position.margin_type = info.marginType
                     self.current_position = current_position       
 
-    def run_trade(self):
-        self.update_settings_on_exchange()
+    # the trade loop, its runs are timed by the bot's scheduler: just after each candle
+    # closes, and more often while a position is open
+    def run_trade(self, resume=False):
+        # a trade resumed after a restart already has its settings on the exchange
+        if not resume:
+            self.update_settings_on_exchange()
+        scheduler = self.parent.scheduler
         while self.alive:
-            try:
-                self.run_counts = self.run_counts + 1
+            started = scheduler.begin(self)
+            ok = self.run_once(candles_timeout=Config.fetch_interval_seconds, newer_than=candle_open(started))
+            delay = scheduler.end(self)
+            if ok:
+                # woken early when the trade is stopped
+                self.wake.wait(delay)
+
+    # the trade loop of the "asyncio" engine mode, the same runs as run_trade on the
+    # engine's threads with the waits between them on its event loop
+    async def run_trade_async(self, resume=False):
+        engine = self.parent.engine
+        scheduler = self.parent.scheduler
+        if not resume:
+            await engine.call(self.update_settings_on_exchange)
+        while self.alive:
+            started = scheduler.begin(self)
+            # the engine's threads are shared, so none of them waits on the candles
+            ok = await engine.call(self.run_once, 0, candle_open(started))
+            due = time.time() + scheduler.end(self)
+            while ok and self.alive and time.time() < due:
+                await asyncio.sleep(min(1, due - time.time()))
+            if not ok:
+                await asyncio.sleep(0)
+
+    # one iteration of the trade loop, returns False when it ended with an error.
+    # It waits up to "candles_timeout" seconds for candles fetched after "newer_than"
+    def run_once(self, candles_timeout, newer_than=None):
+        try:
+            self.run_counts = self.run_counts + 1
                 
+            # the user data stream keeps the balance, the position info and the orders
+            # up to date while it's live, so they're only checked over REST once in a while
+            # but not on the first run after the bulk recovery, it just was
+            reconcile = self.should_check_orders() and not self.reconciled
+            self.reconciled = False
+            if reconcile:
                 # get the latest account balance so that the bot can calculate 
                 # a percentage of it for the next trade
                 #if self.get_open_position() is None:
@@ -222,39 +293,41 @@ class Trader:
                 # update the current position info
                 self.update_current_position_info()
 
-                # set the current price
-                self.current_price = self.get_current_price()
+            # set the current price
+            self.current_price = self.get_current_price()
 
-                # get historical data to for the bot to strategize on    
-                klines = self.client.get_historical_klines(
-                    self.symbol, 
-                    Config.timeframe, 
-                    limit=Config.max_positions_per_chart, 
-                    klines_type=self.klines_type
-                )
-                if klines is not None:
-                    # transfrom the data to panda dataframe
-                    df = self.klines_to_dataframe(klines)
+            # get historical data to for the bot to strategize on, shared with
+            # every other trader of this symbol through the bot's market data hub
+            candles = self.parent.market_data.candles(
+                self.symbol, Config.timeframe, newer_than=newer_than, timeout=candles_timeout
+            )
+            # the open time of the last closed candle, the last one is still forming
+            closed_time = candles.open_time[-2] if candles is not None and len(candles.open_time) > 1 else None
+            if closed_time is not None and closed_time == self.last_closed_time and self.last_data is not None:
+                # no candle closed since the last run, only the current price moved
+                self.react_to_price()
+            elif candles is not None:
+                # transfrom the data to panda dataframe
+                df = self.candles_to_dataframe(candles)
                     
-                    # send the dataframe to the bot to react on 
-                    df = self.react(df)
-                    # log the chart dataframe for later debugging or bot improvement
-                    try:
-                        chartlog(df)
-                    except Exception as e:
-                        logger.warning(f'ChartLogError: {e}')
-                    try:
-                        # create a picture of the latest chart with profits and loss points marked
-                        self.update_chart_photo(df)
-                    except Exception as e:
-                        logger.warning(f'ChartPhotoError: {e}')
-                # check the states of the position, take profit, and stop loss orders made when the 
-                # bot reacted to the chart and make decisions based on the states
+                # send the dataframe to the bot to react on 
+                df = self.react(df)
+                self.last_closed_time = closed_time
+                # log the chart dataframe for later debugging or bot improvement
+                try:
+                    chartlog(self.symbol, df)
+                except Exception as e:
+                    logger.warning(f'ChartLogError: {e}')
+                # kept for the chart photo of /status, rendered only when it's asked for
+                self.chart_df = df
+            # check the states of the position, take profit, and stop loss orders made when the 
+            # bot reacted to the chart and make decisions based on the states
+            if reconcile:
                 self.check_orders()
-                time.sleep(Config.fetch_interval_seconds)
-                    
-            except Exception as e:
-                self.handle_error(e)
+            return True
+        except Exception as e:
+            self.handle_error(e)
+            return False
 
     def handle_error(self, e):
         #APIError(code=-4129): Time in Force (TIF) GTE can only be used 
@@ -265,6 +338,10 @@ class Trader:
             # this may happen if the user panicked
             # the user could have also tried to game the bot fee by manually closing on profit
             ok = True
+        # APIError(code=-1003): Too many requests. The rate limiter pauses the calls
+        # until the exchange allows them again
+        elif 'apierror(code=-1003)' in str(e).lower():
+            ok = True
         # urllib3 HTTPError ('Connection aborted.', RemoteDisconnected('Remote end closed connection without response'))
         elif 'connection' in str(e).lower():
             ok = True
@@ -292,11 +369,24 @@ class Trader:
         logger.error(f'TraderError: {e}')
 
 
-    def trade(self):
+    # "resume" a trade restored by the bulk recovery on startup
+    def trade(self, resume=False):
         self.alive = True
-        self.status = TraderStatus.waiting
-        self.thread = threading.Thread(target = self.run_trade)
-        self.thread.start()
+        self.wake.clear()
+        self.last_closed_time = None
+        self.status = TraderStatus.trading if resume and self.get_open_position() is not None else TraderStatus.waiting
+        self.parent.market_data.subscribe(self.symbol, Config.timeframe, self)
+        if Config.order_tracking_mode == Constants.OrderTrackingMode.stream:
+            self.parent.user_streams.subscribe(self)
+        engine = self.get_engine()
+        if engine is not None:
+            self.thread = engine.submit(self.run_trade_async(resume))
+        else:
+            self.thread = threading.Thread(target = self.run_trade, args=(resume,))
+            self.thread.start()
+        store = self.parent.state_store
+        if store is not None and self.state_key is not None:
+            store.track(self)
         self.feedback = f'✅ <b>{self.name}</b> trade was successfully started for execution once the time is right. \n\nYou can update the settings with the <a href="/{Constants.Commands.updatetrade}">/{Constants.Commands.updatetrade}</a> command. \n\nYou can also cancel it with the <a href="/{Constants.Commands.removetrade}">/{Constants.Commands.removetrade}</a> command. \n\nTo view the status of your trades like checking if a trade has been executed, use the <a href="/{Constants.Commands.status}">/{Constants.Commands.status}</a> command.'
         
     def update(self, margin_pct, leverage, use_order_book):
@@ -312,6 +402,7 @@ class Trader:
         self.best_asks_volume = 0
         self.best_bids_price = 0
         self.best_asks_price = 0
+        self.state_changed()
 
         self.feedback = f'✅ <b>{self.name}</b> trade was successfully updated. The trading bot will start using the settings on the next trade action.'
 
@@ -328,14 +419,24 @@ class Trader:
 
     def stop(self, msg=None):
         self.alive = False
+        self.wake.set()
+        self.parent.scheduler.forget(self)
         self.status = msg if msg is not None else TraderStatus.stopped
         self.react(df=None)
+        self.parent.market_data.unsubscribe(self.symbol, Config.timeframe, self)
+        self.parent.user_streams.unsubscribe(self)
         try:
-            self.thread.join()
+            engine = self.get_engine()
+            if engine is None:
+                self.thread.join()
+            elif not engine.is_engine_thread():
+                # the trade loop task, it can't be waited on from the engine's own threads
+                self.thread.result()
         except Exception as e:
-            filelog(
-                f'{Constants.log_dir_name}/{Constants.error_log_filename}', str(e) + Constants.log_text_nl
-            )
+            filelog(f'{Constants.log_dir_name}/{Constants.error_log_filename}', str(e), level='ERROR')
+        store = self.parent.state_store
+        if store is not None and self.state_key is not None:
+            store.forget(self)
         symbol_info = self.parent.get_symbol_info(self.symbol, True)
         self.feedback = msg if msg is not None else f'✅ <b>{self.name}</b> trade was successfully stopped with all {symbol_info.baseAsset} sold into the {symbol_info.quoteAsset} stable coin at market price.'
 
@@ -380,12 +481,31 @@ class Trader:
     # the current and last positions are updated here when position order status is filled
     # and when tp or sl order is filled respectively
     def check_orders(self):
+        with self.orders_lock:
+            self.last_orders_check_time = time.time()
+            self.check_orders_on_exchange()
+
+    # whether the orders should be checked over REST on this loop: always when they're
+    # polled, and only every order_reconcile_interval_seconds while the user data stream is live
+    def should_check_orders(self):
+        return (
+            Config.order_tracking_mode != Constants.OrderTrackingMode.stream
+            or not self.parent.user_streams.is_live(self)
+            or time.time() - self.last_orders_check_time >= Config.order_reconcile_interval_seconds
+        )
+
+    # with the open orders from the exchange, or from the "open_orders" of the user's account
+    # fetched for all their trades
+    def check_orders_on_exchange(self, open_orders=None):
         # get the last position if it hasn't been closed yet
         last_position = self.get_open_position()
         # if the last postion order has not fiiled or an order to take profit or stop loss on last postion was already sent to the exchange
         if last_position is not None and (last_position.orderFilled is False or last_position.tpOrderId is not None or last_position.slOrderId is not None):
             #check if the order has filled
-            orders = self.client.futures_get_open_orders(symbol=self.symbol)
+            if open_orders is None:
+                orders = self.client.futures_get_open_orders(symbol=self.symbol)
+            else:
+                orders = [order for order in open_orders if order['symbol'] == self.symbol]
             # if the order has filled here before getting to the code block that checks and 
             # log the order state, this means we have confirmed the filling previously,
             # and so it means we have initialised the position previously too, since 
@@ -415,26 +535,9 @@ class Trader:
                 if posOrder is not None:
                     posOrder = self.order_to_df(posOrder)
                     if posOrder.status == 'FILLED':
-                        # update the order entry price and time
-                        last_position.entry_price = posOrder.avgPrice
-                        last_position.entry_time = posOrder.updateTime
-                        # update the "take profit" and "stop loss" mark of the trade position
-                        last_position.update_tp_sl()
-                        # reset the first and last trade time
-                        if self.first_trade_time is None:
-                            self.first_trade_time = last_position.entry_time
-                        self.last_trade_time = last_position.entry_time
-                        # reset total counts for longs, shorts, and all trades in general
-                        if last_position.order_type == 'buy': 
-                            self.total_longs = self.total_longs + 1
-                        else:
-                            self.total_shorts = self.total_shorts + 1
-                        self.total_trades = self.total_trades + 1
-                        ## update the current position ##
-                        self.current_position = last_position
+                        self.on_position_order_filled(last_position, posOrder.avgPrice, posOrder.updateTime)
                     elif posOrder.status == 'EXPIRED':
-                        # remove the order
-                        self.positions = self.positions[0:len(self.positions) - 1]
+                        self.on_position_order_expired(last_position)
             else:
                 last_position.is_closed = has_tp or has_sl
                 # if the opened position has closed by take profit(tp) or stop losss(sl), 
@@ -451,35 +554,126 @@ class Trader:
                         if slOrder is not None and slOrder['status'] == 'FILLED':
                             closeOrder = self.order_to_df(slOrder) # sl was hit
                     if closeOrder is not None: # tp or sl was hit
-                        # update the position close price and time so the chart 
-                        # and profit calculator can use them
-                        last_position.exit_price = closeOrder.avgPrice
-                        last_position.exit_time = closeOrder.updateTime
-                        last_position.update_profit()
-                        self.on_postion_closed(last_position)
+                        self.on_close_order_filled(last_position, closeOrder.avgPrice, closeOrder.updateTime)
                     else:
-                        # If we got here..., that's wierd and bad. 
-                        # It means both the tp and sl order canceled or expired.
-                        # We should definetly clear the tp and sl order IDs 
-                        # so the bot can send another tp or sl order to the exchange
-                        last_position.tpOrderId = None
-                        last_position.slOrderId = None
-                        last_position.tpClientOrderId = None
-                        last_position.slClientOrderId = None
-                        last_position.is_closed = False
-
-            logger.info('--check_orders:last_position:--')
-            logger.info(last_position.asdict())
-            logger.info('--check_orders:orders:--')
-            logger.info(orders)
+                        self.on_close_orders_gone(last_position)
+
+            # on every run, so only at the debug level and the position taken only if it's kept
+            filelog(
+                f'{Constants.log_dir_name}/{Constants.info_log_filename}', '--check_orders--', level='DEBUG',
+                last_position=last_position.asdict, orders=orders
+            )
+
+    # the position order has filled, so the position is now being traded
+    def on_position_order_filled(self, position, price, filled_time):
+        position.orderFilled = True
+        # update the order entry price and time
+        position.entry_price = price
+        position.entry_time = filled_time
+        # update the "take profit" and "stop loss" mark of the trade position
+        position.update_tp_sl()
+        # reset the first and last trade time
+        if self.first_trade_time is None:
+            self.first_trade_time = position.entry_time
+        self.last_trade_time = position.entry_time
+        # reset total counts for longs, shorts, and all trades in general
+        if position.order_type == 'buy': 
+            self.total_longs = self.total_longs + 1
+        else:
+            self.total_shorts = self.total_shorts + 1
+        self.total_trades = self.total_trades + 1
+        ## update the current position ##
+        self.current_position = position
+        self.journal('fill', position, order=position.orderId)
+
+    def on_position_order_expired(self, position):
+        self.journal('expire', position, order=position.orderId)
+        # remove the order
+        if self.get_last_position() is position:
+            self.positions = self.positions[0:len(self.positions) - 1]
+
+    # the take profit or stop loss order has filled, closing the position
+    def on_close_order_filled(self, position, price, filled_time):
+        position.is_closed = True
+        # update the position close price and time so the chart 
+        # and profit calculator can use them
+        position.exit_price = price
+        position.exit_time = filled_time
+        position.update_profit()
+        self.journal('close', position, price=price)
+        self.on_postion_closed(position)
+
+    def on_close_orders_gone(self, position):
+        # If we got here..., that's wierd and bad. 
+        # It means both the tp and sl order canceled or expired.
+        # We should definetly clear the tp and sl order IDs 
+        # so the bot can send another tp or sl order to the exchange
+        position.tpOrderId = None
+        position.slOrderId = None
+        position.tpClientOrderId = None
+        position.slClientOrderId = None
+        position.is_closed = False
+        self.state_changed()
+
+    # one of the take profit and stop loss orders was canceled or expired: only its ids are
+    # cleared, the other one may still close the position. The next run checks the orders
+    # over REST, and both being gone without a fill is handled like there
+    def on_close_order_gone(self, position, order_id):
+        if order_id == position.tpOrderId:
+            position.tpOrderId = None
+            position.tpClientOrderId = None
+        else:
+            position.slOrderId = None
+            position.slClientOrderId = None
+        self.last_orders_check_time = 0
+        if position.tpOrderId is None and position.slOrderId is None:
+            self.on_close_orders_gone(position)
+        else:
+            self.state_changed()
+
+    # applies an ORDER_TRADE_UPDATE event of the user data stream ("o" object) to the open position
+    def on_order_update(self, order):
+        with self.orders_lock:
+            position = self.get_open_position()
+            if position is None:
+                return
+            status = order['X']
+            filled_time = pd.to_datetime(order['T'], unit='ms')
+            if order['i'] == position.orderId:
+                if status == 'FILLED' and position.orderFilled is False:
+                    self.on_position_order_filled(position, float(order['ap']), filled_time)
+                elif status == 'EXPIRED':
+                    self.on_position_order_expired(position)
+            elif order['i'] == position.tpOrderId or order['i'] == position.slOrderId:
+                if status == 'FILLED':
+                    self.on_close_order_filled(position, float(order['ap']), filled_time)
+                elif status == 'CANCELED' or status == 'EXPIRED':
+                    self.on_close_order_gone(position, order['i'])
+            else:
+                return
             filelog(
-                f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
-                '--check_orders--\n' +
-                f'last_position: {last_position.asdict()}\n' + 
-                f'{str(orders)}' + 
-                Constants.log_text_nl
+                f'{Constants.log_dir_name}/{Constants.info_log_filename}', '--on_order_update--',
+                position=position.asdict, order=order
             )
 
+    # applies the balances ("B") and positions ("P") of an ACCOUNT_UPDATE event of the user data stream
+    def on_account_update(self, balances, positions):
+        symbol_info = self.get_symbol()
+        for balance in balances:
+            if balance['a'] == symbol_info.quoteAsset:
+                self.balance = float(balance['wb'])
+                self.pnl = self.balance
+        with self.orders_lock:
+            current_position = self.get_open_position()
+            for info in positions:
+                # if the entry price is not greater than zero, it means there's no position opened yet
+                if info['s'] == self.symbol and current_position is not None and float(info['ep']) > 0:
+                    current_position.amount = float(info['pa'])
+                    current_position.entry_price = float(info['ep'])
+                    current_position.unrealised_profit = float(info['up'])
+                    current_position.isolated_wallet = float(info.get('iw', current_position.isolated_wallet))
+                    current_position.margin_type = info.get('mt', current_position.margin_type)
+                    self.current_position = current_position
 
     def add_position(self, position):
         if position.volume > 0:
@@ -495,13 +689,8 @@ class Trader:
             position.orderId = order['orderId']
             position.clientOrderId = order['clientOrderId']
             logger.info('Trade::OpenOrder:')
-            logger.info(position.asdict())
-            filelog(
-                f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
-                '--add_position--\n' +
-                f'position: {position.asdict()}' + 
-                Constants.log_text_nl
-            )
+            self.journal('open', position, order=position.orderId)
+            filelog(f'{Constants.log_dir_name}/{Constants.info_log_filename}', '--add_position--', position=position.asdict)
 
             self.positions.append(position)
             # remove the oldest position if the total postions has exceeded the limit size
@@ -523,13 +712,8 @@ class Trader:
             position.tpOrderId = order['orderId']
             position.tpClientOrderId = order['clientOrderId']
             logger.info('Trade::CloseOrder:TP')
-            logger.info(position.asdict())
-            filelog(
-                f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
-                '--take_profit--\n' +
-                f'position: {position.asdict()}' + 
-                Constants.log_text_nl
-            )
+            self.journal('tp', position, price=position.tp, order=position.tpOrderId)
+            filelog(f'{Constants.log_dir_name}/{Constants.info_log_filename}', '--take_profit--', position=position.asdict)
 
     def stop_loss(self, position):
         if position.slOrderId is None:
@@ -546,71 +730,116 @@ class Trader:
             position.slOrderId = order['orderId']
             position.slClientOrderId = order['clientOrderId']
             logger.info('Trade::CloseOrder:SL')
-            logger.info(position.asdict())
-            filelog(
-                f'{Constants.log_dir_name}/{Constants.info_log_filename}', 
-                '--stop_loss--\n' +
-                f'position: {position.asdict()}' + 
-                Constants.log_text_nl
-            )
+            self.journal('sl', position, price=position.sl, order=position.slOrderId)
+            filelog(f'{Constants.log_dir_name}/{Constants.info_log_filename}', '--stop_loss--', position=position.asdict)
+
+    # journal the lifecycle event of the position, the trade goes on if it can't be
+    def journal(self, event, position, price=None, order=None):
+        try:
+            self.parent.journal.log(self.journal_user, self.symbol, event, position, price=price, order=order)
+        except Exception as e:
+            logger.warning(f'JournalError: {e}')
+        # and each of them is a change of the trade's state
+        self.state_changed()
+
+    # the trade's state changed, so it's snapshotted soon
+    def state_changed(self):
+        store = self.parent.state_store
+        if store is not None and self.state_key is not None:
+            store.changed(self)
+
+    # what the TradeStateStore keeps of the trade to restore it after a restart
+    def state(self):
+        with self.orders_lock:
+            positions = self.positions[-Config.state_positions_kept:]
+            return {
+                'alive': self.alive,
+                'status': self.status,
+                'margin_pct': self.margin_pct,
+                'leverage': self.leverage,
+                'balance': self.balance,
+                'pnl': self.pnl,
+                'total_longs': self.total_longs,
+                'total_shorts': self.total_shorts,
+                'total_trades': self.total_trades,
+                'first_trade_time': self.first_trade_time,
+                'last_trade_time': self.last_trade_time,
+                'positions': [position.asdict() for position in positions],
+            }
+
+    # restores the snapshot "state" of the trade, then reconciles it with the balances,
+    # positions and open orders of the user's account, fetched once for all their trades
+    def restore(self, state, balances=None, positions=None, open_orders=None):
+        with self.orders_lock:
+            self.status = state['status']
+            self.margin_pct = state['margin_pct']
+            self.leverage = state['leverage']
+            self.balance = state['balance']
+            self.pnl = state['pnl']
+            self.total_longs = state['total_longs']
+            self.total_shorts = state['total_shorts']
+            self.total_trades = state['total_trades']
+            self.first_trade_time = None if state['first_trade_time'] is None else pd.Timestamp(state['first_trade_time'])
+            self.last_trade_time = None if state['last_trade_time'] is None else pd.Timestamp(state['last_trade_time'])
+            self.positions = [Position.restore(self, position) for position in state['positions']]
+            open_position = self.get_open_position()
+            self.current_position = open_position if open_position is not None and open_position.orderFilled else None
+            closed = [position for position in self.positions if position.is_closed]
+            self.last_position = closed[-1] if len(closed) > 0 else None
+            if balances is not None and positions is not None and open_orders is not None:
+                self.update_balance(balances)
+                self.update_current_position_info(positions)
+                self.check_orders_on_exchange(open_orders)
+                self.last_orders_check_time = time.time()
+                self.reconciled = True
 
     def get_last_position(self):
         return self.positions[len(self.positions) - 1] if len(self.positions) > 0 else None
 
-    def update_chart_photo(self, chart_df):
-        fig = px.line(chart_df, x='time', y=['close', 'vwap'], title=f'{Config.bot_name} {self.name} Quantitatively Analysed {Config.timeframe} Chart.')
-        
-        oldest_tick = chart_df.iloc[0]
-        trades_df = self.get_positions_df()
-        for i, position in trades_df.iterrows():
-            if position.is_closed and position.exit_time is not None and position.exit_time >= oldest_tick.time:
-                fig.add_shape(type="line",
-                    x0=position.entry_time, y0=position.entry_price, x1=position.exit_time, y1=position.exit_price,
-                    line=dict(
-                        color = "green" if position.profit >= 0 else "red",
-                        width = 3
-                    )
-                )
-        photo_path = self.save_chart_photo(fig)
-        if photo_path is not None:
-            # delete previous photo then assign a new one
-            if self.chart_photo_path is not None and os.path.isfile(self.chart_photo_path):
-                os.remove(self.chart_photo_path)
-            self.chart_photo_path = photo_path
-
-    def save_chart_photo(self, fig):
-        filename = f'{Constants.chart_photos_dir_name}/{str(uuid.uuid4())}.png'
-        try:
-            fig.write_image(filename)
-            return filename
-        except:
+    # the latest chart with the profits and losses of the closed positions marked on it
+    def get_chart(self):
+        chart_df = self.chart_df
+        oldest_time = chart_df['time'].iloc[0]
+        trades = [
+            (position.entry_time, position.entry_price, position.exit_time, position.exit_price, position.profit >= 0)
+            for position in list(self.positions)
+            if position.is_closed and position.exit_time is not None and position.exit_time >= oldest_time
+        ]
+        return Chart(
+            f'{Config.bot_name} {self.name} Quantitatively Analysed {Config.timeframe} Chart.',
+            chart_df['time'].to_numpy(), chart_df['close'].to_numpy(),
+            chart_df['vwap'].to_numpy() if 'vwap' in chart_df else chart_df['close'].to_numpy(), trades
+        )
+
+    # what the chart photo shows changes with the last closed candle and when a position
+    # is added or closed
+    def get_chart_key(self):
+        positions = list(self.positions)
+        closed = [position for position in positions if position.is_closed]
+        last_change = (len(positions), closed[-1].exit_time if len(closed) > 0 else None)
+        return (self.api_key, self.symbol, self.last_closed_time, last_change)
+
+    # the photo of the latest chart, rendered by the bot's chart renderer unless it has it already
+    def get_chart_photo(self):
+        if self.chart_df is None:
             return None
+        self.chart_photo_path = self.parent.chart_renderer.render(self.get_chart_key(), self.get_chart)
+        return self.chart_photo_path
 
 
     def klines_to_dataframe(self, klines):
-        df = pd.DataFrame(np.array(klines).reshape(-1,12), dtype=float, columns = ('open_time',
-                                            'open',
-                                            'high',
-                                            'low',
-                                            'close',
-                                            'volume',
-                                            'close_time',#close time
-                                            'quote_asset_volume',
-                                            'number_of_trades',
-                                            'taker_buy_base_asset_volume',
-                                            'taker_buy_quote_asset_volume',
-                                            'ignore'))
-        
+        return self.candles_to_dataframe(Candles.from_klines(self.symbol, Config.timeframe, klines))
+
+    # the frame's price and volume columns are the snapshot's read only arrays, not copies
+    def candles_to_dataframe(self, candles):
         df = pd.DataFrame({
-            'time': df['close_time'],
-            'open': df['open'],
-            'high': df['high'],
-            'low': df['low'],
-            'close': df['close'],
-            'volume': df['volume']
-        })
-        
-        df['time'] = pd.to_datetime(df['time'], unit='ms')
+            'time': pd.to_datetime(candles.close_time, unit='ms'),
+            'open': candles.open,
+            'high': candles.high,
+            'low': candles.low,
+            'close': candles.close,
+            'volume': candles.volume
+        }, copy=False)
         df.index = df.time
         return df
 
@@ -623,45 +852,36 @@ class Trader:
                 pos.close_position()
             return None
         else:
-            atr_indicator = get_atr(df['high'], df['low'], indicator_period)
-            adx_indicator = get_adx(df['high'], df['low'], atr_indicator['atr'])
-            rsi_indicator = get_rsi(df['open'], df['close'], indicator_period)
-            mfi_indicator = get_mfi(df['close'], df['high'], df['low'], df['volume'], indicator_period)
-            supertrend = get_supertrend(
-                high=df['high'], 
-                low=df['low'], 
-                close=df['close'], 
-                volume=df['volume'], 
-                atr_period=indicator_period,
-                multiplier=indicator_factor
-            )
-            vwap_indicator = get_vwap(
-                high=df['high'], 
-                low=df['low'], 
-                close=df['close'], 
-                volume=df['volume']
-            )
-            df['atr'] = atr_indicator['atr']
-            df['adx'] = adx_indicator['adx']
-            df['rsi'] = rsi_indicator['rsi']
-            df['mfi'] = mfi_indicator['mfi']
-            df['supertrend_is_uptrend'] = supertrend['supertrend_is_uptrend']
-            df['supertrend_trend'] = supertrend['supertrend']
-            df['supertrend_vwc'] = supertrend['volume_weighted_close']
-            df['vwap'] = vwap_indicator['vwap']
-            strategy_feed = df[indicator_period:]  # removing NaN values
-            self.strategize(strategy_feed)
-            return df
+            # the indicators are shared with every other trader of this symbol, so the
+            # frame returned is read only from here on
+            frame = indicator_cache.frame(self.symbol, Config.timeframe, df, indicator_period, indicator_factor)
+            if frame is None:
+                return df
+            strategy_feed = frame[indicator_period:]  # removing NaN values
+            with self.orders_lock:
+                self.strategize(strategy_feed)
+            return frame
 
     def strategize(self, feed):
         self.avg_trend_strength = feed['adx'].sum() / feed['adx'].size
         adx_avg = roundup(self.avg_trend_strength, 10)
         data = feed.iloc[feed['adx'].size - 1]
         new_pos = self.logic(data, adx_avg)
+        # kept for the runs between candle closes
+        self.last_data = data
+        self.last_new_pos = new_pos
         logger.info(f"Position::Q, {'None' if new_pos is None else new_pos.asdict()}")
         self.close_tp_sl(data=data, new_pos=new_pos)
         self.check_to_add_position(new_pos)       
 
+    # checks the take profit and stop loss triggers against the current price, with the
+    # indicators and signal of the last closed candle
+    def react_to_price(self):
+        data = self.last_data.copy()
+        data['close'] = self.current_price
+        with self.orders_lock:
+            self.close_tp_sl(data=data, new_pos=self.last_new_pos)
+
     def check_to_add_position(self, new_pos):
         last_position = self.get_last_position()
         # strategy logic
@@ -686,6 +906,7 @@ class Trader:
             elif (float(data['close']) >= float(pos.tp_trigger) and pos.order_type == 'buy'):
                 # trailing tp and sl
                 if new_pos is not None and new_pos.order_type == pos.order_type and self.use_trailing_sl_tp:
+                    trailed = pos.tp != new_pos.tp or pos.sl != new_pos.sl
                     pos.tp = new_pos.tp
                     pos.sl = new_pos.sl
                     pos.tp_sl_rate = new_pos.tp_sl_rate
@@ -693,11 +914,14 @@ class Trader:
                     pos.tp_trigger = new_pos.tp_trigger
                     pos.sl_trigger = new_pos.sl_trigger
                     pos.tp_sl_trigger_rate = new_pos.tp_sl_trigger_rate
+                    if trailed:
+                        self.journal('trail', pos)
                 elif new_pos is not None or not self.use_trailing_sl_tp:# don't close yet in an indecisicve market
                     pos.close_position(Position.TP, data['close'])
             elif (float(data['close']) <= float(pos.tp_trigger) and pos.order_type == 'sell'):
                 # trailing tp and sl
                 if new_pos is not None and new_pos.order_type == pos.order_type and self.use_trailing_sl_tp:
+                    trailed = pos.tp != new_pos.tp or pos.sl != new_pos.sl
                     pos.tp = new_pos.tp
                     pos.sl = new_pos.sl
                     pos.tp_sl_rate = new_pos.tp_sl_rate
@@ -705,14 +929,16 @@ class Trader:
                     pos.tp_trigger = new_pos.tp_trigger
                     pos.sl_trigger = new_pos.sl_trigger
                     pos.tp_sl_trigger_rate = new_pos.tp_sl_trigger_rate
+                    if trailed:
+                        self.journal('trail', pos)
                 elif new_pos is not None or not self.use_trailing_sl_tp:# don't close yet in an indecisicve market
                     pos.close_position(Position.TP, data['close'])
 
     def sl_tp_diff_trigger(self, atr):
-        return 0.7 * atr
+        return Config.sl_tp_trigger_atr_multiplier * atr
 
     def sl_tp_diff(self, atr):
-        return 1.1 * atr
+        return Config.sl_tp_atr_multiplier * atr
 
     def calculate_volume(self, price_per_volume):
         # Initial Margin = Quantity X EntryPrice X IMR
@@ -720,14 +946,10 @@ class Trader:
         margin = (self.margin_pct * self.pnl) / 100
         # calculate the quantity the leverage will get
         qty = (margin * self.leverage) / price_per_volume
-        info = self.parent.get_symbol_info(self.symbol, True)
-        precision = int(info.quantityPrecision)
-        return float("{:0.0{}f}".format(qty, precision))
+        return self.get_symbol().quantity(qty)
 
     def get_precise_price(self, price):
-        info = self.parent.get_symbol_info(self.symbol, True)
-        precision = int(info.pricePrecision)
-        return float("{:0.0{}f}".format(price, precision))
+        return self.get_symbol().price(price)
         
     # strategy logic how positions should be opened/closed
     def logic(self, data, adx_avg) -> Position:
@@ -739,7 +961,7 @@ class Trader:
         self.supertrend_vwc = data['supertrend_vwc']
         self.supertrend_trend = data['supertrend_trend']
         
-        if data['adx'] >= 15:
+        if data['adx'] >= Config.adx_threshold:
             # USE SUPERTREND INDICATOR TO MAKE A STRATEGY
             # supertrend is uptrend
             # close > supertrend
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import Config
+
+
+class TradingEngine:
+    '''
+    Runs the trader loops and the position close retries as asyncio tasks on one event
+    loop, for the "asyncio" engine mode. Their waits are asyncio sleeps instead of
+    sleeping threads, and their blocking exchange calls run on a pool of
+    Config.engine_workers threads, so the number of threads stays the same however
+    many trades are running.
+    '''
+
+    def __init__(self, workers=None):
+        self.workers = Config.engine_workers if workers is None else workers
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='trading-engine')
+        self.loop = None
+        self.thread = None
+        self.tasks = set()
+        self.started = threading.Event()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='trading-engine-loop', daemon=True)
+            self.thread.start()
+            self.started.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self.executor)
+        self.started.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+            self.executor.shutdown(wait=False)
+
+    # schedule a coroutine on the loop from any thread, returns its concurrent Future
+    def submit(self, coroutine):
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.tasks.add(future)
+        future.add_done_callback(self.tasks.discard)
+        return future
+
+    # run a blocking function on the engine's threads, to be awaited from its tasks
+    def call(self, function, *args):
+        return self.loop.run_in_executor(self.executor, function, *args)
+
+    # whether the caller runs on the engine, where waiting on its tasks would block them
+    def is_engine_thread(self):
+        thread = threading.current_thread()
+        return thread.name.startswith('trading-engine')
+
+    def stats(self):
+        return {'tasks': len(self.tasks), 'workers': self.workers}
@@ -0,0 +1,82 @@
+from symbol_registry import SymbolRegistry
+from market_data import MarketDataHub
+from kline_store import KlineStore
+from rate_limiter import RateLimiter
+from client_pool import ClientPool
+from trading_engine import TradingEngine
+from scheduler import TradeScheduler
+from user_stream import UserDataStreams
+from chart_renderer import ChartRenderer
+from trade_journal import TradeJournal
+from trade_state import TradeStateStore
+from utils.fake_exchange import FakeExchange
+from utils.config import Config
+from utils.constants import Constants
+
+
+class TradingRuntime:
+    '''
+    What the traders of one process share to reach the exchange: the rate limiter, the
+    client pool, the symbols, the market data hub, the user data streams, the engine, the
+    scheduler and the chart renderer. The traders get it as their parent.
+
+    A process running a share of the trades next to others gets that share of the
+    request weight and order limits, as they're counted per IP.
+
+    With a FakeExchange, or in the "simulated" exchange mode one replaying the stored
+    candles, the clients are those of the fake exchange and the candles it serves aren't
+    stored again.
+    '''
+
+    def __init__(self, limit_share=1.0, exchange=None):
+        # every exchange call of the process and its traders goes through the rate limiter,
+        # with one client shared per API key
+        self.rate_limiter = RateLimiter(
+            weight_limit=Config.request_weight_limit * limit_share,
+            order_limit=Config.order_count_limit * limit_share
+        )
+        self.exchange = exchange
+        if self.exchange is None and Config.exchange_mode == Constants.ExchangeMode.simulated:
+            self.exchange = self.simulated_exchange()
+        self.client_pool = ClientPool(self.rate_limiter, factory=None if self.exchange is None else self.exchange.client)
+        self.client = self.client_pool.client(Config.Binance.key, Config.Binance.secret)
+        # the exchange symbols, refreshed in the background
+        self.symbols = SymbolRegistry(self.client, None if self.exchange is None else Constants.simulated_symbols_filename)
+        self.symbols.start()
+        # one candle feed per traded symbol, shared by all the traders following it
+        kline_store = KlineStore(Constants.klines_dir_name) if Config.save_klines and self.exchange is None else None
+        self.market_data = MarketDataHub(self.client, store=kline_store, limiter=self.rate_limiter)
+        self.market_data.start()
+        # the futures user data streams of the traders' API keys, when orders are tracked from them
+        self.user_streams = UserDataStreams()
+        # runs the trades as tasks of one event loop in the "asyncio" engine mode
+        self.engine = TradingEngine()
+        # times the trader runs to the candle closes
+        self.scheduler = TradeScheduler(limiter=self.rate_limiter)
+        # renders the traders' chart photos when /status asks for them
+        self.chart_renderer = ChartRenderer()
+        # the lifecycle events of the traders' positions, those of the fake exchange's kept apart
+        self.journal = TradeJournal(Constants.journal_dir_name if self.exchange is None else Constants.simulated_journal_dir_name)
+        # the state of the trades kept across restarts, but not with an exchange given like the benchmark's
+        self.state_store = None
+        if exchange is None:
+            self.state_store = TradeStateStore(
+                Constants.state_db_filename if self.exchange is None else Constants.simulated_state_db_filename
+            )
+
+    def simulated_exchange(self):
+        exchange = FakeExchange(
+            balance=Config.simulated_exchange_balance, speed=Config.simulated_exchange_speed,
+            latency=Config.simulated_exchange_latency_seconds, fee_rate=Config.backtest_fee_rate,
+            slippage_rate=Config.backtest_slippage_rate, weight_limit=Config.request_weight_limit,
+            order_limit=Config.order_count_limit
+        )
+        store = KlineStore(Constants.klines_dir_name)
+        for symbol in store.symbols(Config.timeframe):
+            rows = store.rows(symbol, Config.timeframe, store.size(symbol, Config.timeframe))
+            if len(rows) > 1:
+                exchange.replay(symbol, Config.timeframe, rows, start=min(len(rows) - 1, Config.max_positions_per_chart))
+        return exchange.start()
+
+    def get_symbol_info(self, symbol: str, is_futures: bool):
+        return self.symbols.futures(symbol) if is_futures else self.symbols.spot(symbol)
@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+from loguru import logger
+from websockets.sync.client import connect
+from utils.config import Config
+
+
+class UserDataStream:
+    '''
+    Follows the futures user data stream of one API key and hands its ORDER_TRADE_UPDATE
+    and ACCOUNT_UPDATE events to the traders of that key, so fills are applied to their
+    positions as they happen instead of being inferred from REST polls.
+
+    The listen key is kept alive every listen_key_keepalive_seconds and replaced when
+    the exchange reports it expired. While the stream is down "is_live" is False and
+    the traders fall back to checking their orders over REST on every loop.
+    '''
+
+    def __init__(self, client, url=None):
+        self.client = client
+        self.url = (Config.user_stream_url if url is None else url).rstrip('/')
+        self.traders = {}
+        self.lock = threading.Lock()
+        self.listen_key = None
+        self.connection = None
+        self.is_live = False
+        self.alive = False
+        self.thread = None
+        self.connects = 0
+        self.messages = 0
+
+    def start(self):
+        if self.thread is None:
+            self.alive = True
+            self.thread = threading.Thread(target=self.run, name='user-data-stream', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.alive = False
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.listen_key is not None:
+            try:
+                self.client.futures_stream_close(listenKey=self.listen_key)
+            except Exception as e:
+                logger.warning(f'UserDataStreamError: {e}')
+            self.listen_key = None
+
+    def subscribe(self, trader):
+        with self.lock:
+            self.traders.setdefault(trader.symbol, set()).add(trader)
+
+    # returns the number of traders still following the stream
+    def unsubscribe(self, trader):
+        with self.lock:
+            traders = self.traders.get(trader.symbol)
+            if traders is not None:
+                traders.discard(trader)
+                if len(traders) == 0:
+                    del self.traders[trader.symbol]
+            return sum(len(traders) for traders in self.traders.values())
+
+    def traders_of(self, symbol):
+        with self.lock:
+            return list(self.traders.get(symbol, ()))
+
+    def all_traders(self):
+        with self.lock:
+            return [trader for traders in self.traders.values() for trader in traders]
+
+    def on_message(self, message):
+        event = json.loads(message)
+        self.messages = self.messages + 1
+        if event.get('e') == 'ORDER_TRADE_UPDATE':
+            order = event['o']
+            for trader in self.traders_of(order['s']):
+                trader.on_order_update(order)
+        elif event.get('e') == 'ACCOUNT_UPDATE':
+            update = event['a']
+            for trader in self.all_traders():
+                trader.on_account_update(update.get('B', []), update.get('P', []))
+        elif event.get('e') == 'listenKeyExpired':
+            raise ConnectionError('listen key expired')
+
+    def run(self):
+        delay = 1
+        while self.alive:
+            try:
+                if self.listen_key is None:
+                    self.listen_key = self.client.futures_stream_get_listen_key()
+                with connect(f'{self.url}/ws/{self.listen_key}') as connection:
+                    self.connection = connection
+                    self.connects = self.connects + 1
+                    self.is_live = True
+                    delay = 1
+                    kept_alive_at = time.time()
+                    while self.alive:
+                        if time.time() - kept_alive_at >= Config.listen_key_keepalive_seconds:
+                            self.client.futures_stream_keepalive(listenKey=self.listen_key)
+                            kept_alive_at = time.time()
+                        try:
+                            message = connection.recv(timeout=1)
+                        except TimeoutError:
+                            continue
+                        self.on_message(message)
+            except Exception as e:
+                if self.alive:
+                    logger.warning(f'UserDataStreamError: {e}')
+                    # a new listen key is asked for on the next connection
+                    self.listen_key = None
+            self.is_live = False
+            self.connection = None
+            if self.alive:
+                time.sleep(delay)
+                delay = min(delay * 2, Config.stream_reconnect_max_seconds)
+
+
+class UserDataStreams:
+    '''
+    One UserDataStream per API key, shared by every trader using that key. A stream is
+    opened with its first trader and closed when its last one stops.
+    '''
+
+    def __init__(self, url=None):
+        self.url = url
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, trader):
+        with self.lock:
+            stream = self.streams.get(trader.api_key)
+            if stream is None:
+                stream = self.streams[trader.api_key] = UserDataStream(trader.client, self.url)
+                stream.start()
+            stream.subscribe(trader)
+        return stream
+
+    def unsubscribe(self, trader):
+        with self.lock:
+            stream = self.streams.get(trader.api_key)
+            if stream is None or stream.unsubscribe(trader) > 0:
+                return
+            del self.streams[trader.api_key]
+        stream.stop()
+
+    def is_live(self, trader):
+        with self.lock:
+            stream = self.streams.get(trader.api_key)
+        return stream is not None and stream.is_live
@@ -11,8 +11,114 @@ class Config:
     is_test = True
     update_messages = False
     fetch_interval_seconds = 10
+    # threads the market data hub fetches the candles of the traded symbols with
+    market_data_workers = 8
+    # 'poll' fetches the candles over REST every fetch_interval_seconds, 'stream' follows
+    # the futures kline and mark price WebSocket streams
+    market_data_mode = 'poll'
+    stream_url = 'wss://fstream.binance.com'
+    # in the stream mode, how often the candles are still checked over REST
+    stream_rest_refresh_seconds = 300
+    stream_reconnect_max_seconds = 30
+    # a streamed mark price older than this is not used, the REST one is fetched instead
+    mark_price_max_age_seconds = 5
+    # 'poll' checks the orders of the traders over REST on every loop, 'stream' applies the
+    # order and account updates of the futures user data stream as they come
+    order_tracking_mode = 'poll'
+    user_stream_url = 'wss://fstream.binance.com'
+    # in the stream mode, how often the orders are still checked over REST as a safety net
+    order_reconcile_interval_seconds = 300
+    listen_key_keepalive_seconds = 1800
+    # the futures request weight limit of the IP and the order limit of an API key, per minute
+    request_weight_limit = 2400
+    order_count_limit = 1200
+    # the share of the weight limit each request priority may use: orders, fill checks,
+    # then status and market data
+    request_weight_shares = (1.0, 0.9, 0.75)
+    # the polling loops slow down once this share of the weight limit is used, up to
+    # rate_limit_max_slowdown times slower at the limit
+    rate_limit_slowdown_at = 0.5
+    rate_limit_max_slowdown = 4
+    # the keep-alive connections each shared exchange client keeps open, about the number
+    # of traders that may call the exchange at once with the same API key
+    client_pool_size = 16
+    # 'threads' runs every trade and position close on its own thread, 'asyncio' runs them
+    # all as tasks of one event loop with their exchange calls on engine_workers threads
+    engine_mode = 'threads'
+    engine_workers = 32
+    # 'single' runs every trade in the bot's process, 'sharded' spreads them over
+    # shard_workers processes (0 for one per CPU) that send the bot their status every
+    # shard_status_interval_seconds
+    execution_mode = 'single'
+    shard_workers = 0
+    shard_status_interval_seconds = 2
+    shard_request_timeout_seconds = 120
+    # the traders run this long after each candle closes, plus up to schedule_jitter_seconds
+    # depending on their symbol, and every position_check_interval_seconds in between while
+    # they have a position open
+    candle_close_delay_seconds = 2
+    schedule_jitter_seconds = 5
+    position_check_interval_seconds = 10
+    # the strategy: the supertrend and atr period and supertrend multiplier, the adx from
+    # which a trend is traded, and the take profit/stop loss distances and their triggers
+    # in atrs from the entry price
+    indicator_period = 10
+    indicator_factor = 3
+    adx_threshold = 15
+    sl_tp_atr_multiplier = 1.1
+    sl_tp_trigger_atr_multiplier = 0.7
+    # the taker fee and the slippage of market orders, as rates of the price, in backtests
+    backtest_fee_rate = 0.0004
+    backtest_slippage_rate = 0.0002
     max_leverage = 100
+    # 'binance' trades on the exchange, 'simulated' on a local fake one replaying the stored
+    # candles of Config.timeframe simulated_exchange_speed times faster than real time, with
+    # simulated_exchange_balance in the wallet of every API key
+    exchange_mode = 'binance'
+    simulated_exchange_speed = 1
+    simulated_exchange_balance = 10000
+    simulated_exchange_latency_seconds = 0
     max_positions_per_chart = 1000
+    # candles kept per feed, the charts handed to the traders stay intact while fewer than
+    # candle_ring_capacity - max_positions_per_chart new candles come after them
+    candle_ring_capacity = 2000
+    # save the closed candles to disk, so restarted trades and backtests can start from them
+    save_klines = True
+    # the chart photos of /status are rendered when asked for, on chart_render_workers
+    # threads, with 'plotly' (through kaleido) or the much lighter 'raster' backend that
+    # draws no text, and the last chart_render_cache_size of them are kept
+    chart_render_backend = 'plotly'
+    chart_render_workers = 2
+    chart_render_cache_size = 256
+    chart_render_timeout_seconds = 60
+    # the log files are written by one thread from a queue of up to log_queue_size records,
+    # those below log_level ('DEBUG', 'INFO', 'WARNING' or 'ERROR') aren't even formatted,
+    # as 'text' blocks or 'json' lines. When the queue is full records are dropped, and with
+    # 'sample' only one in log_sample_every info and debug records is kept from half full.
+    # A file is rotated and gzipped past log_rotation_bytes or log_rotation_seconds, the
+    # log_backups latest rotations are kept. On exit the queued records are written for up
+    # to log_exit_timeout_seconds
+    log_level = 'INFO'
+    log_format = 'text'
+    log_queue_size = 10000
+    log_backpressure = 'sample'
+    log_sample_every = 10
+    log_rotation_bytes = 10 * 2 ** 20
+    log_rotation_seconds = 86400
+    log_backups = 5
+    log_exit_timeout_seconds = 5
+    # the closed candles and indicators of the traded charts are appended to the chart log
+    # in batches of up to chart_log_batch_size rows, at least every chart_log_flush_seconds
+    chart_log_batch_size = 500
+    chart_log_flush_seconds = 5
+    # the state of the trades is snapshotted every state_snapshot_interval_seconds, and
+    # state_snapshot_delay_seconds after it changes, with their state_positions_kept
+    # latest positions, so a restarted bot resumes them
+    state_snapshot_interval_seconds = 60
+    state_snapshot_delay_seconds = 1
+    state_positions_kept = 100
+    # indicator frames kept in memory to be shared by the traders of the same symbol
+    indicator_cache_size = 256
     timeframe = '1m'
     timeframe_in_seconds = 60
     market_info_update_interval_seconds = 86400 # 1 day
@@ -5,6 +5,15 @@ class Constants:
     trade_keys_separator = '|'
     log_dir_name = 'logs'
     chart_photos_dir_name = 'chart_photos'
+    klines_dir_name = 'data/klines'
+    symbols_filename = 'data/symbols.json'
+    simulated_symbols_filename = 'data/symbols-simulated.json'
+    backtests_dir_name = 'data/backtests'
+    benchmarks_dir_name = 'data/benchmarks'
+    journal_dir_name = 'data/journal'
+    simulated_journal_dir_name = 'data/journal-simulated'
+    state_db_filename = 'data/state.db'
+    simulated_state_db_filename = 'data/state-simulated.db'
     logo_filename = 'assets/logo.png'
     dev_logo_filename = 'assets/dev-logo.png'
     info_log_filename = 'info.txt'
@@ -17,10 +26,49 @@ class Constants:
     class TradeType:
         futures = 'futures'
         spot = 'spot'
+
+    class MarketDataMode:
+        poll = 'poll'
+        stream = 'stream'
+
+    class OrderTrackingMode:
+        poll = 'poll'
+        stream = 'stream'
+
+    class EngineMode:
+        threads = 'threads'
+        asyncio = 'asyncio'
+
+    class ExecutionMode:
+        single = 'single'
+        sharded = 'sharded'
+
+    class LogFormat:
+        text = 'text'
+        json = 'json'
+
+    class LogBackpressure:
+        drop = 'drop'
+        sample = 'sample'
+
+    class ChartBackend:
+        plotly = 'plotly'
+        raster = 'raster'
+
+    class ExchangeMode:
+        binance = 'binance'
+        simulated = 'simulated'
+
+    # the priorities of the exchange calls, the lower the sooner
+    class RequestPriority:
+        order = 0
+        fill_check = 1
+        status = 2
     
     class Commands:
         start = 'start'
         status = 'status'
         addtrade = 'addtrade'
         updatetrade = 'updatetrade'
-        removetrade = 'stoptrade'
\ No newline at end of file
+        removetrade = 'stoptrade'
+        journal = 'journal'
\ No newline at end of file
@@ -0,0 +1,764 @@
+import json
+import math
+import time
+import random
+import itertools
+import threading
+import numpy as np
+import requests
+from requests.structures import CaseInsensitiveDict
+from binance.exceptions import BinanceAPIException
+from binance.helpers import interval_to_milliseconds
+
+# the messages of the errors the fake exchange answers with, as the exchange words them
+messages = {
+    -1001: 'Internal error; unable to process your request. Please try again.',
+    -1003: 'Too many requests; current limit is {} requests per minute. Please use the websocket for live updates to avoid polling the API.',
+    -1102: 'Mandatory parameter was not sent, was empty/null, or malformed.',
+    -1121: 'Invalid symbol.',
+    -2011: 'Unknown order sent.',
+    -2013: 'Order does not exist.',
+    -2021: 'Order would immediately trigger.',
+    -4046: 'No need to change margin type.',
+    -4129: 'Time in Force (TIF) GTE can only be used with open positions or open orders. Please ensure that open orders or positions are available.',
+}
+
+
+class FakeAPIError(Exception):
+
+    def __init__(self, code, message=None, status=400):
+        self.code = code
+        self.message = messages.get(code, 'Unknown error.') if message is None else message
+        self.status = status
+        super().__init__(f'APIError(code={code}): {self.message}')
+
+
+class Replay:
+    '''
+    The candles of a symbol replayed by a FakeExchange, re-stamped onto its clock: the
+    "start" candle is the one forming when the exchange starts. Within a candle the mark
+    price goes from the open to the low and the high (the high first on a falling candle)
+    and to the close, in three equal thirds of the candle.
+    '''
+
+    def __init__(self, rows, timeframe, origin, start):
+        self.rows = rows
+        self.timeframe = timeframe
+        self.timeframe_ms = interval_to_milliseconds(timeframe)
+        self.origin = origin
+        self.start = start
+        # where the matching got to on the exchange clock
+        self.time = origin
+
+    def open_time(self, index):
+        return self.origin + (index - self.start) * self.timeframe_ms
+
+    # the candle at the time "at" and how far into it, the last one past the end of the replay
+    def locate(self, at):
+        elapsed = (at - self.origin) / self.timeframe_ms
+        index = self.start + math.floor(elapsed)
+        if index >= len(self.rows):
+            return len(self.rows) - 1, 1.0
+        return max(0, index), elapsed - math.floor(elapsed) if index >= 0 else 0.0
+
+    def vertices(self, index):
+        open_, high, low, close = (float(value) for value in self.rows[index, 1:5])
+        return (open_, low, high, close) if close >= open_ else (open_, high, low, close)
+
+    def price_in(self, index, fraction):
+        vertices = self.vertices(index)
+        third = min(2, int(fraction * 3))
+        return vertices[third] + (vertices[third + 1] - vertices[third]) * (fraction * 3 - third)
+
+    def price(self, at):
+        return self.price_in(*self.locate(at))
+
+    # the mark prices from "start" to "end" as (time, price) points, the price moving in
+    # straight lines between them
+    def path(self, start, end):
+        points = [(start, self.price(start))]
+        step = self.timeframe_ms / 3
+        end_of_replay = self.open_time(len(self.rows))
+        boundary = self.origin + (math.floor((start - self.origin) / step) + 1) * step
+        while boundary < min(end, end_of_replay):
+            index, fraction = self.locate(boundary)
+            if fraction < 1e-9 and index > 0:
+                # the close of a candle then the open of the next, at the same time
+                points.append((boundary, float(self.rows[index - 1, 4])))
+            points.append((boundary, self.price_in(index, fraction)))
+            boundary = boundary + step
+        points.append((end, self.price(end)))
+        return points
+
+    # the klines row of a candle at the time "at", the forming one as far as it got
+    def kline(self, index, at):
+        open_time = self.open_time(index)
+        open_, high, low, close, volume = self.rows[index, 1:6]
+        current, fraction = self.locate(at)
+        if index == current and fraction < 1:
+            prices = [price for _, price in self.path(open_time, at)]
+            high, low, close, volume = max(prices), min(prices), prices[-1], volume * fraction
+        return [
+            int(open_time), str(open_), str(high), str(low), str(close), str(volume),
+            int(open_time + self.timeframe_ms - 1), '0', 0, '0', '0', '0'
+        ]
+
+
+class Account:
+    '''
+    The futures wallet, one-way mode positions and orders of an API key on a FakeExchange.
+    '''
+
+    def __init__(self, api_key, balance):
+        self.api_key = api_key
+        self.balance = balance
+        # symbol -> [amount, entry price]
+        self.positions = {}
+        self.leverages = {}
+        self.margin_types = {}
+        self.orders = {}
+
+    def position(self, symbol):
+        return self.positions.setdefault(symbol, [0.0, 0.0])
+
+    def open_orders(self, symbol=None):
+        return [
+            order for order in self.orders.values()
+            if order['status'] == 'NEW' and (symbol is None or order['symbol'] == symbol)
+        ]
+
+
+class FakeExchange:
+    '''
+    A local stand-in for the futures exchange, to run the bot and its traders offline and
+    reproducibly: the Client calls the bot makes are answered by FakeClients from the
+    wallets, positions and orders it keeps, with the request weight and order count
+    headers, the latency and the errors it's told to have.
+
+    The mark prices come from candles replayed on the exchange clock, "speed" times faster
+    than the wall clock, or are set by hand. MARKET orders fill at the mark price and the
+    TAKE_PROFIT_MARKET and STOP_MARKET orders trigger as the mark price crosses their stop
+    price, at the stop price. When a position is closed its other closePosition orders
+    expire. Fills are pushed to a FakeUserDataStream and the mark prices and forming
+    candles to a FakeMarketStream when it's given them.
+
+        exchange = FakeExchange(balance=1000, speed=60)
+        exchange.replay('BTCUSDT', '1m', KlineStore(path).rows('BTCUSDT', '1m', 5000))
+        exchange.start()
+        pool = ClientPool(limiter, factory=exchange.client)
+        exchange.fail(-4129, calls=['futures_create_order'])  # the next order is rejected
+        exchange.disconnect(times=3)  # the next three calls lose their connection
+    '''
+
+    # the request weights of the calls, the others weigh 1
+    weights = {
+        'futures_account_balance': 5,
+        'futures_position_information': 5,
+        'get_exchange_info': 20,
+    }
+    order_calls = ('futures_create_order',)
+
+    def __init__(
+        self, balance=10000, quote_asset='USDT', speed=1, latency=0, error_rate=0, error_codes=(-1001, 'disconnect'),
+        fee_rate=0.0004, slippage_rate=0, weight_limit=2400, order_limit=1200, seed=None,
+        user_stream=None, market_stream=None
+    ):
+        self.balance = balance
+        self.quote_asset = quote_asset
+        self.speed = speed
+        # seconds each call takes, or the (lowest, highest) of a random one
+        self.latency = latency
+        # the share of the calls failing at random, with one of error_codes
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.fee_rate = fee_rate
+        self.slippage_rate = slippage_rate
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self.random = random.Random(seed)
+        self.user_stream = user_stream
+        self.market_stream = market_stream
+        self.lock = threading.RLock()
+        self.started = time.time()
+        self.symbols = {}
+        self.replays = {}
+        self.marks = {}
+        self.accounts = {}
+        self.order_ids = itertools.count(1)
+        # the injected failures, as [code, message, calls, times left]
+        self.failures = []
+        self.minute = int(time.time() // 60)
+        self.used_weight = 0
+        self.used_orders = {}
+        self.calls = {}
+        self.events = []
+        self.alive = False
+        self.thread = None
+
+    # the time on the exchange clock, in milliseconds
+    def now(self):
+        return (self.started + (time.time() - self.started) * self.speed) * 1000
+
+    def client(self, api_key, api_secret=None):
+        return FakeClient(self, api_key, api_secret)
+
+    def account(self, api_key):
+        account = self.accounts.get(api_key)
+        if account is None:
+            account = self.accounts[api_key] = Account(api_key, self.balance)
+        return account
+
+    def add_symbol(self, symbol, quote_asset=None, price_precision=2, quantity_precision=3, tick_size='0.01', step_size='0.001'):
+        symbol = symbol.upper()
+        quote_asset = self.quote_asset if quote_asset is None else quote_asset
+        base_asset = symbol[:-len(quote_asset)] if symbol.endswith(quote_asset) else symbol
+        self.symbols[symbol] = {
+            'symbol': symbol,
+            'status': 'TRADING',
+            'baseAsset': base_asset,
+            'quoteAsset': quote_asset,
+            'marginAsset': quote_asset,
+            'pricePrecision': price_precision,
+            'quantityPrecision': quantity_precision,
+            'baseAssetPrecision': 8,
+            'quotePrecision': 8,
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'tickSize': tick_size},
+                {'filterType': 'LOT_SIZE', 'stepSize': step_size},
+            ],
+        }
+
+    # replay klines rows (open time, open, high, low, close, volume, close time, ...), the
+    # first "start" of them are already closed when the exchange starts
+    def replay(self, symbol, timeframe, rows, start=None, **symbol_info):
+        symbol = symbol.upper()
+        if symbol not in self.symbols:
+            self.add_symbol(symbol, **symbol_info)
+        rows = np.asarray(rows, dtype=np.float64).reshape(len(rows), -1)[:, :7]
+        if len(rows) == 0:
+            raise ValueError(f'no candles to replay for {symbol}')
+        timeframe_ms = interval_to_milliseconds(timeframe)
+        start = min(len(rows) - 1, 1000) if start is None else start
+        origin = (self.now() // timeframe_ms) * timeframe_ms
+        with self.lock:
+            self.replays[symbol] = Replay(rows, timeframe, origin, start)
+
+    def set_mark_price(self, symbol, price):
+        symbol = symbol.upper()
+        if symbol not in self.symbols:
+            self.add_symbol(symbol)
+        with self.lock:
+            previous = self.marks.get(symbol, price)
+            self.marks[symbol] = price
+            self.match(symbol, [(self.now(), previous), (self.now(), price)])
+        self.flush()
+
+    def mark_price(self, symbol):
+        replay = self.replays.get(symbol)
+        if replay is not None:
+            return replay.price(self.now())
+        if symbol not in self.marks:
+            raise FakeAPIError(-1121)
+        return self.marks[symbol]
+
+    # the next "times" calls (of the "calls" only, when given) fail with the error "code",
+    # or lose their connection with 'disconnect'
+    def fail(self, code=-1001, message=None, calls=None, times=1):
+        with self.lock:
+            self.failures.append([code, message, None if calls is None else set(calls), times])
+
+    def disconnect(self, calls=None, times=1):
+        self.fail('disconnect', calls=calls, times=times)
+
+    def failure(self, name):
+        for failure in self.failures:
+            if failure[2] is None or name in failure[2]:
+                failure[3] = failure[3] - 1
+                if failure[3] <= 0:
+                    self.failures.remove(failure)
+                return failure[0], failure[1]
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            return self.random.choice(self.error_codes), None
+        return None
+
+    def delay(self):
+        latency = self.random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+        if latency > 0:
+            time.sleep(latency)
+
+    def weight(self, name, params):
+        if name == 'futures_klines':
+            limit = params.get('limit', 500)
+            return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+        if name == 'futures_get_open_orders' and params.get('symbol') is None:
+            return 40
+        return self.weights.get(name, 1)
+
+    # count the call in the limits of the minute, the headers of its response
+    def count(self, api_key, name, params):
+        now = time.time()
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used_weight = 0
+            self.used_orders = {}
+        self.used_weight = self.used_weight + self.weight(name, params)
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)}
+        if name in self.order_calls:
+            self.used_orders[api_key] = self.used_orders.get(api_key, 0) + 1
+            headers['X-MBX-ORDER-COUNT-1M'] = str(self.used_orders[api_key])
+        if self.used_weight > self.weight_limit or self.used_orders.get(api_key, 0) > self.order_limit:
+            headers['Retry-After'] = str(max(1, int((minute + 1) * 60 - now)))
+            return headers, FakeAPIError(-1003, messages[-1003].format(self.weight_limit), status=429)
+        return headers, None
+
+    # answer a call of a FakeClient: its result, and the status, headers and body of its response
+    def request(self, client, name, params):
+        self.delay()
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            failure = self.failure(name)
+            if failure is not None and failure[0] == 'disconnect':
+                raise requests.exceptions.ConnectionError(
+                    f"('Connection aborted.', RemoteDisconnected('Remote end closed connection without response')) on {name}"
+                )
+            self.advance()
+            headers, error = self.count(client.api_key, name, params)
+            result = None
+            if error is None and failure is not None:
+                error = FakeAPIError(failure[0], failure[1], status=500 if failure[0] == -1001 else 400)
+            if error is None:
+                try:
+                    result = getattr(self, f'on_{name}')(self.account(client.api_key), **params)
+                except FakeAPIError as e:
+                    error = e
+                except TypeError as e:
+                    error = FakeAPIError(-1102, str(e))
+        self.flush()
+        if error is not None:
+            return None, error.status, headers, {'code': error.code, 'msg': error.message}
+        return result, 200, headers, result
+
+    # match the orders against the mark prices replayed since the last call
+    def advance(self):
+        now = self.now()
+        for symbol, replay in self.replays.items():
+            if replay.time < now:
+                self.match(symbol, replay.path(replay.time, now))
+                replay.time = now
+
+    # the fraction of the move from "start" to "end" at which a stop order triggers, None
+    # if it doesn't
+    def crossing(self, order, start, end):
+        stop = order['stop']
+        rising = (order['type'] == 'TAKE_PROFIT_MARKET') == (order['side'] == 'SELL')
+        if (start >= stop) if rising else (start <= stop):
+            return 0.0
+        if (end >= stop) if rising else (end <= stop):
+            return (stop - start) / (end - start)
+        return None
+
+    # trigger the stop orders of a symbol along the mark price path, in the order it crosses them
+    def match(self, symbol, points):
+        orders = [
+            (account, order) for account in self.accounts.values() for order in account.open_orders(symbol)
+            if order['type'] != 'MARKET'
+        ]
+        if len(orders) == 0:
+            return
+        for (start_time, start), (end_time, end) in zip(points, points[1:]):
+            while True:
+                triggered = None
+                for account, order in orders:
+                    if order['status'] == 'NEW':
+                        fraction = self.crossing(order, start, end)
+                        if fraction is not None and (triggered is None or fraction < triggered[0]):
+                            triggered = (fraction, account, order)
+                if triggered is None:
+                    break
+                fraction, account, order = triggered
+                # a gap past the stop price fills at the price after the gap
+                price = start if fraction == 0 else order['stop']
+                start_time = start_time + (end_time - start_time) * fraction
+                start = price
+                self.trigger(account, order, price, start_time)
+
+    def trigger(self, account, order, price, at):
+        amount, _ = account.position(order['symbol'])
+        closing = amount > 0 if order['side'] == 'SELL' else amount < 0
+        quantity = abs(amount) if order['close'] else min(order['quantity'], abs(amount))
+        if not closing or quantity == 0:
+            self.finish(account, order, 'EXPIRED', at)
+            return
+        self.fill(account, order, quantity, price, at)
+
+    def fill(self, account, order, quantity, price, at):
+        symbol = order['symbol']
+        price = price * (1 + self.slippage_rate if order['side'] == 'BUY' else 1 - self.slippage_rate)
+        position = account.position(symbol)
+        amount, entry_price = position
+        signed = quantity if order['side'] == 'BUY' else -quantity
+        profit = 0.0
+        if amount == 0 or (amount > 0) == (signed > 0):
+            position[1] = (abs(amount) * entry_price + quantity * price) / (abs(amount) + quantity)
+        else:
+            closed = min(quantity, abs(amount))
+            profit = (price - entry_price) * closed * (1 if amount > 0 else -1)
+            if abs(signed) > abs(amount):
+                # flipped to the other side
+                position[1] = price
+        position[0] = round(amount + signed, 12)
+        if position[0] == 0:
+            position[1] = 0.0
+        account.balance = account.balance + profit - quantity * price * self.fee_rate
+        order['executed'] = quantity
+        order['price'] = price
+        self.finish(account, order, 'FILLED', at)
+        self.events.append(('account', account, symbol, at))
+        if position[0] == 0:
+            # the position is closed, its other closePosition orders go with it
+            for other in account.open_orders(symbol):
+                if other['close']:
+                    self.finish(account, other, 'EXPIRED', at)
+
+    def finish(self, account, order, status, at):
+        order['status'] = status
+        order['updated'] = int(at)
+        self.events.append(('order', account, order, at))
+
+    # push the order and account updates of the last fills to the user data stream
+    def flush(self):
+        with self.lock:
+            events, self.events = self.events, []
+        if self.user_stream is None:
+            return
+        for kind, account, subject, at in events:
+            if kind == 'order':
+                self.user_stream.send_order_update(
+                    subject['symbol'], subject['orderId'], subject['status'],
+                    avg_price=subject['price'], filled_time=at, client_order_id=subject['clientOrderId']
+                )
+            else:
+                amount, entry_price = account.position(subject)
+                self.user_stream.send_account_update(
+                    balances=[(self.symbols[subject]['marginAsset'], account.balance)],
+                    positions=[(subject, amount, entry_price, self.profit(account, subject))]
+                )
+
+    def profit(self, account, symbol):
+        amount, entry_price = account.position(symbol)
+        return 0.0 if amount == 0 else (self.mark_price(symbol) - entry_price) * amount
+
+    # match the orders and push the mark prices and forming candles every tick_seconds,
+    # without waiting for calls
+    def start(self, tick_seconds=1):
+        self.alive = True
+        self.thread = threading.Thread(target=self.run, args=(tick_seconds,), name='fake-exchange', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.alive = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self, tick_seconds):
+        while self.alive:
+            with self.lock:
+                self.advance()
+                now = self.now()
+                updates = []
+                for symbol, replay in self.replays.items():
+                    index, _ = replay.locate(now)
+                    updates.append((symbol, replay.timeframe, replay.price(now), replay.kline(index, now)))
+            self.flush()
+            if self.market_stream is not None:
+                for symbol, timeframe, price, kline in updates:
+                    self.market_stream.send_mark_price(symbol, price)
+                    self.market_stream.send_kline(symbol, timeframe, *kline[:6], close_time=kline[6])
+            time.sleep(tick_seconds)
+
+    def order_info(self, order):
+        return {
+            'orderId': order['orderId'],
+            'clientOrderId': order['clientOrderId'],
+            'symbol': order['symbol'],
+            'status': order['status'],
+            'type': order['type'],
+            'origType': order['type'],
+            'side': order['side'],
+            'positionSide': 'BOTH',
+            'timeInForce': order['timeInForce'],
+            'closePosition': order['close'],
+            'reduceOnly': order['close'],
+            'stopPrice': str(order['stop']),
+            'origQty': str(order['quantity']),
+            'executedQty': str(order['executed']),
+            'avgPrice': str(order['price']),
+            'time': order['time'],
+            'updateTime': order['updated'],
+        }
+
+    def symbol_of(self, symbol):
+        symbol = str(symbol).upper()
+        if symbol not in self.symbols:
+            raise FakeAPIError(-1121)
+        return symbol
+
+    def on_futures_create_order(self, account, symbol, side, type, quantity=None, stopPrice=None, closePosition=False, timeInForce='GTC', newClientOrderId=None, **params):
+        symbol = self.symbol_of(symbol)
+        close = str(closePosition).lower() == 'true'
+        if type not in ('MARKET', 'TAKE_PROFIT_MARKET', 'STOP_MARKET') or side not in ('BUY', 'SELL'):
+            raise FakeAPIError(-1102, f'Unsupported order type {type} or side {side}.')
+        if type != 'MARKET' and stopPrice is None:
+            raise FakeAPIError(-1102, 'Mandatory parameter stopPrice was not sent.')
+        if not close and (quantity is None or float(quantity) <= 0):
+            raise FakeAPIError(-1102, 'Mandatory parameter quantity was not sent.')
+        now = self.now()
+        order_id = next(self.order_ids)
+        order = {
+            'orderId': order_id,
+            'clientOrderId': newClientOrderId or f'fake{order_id}',
+            'symbol': symbol,
+            'side': side,
+            'type': type,
+            'status': 'NEW',
+            'timeInForce': timeInForce,
+            'close': close,
+            'stop': 0.0 if stopPrice is None else float(stopPrice),
+            'quantity': 0.0 if quantity is None else float(quantity),
+            'executed': 0.0,
+            'price': 0.0,
+            'time': int(now),
+            'updated': int(now),
+        }
+        mark_price = self.mark_price(symbol)
+        if type == 'MARKET':
+            account.orders[order_id] = order
+            self.fill(account, order, order['quantity'], mark_price, now)
+            return self.order_info(order)
+        if timeInForce == 'GTE_GTC' and account.position(symbol)[0] == 0 and len(account.open_orders(symbol)) == 0:
+            raise FakeAPIError(-4129)
+        if self.crossing(order, mark_price, mark_price) is not None:
+            raise FakeAPIError(-2021)
+        account.orders[order_id] = order
+        self.events.append(('order', account, order, now))
+        return self.order_info(order)
+
+    def order_of(self, account, symbol, orderId=None, origClientOrderId=None):
+        symbol = self.symbol_of(symbol)
+        for order in account.orders.values():
+            if order['symbol'] == symbol and (order['orderId'] == orderId or (orderId is None and order['clientOrderId'] == origClientOrderId)):
+                return order
+        raise FakeAPIError(-2013)
+
+    def on_futures_get_order(self, account, symbol, orderId=None, origClientOrderId=None):
+        return self.order_info(self.order_of(account, symbol, orderId, origClientOrderId))
+
+    def on_futures_get_open_orders(self, account, symbol=None):
+        return [self.order_info(order) for order in account.open_orders(None if symbol is None else self.symbol_of(symbol))]
+
+    def on_futures_cancel_order(self, account, symbol, orderId=None, origClientOrderId=None):
+        order = self.order_of(account, symbol, orderId, origClientOrderId)
+        if order['status'] != 'NEW':
+            raise FakeAPIError(-2011)
+        self.finish(account, order, 'CANCELED', self.now())
+        return self.order_info(order)
+
+    def on_futures_cancel_all_open_orders(self, account, symbol):
+        for order in account.open_orders(self.symbol_of(symbol)):
+            self.finish(account, order, 'CANCELED', self.now())
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    def on_futures_account_balance(self, account):
+        quote_assets = sorted(set(info['marginAsset'] for info in self.symbols.values())) or [self.quote_asset]
+        profit = sum(self.profit(account, symbol) for symbol in account.positions)
+        return [
+            {
+                'accountAlias': 'fake',
+                'asset': asset,
+                'balance': str(account.balance),
+                'crossWalletBalance': str(account.balance),
+                'crossUnPnl': str(profit),
+                'availableBalance': str(account.balance + profit),
+                'maxWithdrawAmount': str(account.balance),
+                'marginAvailable': True,
+                'updateTime': int(self.now()),
+            } for asset in quote_assets
+        ]
+
+    def on_futures_position_information(self, account, symbol=None):
+        symbols = [self.symbol_of(symbol)] if symbol is not None else list(account.positions)
+        positions = []
+        for symbol in symbols:
+            amount, entry_price = account.position(symbol)
+            leverage = account.leverages.get(symbol, 20)
+            mark_price = self.mark_price(symbol)
+            notional = amount * mark_price
+            margin = abs(amount) * entry_price / leverage
+            # where the loss takes the margin, as if the maintenance margin was nothing
+            liquidation_price = 0 if amount == 0 else max(0, entry_price - margin / amount)
+            positions.append({
+                'symbol': symbol,
+                'positionAmt': str(amount),
+                'entryPrice': str(entry_price),
+                'markPrice': str(mark_price),
+                'unRealizedProfit': str(self.profit(account, symbol)),
+                'liquidationPrice': str(liquidation_price),
+                'leverage': str(leverage),
+                'maxNotionalValue': '1000000',
+                'marginType': account.margin_types.get(symbol, 'cross').lower(),
+                'isolatedMargin': str(margin),
+                'isolatedWallet': str(margin),
+                'isAutoAddMargin': 'false',
+                'positionSide': 'BOTH',
+                'notional': str(notional),
+                'updateTime': int(self.now()),
+            })
+        return positions
+
+    def on_futures_mark_price(self, account, symbol):
+        symbol = self.symbol_of(symbol)
+        return {'symbol': symbol, 'markPrice': str(self.mark_price(symbol)), 'time': int(self.now())}
+
+    def on_futures_klines(self, account, symbol, interval, limit=500, startTime=None, endTime=None):
+        replay = self.replays.get(self.symbol_of(symbol))
+        if replay is None or replay.timeframe != interval:
+            return []
+        now = self.now()
+        current, _ = replay.locate(now)
+        first, last = 0, current
+        if startTime is not None:
+            first = max(0, replay.start + math.ceil((startTime - replay.origin) / replay.timeframe_ms))
+        if endTime is not None:
+            last = min(last, replay.start + math.floor((endTime - replay.origin) / replay.timeframe_ms))
+        if startTime is None:
+            first = max(first, last - int(limit) + 1)
+        last = min(last, first + int(limit) - 1)
+        return [replay.kline(index, now) for index in range(first, last + 1)]
+
+    def on_futures_change_leverage(self, account, symbol, leverage):
+        symbol = self.symbol_of(symbol)
+        account.leverages[symbol] = int(leverage)
+        return {'symbol': symbol, 'leverage': int(leverage), 'maxNotionalValue': '1000000'}
+
+    def on_futures_change_margin_type(self, account, symbol, marginType):
+        symbol = self.symbol_of(symbol)
+        if account.margin_types.get(symbol, 'CROSSED') == marginType:
+            raise FakeAPIError(-4046)
+        account.margin_types[symbol] = marginType
+        return {'code': 200, 'msg': 'success'}
+
+    def on_futures_exchange_info(self, account):
+        return {
+            'timezone': 'UTC',
+            'serverTime': int(self.now()),
+            'symbols': [dict(info, contractType='PERPETUAL', requiredMarginPercent='5.0000') for info in self.symbols.values()]
+        }
+
+    def on_get_exchange_info(self, account):
+        return {
+            'timezone': 'UTC',
+            'serverTime': int(self.now()),
+            'symbols': [{key: value for key, value in info.items() if key != 'marginAsset'} for info in self.symbols.values()]
+        }
+
+    def on_futures_stream_get_listen_key(self, account):
+        return f'fake-{abs(hash(account.api_key)) % 10 ** 12}'
+
+    def on_futures_stream_keepalive(self, account, listenKey):
+        return {}
+
+    def on_futures_stream_close(self, account, listenKey):
+        return {}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'used_weight': self.used_weight,
+                'accounts': {
+                    api_key: {
+                        'balance': account.balance,
+                        'positions': {symbol: tuple(position) for symbol, position in account.positions.items() if position[0] != 0},
+                        'open_orders': len(account.open_orders()),
+                    } for api_key, account in self.accounts.items()
+                },
+            }
+
+
+class FakeClient:
+    '''
+    The binance Client of an API key on a FakeExchange, with the methods the bot calls.
+    Each call's response, with its status and rate limit headers, goes through the hooks
+    of "session" like a real request, so RateLimiter.watch works on it, and errors are
+    raised as the BinanceAPIException the Client raises.
+    '''
+
+    def __init__(self, exchange, api_key, api_secret=None):
+        self.exchange = exchange
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.session = requests.Session()
+
+    def request(self, name, params):
+        result, status, headers, body = self.exchange.request(self, name, params)
+        response = requests.models.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = json.dumps(body).encode()
+        response.url = f'fake://{name}'
+        for hook in self.session.hooks['response']:
+            hook(response)
+        if status != 200:
+            raise BinanceAPIException(response, status, response.text)
+        return result
+
+    def futures_create_order(self, **params):
+        return self.request('futures_create_order', params)
+
+    def futures_get_order(self, **params):
+        return self.request('futures_get_order', params)
+
+    def futures_get_open_orders(self, **params):
+        return self.request('futures_get_open_orders', params)
+
+    def futures_cancel_order(self, **params):
+        return self.request('futures_cancel_order', params)
+
+    def futures_cancel_all_open_orders(self, **params):
+        return self.request('futures_cancel_all_open_orders', params)
+
+    def futures_account_balance(self, **params):
+        return self.request('futures_account_balance', params)
+
+    def futures_position_information(self, **params):
+        return self.request('futures_position_information', params)
+
+    def futures_mark_price(self, **params):
+        return self.request('futures_mark_price', params)
+
+    def futures_klines(self, **params):
+        return self.request('futures_klines', params)
+
+    def futures_change_leverage(self, **params):
+        return self.request('futures_change_leverage', params)
+
+    def futures_change_margin_type(self, **params):
+        return self.request('futures_change_margin_type', params)
+
+    def futures_exchange_info(self):
+        return self.request('futures_exchange_info', {})
+
+    def get_exchange_info(self):
+        return self.request('get_exchange_info', {})
+
+    def futures_stream_get_listen_key(self):
+        return self.request('futures_stream_get_listen_key', {})
+
+    def futures_stream_keepalive(self, listenKey):
+        return self.request('futures_stream_keepalive', {'listenKey': listenKey})
+
+    def futures_stream_close(self, listenKey):
+        return self.request('futures_stream_close', {'listenKey': listenKey})
@@ -0,0 +1,212 @@
+import json
+import time
+import threading
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+from binance.helpers import interval_to_milliseconds
+
+
+class FakeMarketStream:
+    '''
+    A local stand-in for the futures market streams server, to try the "stream" market
+    data mode without the exchange. It answers SUBSCRIBE/UNSUBSCRIBE requests like the
+    exchange does and pushes the kline and mark price events it's told to to every
+    connection subscribed to them.
+
+        server = FakeMarketStream().start()
+        hub = MarketDataHub(client, mode=Constants.MarketDataMode.stream, stream_url=server.url)
+        server.send_kline('BTCUSDT', '1m', open_time, 1, 2, 0.5, 1.5, 10)
+        server.drop_connections()  # the hub reconnects and refills the feeds over REST
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # the streams each open connection is subscribed to
+        self.connections = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'ws://{self.host}:{self.port}'
+
+    def start(self):
+        self.server = serve(self.handle, self.host, self.port)
+        self.port = self.server.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-market-stream', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.server = None
+
+    def handle(self, connection):
+        with self.lock:
+            self.connections[connection] = set()
+        try:
+            for message in connection:
+                request = json.loads(message)
+                with self.lock:
+                    self.requests.append(request)
+                    streams = self.connections[connection]
+                    if request['method'] == 'SUBSCRIBE':
+                        streams.update(request['params'])
+                    elif request['method'] == 'UNSUBSCRIBE':
+                        streams.difference_update(request['params'])
+                connection.send(json.dumps({'result': None, 'id': request['id']}))
+        except ConnectionClosed:
+            pass
+        finally:
+            with self.lock:
+                del self.connections[connection]
+
+    def subscriptions(self):
+        with self.lock:
+            return set().union(*self.connections.values())
+
+    def send(self, stream, data):
+        message = json.dumps({'stream': stream, 'data': data})
+        with self.lock:
+            connections = [connection for connection, streams in self.connections.items() if stream in streams]
+        for connection in connections:
+            connection.send(message)
+        return len(connections)
+
+    def send_kline(self, symbol, timeframe, open_time, open_, high, low, close, volume, close_time=None, closed=False):
+        timeframe_ms = interval_to_milliseconds(timeframe)
+        return self.send(f'{symbol.lower()}@kline_{timeframe}', {
+            'e': 'kline',
+            'E': int(time.time() * 1000),
+            's': symbol.upper(),
+            'k': {
+                't': int(open_time),
+                'T': int(open_time + timeframe_ms - 1 if close_time is None else close_time),
+                's': symbol.upper(),
+                'i': timeframe,
+                'o': str(open_),
+                'h': str(high),
+                'l': str(low),
+                'c': str(close),
+                'v': str(volume),
+                'x': closed
+            }
+        })
+
+    def send_mark_price(self, symbol, price):
+        return self.send(f'{symbol.lower()}@markPrice@1s', {
+            'e': 'markPriceUpdate',
+            'E': int(time.time() * 1000),
+            's': symbol.upper(),
+            'p': str(price)
+        })
+
+    # close every open connection, like the exchange does on its daily disconnects
+    def drop_connections(self):
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.close()
+
+
+class FakeUserDataStream:
+    '''
+    A local stand-in for the futures user data stream, to try the "stream" order tracking
+    mode without the exchange. Any listen key is accepted, the events it's told to send
+    go to every open connection.
+
+        server = FakeUserDataStream().start()
+        streams = UserDataStreams(url=server.url)
+        server.send_order_update('BTCUSDT', order_id, 'FILLED', avg_price=27000.5)
+        server.expire_listen_key()  # the stream gets a new listen key and reconnects
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # the listen key each open connection was opened with
+        self.connections = {}
+
+    @property
+    def url(self):
+        return f'ws://{self.host}:{self.port}'
+
+    def start(self):
+        self.server = serve(self.handle, self.host, self.port)
+        self.port = self.server.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-user-data-stream', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.server = None
+
+    def handle(self, connection):
+        with self.lock:
+            self.connections[connection] = connection.request.path.rsplit('/', 1)[-1]
+        try:
+            for _ in connection:
+                pass
+        except ConnectionClosed:
+            pass
+        finally:
+            with self.lock:
+                del self.connections[connection]
+
+    def listen_keys(self):
+        with self.lock:
+            return list(self.connections.values())
+
+    def send(self, event):
+        event = dict(event, E=int(time.time() * 1000))
+        message = json.dumps(event)
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.send(message)
+        return len(connections)
+
+    def send_order_update(self, symbol, order_id, status, avg_price=0, filled_time=None, client_order_id=''):
+        filled_time = int(time.time() * 1000) if filled_time is None else int(filled_time)
+        return self.send({
+            'e': 'ORDER_TRADE_UPDATE',
+            'T': filled_time,
+            'o': {
+                's': symbol.upper(),
+                'c': client_order_id,
+                'i': order_id,
+                'x': 'TRADE' if status == 'FILLED' else status,
+                'X': status,
+                'ap': str(avg_price),
+                'T': filled_time
+            }
+        })
+
+    # balances as (asset, wallet balance) and positions as (symbol, amount, entry price, unrealised profit)
+    def send_account_update(self, balances=(), positions=(), reason='ORDER'):
+        return self.send({
+            'e': 'ACCOUNT_UPDATE',
+            'T': int(time.time() * 1000),
+            'a': {
+                'm': reason,
+                'B': [{'a': asset, 'wb': str(wallet_balance), 'cw': str(wallet_balance)} for asset, wallet_balance in balances],
+                'P': [
+                    {'s': symbol.upper(), 'pa': str(amount), 'ep': str(entry_price), 'up': str(unrealised_profit), 'mt': 'isolated', 'ps': 'BOTH'}
+                    for symbol, amount, entry_price, unrealised_profit in positions
+                ]
+            }
+        })
+
+    def expire_listen_key(self):
+        return self.send({'e': 'listenKeyExpired'})
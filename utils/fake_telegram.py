@@ -0,0 +1,99 @@
+import time
+import datetime
+import threading
+from telegram import Chat, Message, Update, User
+
+
+class FakeTelegramBot:
+    '''
+    A local stand-in for the Telegram Bot API of the bot's updater: it keeps count of the
+    messages, photos and documents the bot sends instead of sending them, each one taking
+    "latency" seconds like a call to Telegram would.
+    '''
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.message_ids = 0
+        self.sent = {}
+        self.sent_bytes = 0
+
+    def record(self, kind, chat_id, size=0):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.message_ids = self.message_ids + 1
+            self.sent[kind] = self.sent.get(kind, 0) + 1
+            self.sent_bytes = self.sent_bytes + size
+            message_id = self.message_ids
+        return Message(message_id, datetime.datetime.now(), Chat(chat_id, Chat.PRIVATE))
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        return self.record('message', chat_id, len(text.encode()) if text is not None else 0)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self.record('photo', chat_id, len(photo.read()) if hasattr(photo, 'read') else 0)
+
+    def send_document(self, chat_id, document, **kwargs):
+        return self.record('document', chat_id, len(document.read()) if hasattr(document, 'read') else 0)
+
+    def set_my_commands(self, commands, **kwargs):
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {'sent': dict(self.sent), 'sent_bytes': self.sent_bytes}
+
+
+class FakeDispatcher:
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.handlers = []
+        self.error_handlers = []
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    def add_error_handler(self, callback):
+        self.error_handlers.append(callback)
+
+
+class FakeUpdater:
+    '''
+    Stands in for the telegram Updater of a TradeBot, so the bot runs without Telegram:
+    its handlers are registered but nothing is polled, the commands are run by calling
+    the bot's command methods with a fake_update and a FakeContext.
+
+        bot = TradeBot(config=Config, updater=FakeUpdater())
+        bot.command_status(fake_update(chat_id, '/status'), FakeContext(bot.updater.bot))
+    '''
+
+    def __init__(self, latency=0):
+        self.bot = FakeTelegramBot(latency)
+        self.dispatcher = FakeDispatcher(self.bot)
+
+    def start_polling(self):
+        pass
+
+    def idle(self):
+        pass
+
+
+class FakeContext:
+    '''
+    The CallbackContext a command of the bot gets, without a dispatcher behind it.
+    '''
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.user_data = {}
+        self.chat_data = {}
+        self.error = None
+
+
+# an update with the message "text" sent by the chat_id to the bot
+def fake_update(chat_id, text, update_id=0):
+    user = User(int(chat_id), f'user{chat_id}', False, username=f'user{chat_id}')
+    chat = Chat(int(chat_id), Chat.PRIVATE, username=f'user{chat_id}')
+    return Update(update_id, message=Message(update_id, datetime.datetime.now(), chat, from_user=user, text=text))
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from utils.config import Config
+from utils.indicator_engine import IndicatorEngine
+
+
+class IndicatorCache:
+    '''
+    Process wide cache of indicator frames shared by every trader of a symbol.
+
+    A frame is keyed by the symbol, the timeframe, the candle it ends on and the
+    indicator parameters, so traders following the same pair get the same frame
+    back instead of each computing it. Computation is single flight: while one
+    trader computes a frame, the others asking for it wait for that result.
+    The least recently used frames are evicted once max_frames is reached.
+    '''
+
+    def __init__(self, max_frames):
+        self.max_frames = max_frames
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()
+        self.pending = {}
+        # one streaming engine (and a lock guarding it) per symbol, timeframe and parameters
+        self.engines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def frame_key(self, symbol, timeframe, df, period, factor):
+        # the last row is the forming candle, its close time stays the same until it closes
+        # while its prices keep moving, so they are part of the key too
+        last = df.iloc[-1]
+        return (
+            symbol, timeframe, last['time'], period, factor,
+            float(last['high']), float(last['low']), float(last['close']), float(last['volume'])
+        )
+
+    def engine(self, symbol, timeframe, period, factor):
+        key = (symbol, timeframe, period, factor)
+        with self.lock:
+            if key in self.engines:
+                self.engines.move_to_end(key)
+            else:
+                self.engines[key] = (
+                    IndicatorEngine(period, factor, Config.timeframe_in_seconds, Config.max_positions_per_chart),
+                    threading.Lock()
+                )
+                if len(self.engines) > self.max_frames:
+                    self.engines.popitem(last=False)
+            return self.engines[key]
+
+    def compute(self, symbol, timeframe, df, period, factor):
+        engine, engine_lock = self.engine(symbol, timeframe, period, factor)
+        with engine_lock:
+            indicators = engine.update(df)
+        if indicators is None:
+            return None
+        for column, values in indicators.items():
+            df[column] = values
+        return df
+
+    # returns the klines dataframe with the indicator columns added. The returned frame
+    # may be shared with other traders and must not be modified
+    def frame(self, symbol, timeframe, df, period, factor):
+        key = self.frame_key(symbol, timeframe, df, period, factor)
+        while True:
+            with self.lock:
+                if key in self.frames:
+                    self.frames.move_to_end(key)
+                    self.hits = self.hits + 1
+                    return self.frames[key]
+                event = self.pending.get(key)
+                if event is None:
+                    event = self.pending[key] = threading.Event()
+                    self.misses = self.misses + 1
+                    break
+            # another trader is computing this frame, wait for it and look again
+            event.wait()
+
+        frame = None
+        try:
+            frame = self.compute(symbol, timeframe, df, period, factor)
+        finally:
+            with self.lock:
+                del self.pending[key]
+                if frame is not None:
+                    self.frames[key] = frame
+                    while len(self.frames) > self.max_frames:
+                        self.frames.popitem(last=False)
+            event.set()
+        return frame
+
+
+indicator_cache = IndicatorCache(Config.indicator_cache_size)
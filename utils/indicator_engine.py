@@ -0,0 +1,273 @@
+from collections import deque
+from itertools import islice
+import numpy as np
+
+nan = float('nan')
+
+# Running exponentially weighted mean. It follows the same recurrence pandas uses for
+# Series.ewm(alpha=..., adjust=True).mean(), so a rebuild from the first candle of a
+# chart gives the same values as the functions in utils/indicators.py
+class EwmState:
+
+    def __init__(self, alpha, min_periods=0):
+        self.factor = 1 - alpha
+        self.min_periods = max(int(min_periods), 1)
+        self.weighted = nan
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def next(self, x):
+        weighted, old_wt = self.weighted, self.old_wt
+        is_observation = x == x
+        nobs = self.nobs + is_observation
+        if weighted == weighted:
+            old_wt *= self.factor
+            if is_observation:
+                if weighted != x:
+                    weighted = (old_wt * weighted + x) / (old_wt + 1)
+                old_wt += 1
+        elif is_observation:
+            weighted = x
+            old_wt = 1.0
+        return weighted, old_wt, nobs
+
+    def value(self, weighted, nobs):
+        return weighted if nobs >= self.min_periods else nan
+
+    def peek(self, x):
+        weighted, _, nobs = self.next(x)
+        return self.value(weighted, nobs)
+
+    def push(self, x):
+        self.weighted, self.old_wt, self.nobs = self.next(x)
+        return self.value(self.weighted, self.nobs)
+
+
+# Running sum over the last "length" values, kept with the same compensated (Kahan)
+# summation pandas uses for rolling sums and means
+class RollingSumState:
+
+    def __init__(self, length):
+        self.length = length
+        self.values = deque()
+        self.sum = 0.0
+        self.compensation = 0.0
+        self.nobs = 0
+
+    def add(self, total, compensation, x):
+        y = x - compensation
+        t = total + y
+        return t, t - total - y
+
+    def next(self, x):
+        total, compensation, nobs = self.sum, self.compensation, self.nobs
+        if len(self.values) == self.length:
+            oldest = self.values[0]
+            if oldest == oldest:
+                total, compensation = self.add(total, compensation, -oldest)
+                nobs -= 1
+        if x == x:
+            total, compensation = self.add(total, compensation, x)
+            nobs += 1
+        return total, compensation, nobs
+
+    def peek(self, x):
+        total, _, nobs = self.next(x)
+        return total, nobs
+
+    def push(self, x):
+        self.sum, self.compensation, self.nobs = self.next(x)
+        self.values.append(x)
+        if len(self.values) > self.length:
+            self.values.popleft()
+        return self.sum, self.nobs
+
+    def is_full(self, nobs):
+        return nobs >= self.length
+
+
+class IndicatorEngine:
+    '''
+    Keeps the running state of the indicators Trader.react feeds its strategy with
+    (ATR, ADX, RSI, MFI, supertrend and VWAP), so every newly closed candle costs
+    O(1) instead of a recomputation over the whole chart.
+
+    The last row of a klines chart is the candle that is still forming. Its values are
+    peeked from the committed state without changing it, so it can be evaluated again
+    on every fetch until it closes.
+    '''
+    columns = ('atr', 'adx', 'rsi', 'mfi', 'supertrend_is_uptrend', 'supertrend_trend', 'supertrend_vwc', 'vwap')
+
+    def __init__(self, period, factor, timeframe_seconds, window, adx_period=14, mfi_length=7):
+        self.period = period
+        self.factor = factor
+        self.adx_period = adx_period
+        self.mfi_length = mfi_length
+        self.timeframe = np.timedelta64(int(timeframe_seconds), 's')
+        self.window = window
+        self.rebuilds = 0
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.last_candle = None
+        self.history = {column: deque(maxlen=self.window) for column in self.columns}
+        # atr is the mean of the high-low range over the indicator period
+        self.atr_sum = RollingSumState(self.period)
+        # adx smooths the directional moves and the dx over the adx period
+        self.pdm_ewm = EwmState(1 / self.adx_period)
+        self.ndm_ewm = EwmState(1 / self.adx_period)
+        self.adx_ewm = EwmState(1 / self.adx_period)
+        self.last_dx = nan
+        # rsi uses an ema of span "period" for the gains and losses
+        self.gain_ewm = EwmState(2 / (self.period + 1), min_periods=self.period)
+        self.loss_ewm = EwmState(2 / (self.period + 1), min_periods=self.period)
+        # mfi sums the positive and negative money flows over the mfi length
+        self.pmf_sum = RollingSumState(self.mfi_length)
+        self.nmf_sum = RollingSumState(self.mfi_length)
+        # the supertrend weights prices by the average volume of the chart window
+        self.volume_sum = RollingSumState(self.window)
+        self.upperband = nan
+        self.lowerband = nan
+        self.direction = 1
+        # vwap is anchored to the day of the candle
+        self.vwap_day = None
+        self.vwap_wp = 0.0
+        self.vwap_volume = 0.0
+
+    def step(self, time, open_, high, low, close, volume, commit):
+        previous = self.last_candle
+        day = time.astype('datetime64[D]')
+
+        # ATR
+        atr_total, atr_nobs = (self.atr_sum.push if commit else self.atr_sum.peek)(high - low)
+        atr = atr_total / atr_nobs if self.atr_sum.is_full(atr_nobs) else nan
+
+        # ADX
+        if previous is None:
+            plus_dm = minus_dm = nan
+        else:
+            plus_dm = max(high - previous[1], 0)
+            minus_dm = min(low - previous[2], 0)
+        pdm = (self.pdm_ewm.push if commit else self.pdm_ewm.peek)(plus_dm)
+        ndm = (self.ndm_ewm.push if commit else self.ndm_ewm.peek)(minus_dm)
+        plus_di = 100 * (pdm / atr) if atr == atr and atr != 0 else nan
+        minus_di = abs(100 * (ndm / atr)) if atr == atr and atr != 0 else nan
+        di_sum = abs(plus_di + minus_di)
+        dx = (abs(plus_di - minus_di) / di_sum) * 100 if di_sum == di_sum and di_sum != 0 else nan
+        raw_adx = ((self.last_dx * (self.adx_period - 1)) + dx) / self.adx_period
+        adx = (self.adx_ewm.push if commit else self.adx_ewm.peek)(raw_adx)
+
+        # RSI
+        change = close - open_
+        ema_gain = (self.gain_ewm.push if commit else self.gain_ewm.peek)(change if change > 0 else 0)
+        ema_loss = (self.loss_ewm.push if commit else self.loss_ewm.peek)(-change if change < 0 else 0)
+        if ema_gain != ema_gain or ema_loss != ema_loss:
+            rsi = nan
+        elif ema_loss == 0:
+            rsi = 100.0 if ema_gain > 0 else nan
+        else:
+            rsi = 100 - (100 / (ema_gain / ema_loss + 1))
+
+        # MFI
+        mfi_typical_price = (close + high + low) / 3
+        raw_money_flow = mfi_typical_price * volume
+        previous_typical_price = nan if previous is None else previous[4]
+        pmf = raw_money_flow if mfi_typical_price > previous_typical_price else 0
+        nmf = raw_money_flow if mfi_typical_price < previous_typical_price else 0
+        psum, pnobs = (self.pmf_sum.push if commit else self.pmf_sum.peek)(pmf)
+        nsum, _ = (self.nmf_sum.push if commit else self.nmf_sum.peek)(nmf)
+        flow = psum + nsum
+        mfi = 100 * psum / flow if self.pmf_sum.is_full(pnobs) and flow != 0 else nan
+
+        # Supertrend
+        typical_price = (high + low + close) / 3
+        volume_total, volume_nobs = (self.volume_sum.push if commit else self.volume_sum.peek)(volume)
+        volume_mean = volume_total / volume_nobs if volume_nobs > 0 else nan
+        hl_avg = (typical_price * volume) / volume_mean
+        vwc = (close * volume) / volume_mean
+        matr = self.factor * atr
+        upperband = hl_avg + matr
+        lowerband = hl_avg - matr
+        direction = self.direction
+        if previous is None:
+            direction = 1
+            trend = 0.0
+        else:
+            if vwc > self.upperband:
+                direction = 1
+            elif vwc < self.lowerband:
+                direction = -1
+            else:
+                if direction > 0 and lowerband < self.lowerband:
+                    lowerband = self.lowerband
+                if direction < 0 and upperband > self.upperband:
+                    upperband = self.upperband
+            trend = lowerband if direction > 0 else upperband
+
+        # VWAP
+        if self.vwap_day is None or day != self.vwap_day:
+            vwap_wp, vwap_volume = 0.0, 0.0
+        else:
+            vwap_wp, vwap_volume = self.vwap_wp, self.vwap_volume
+        vwap_wp = vwap_wp + typical_price * volume
+        vwap_volume = vwap_volume + volume
+        vwap = vwap_wp / vwap_volume if vwap_volume != 0 else nan
+
+        values = (atr, adx, rsi, mfi, direction == 1, trend, vwc, vwap)
+        if commit:
+            self.last_time = time
+            self.last_candle = (open_, high, low, close, mfi_typical_price)
+            self.last_dx = dx
+            self.upperband, self.lowerband, self.direction = upperband, lowerband, direction
+            self.vwap_day, self.vwap_wp, self.vwap_volume = day, vwap_wp, vwap_volume
+            for column, value in zip(self.columns, values):
+                self.history[column].append(value)
+        return values
+
+    def rebuild(self, times, candles):
+        self.reset()
+        self.rebuilds = self.rebuilds + 1
+        self.feed(times, candles, 0, len(times))
+
+    def feed(self, times, candles, start, end):
+        for i, candle in enumerate(candles[start:end].tolist(), start):
+            self.step(times[i], *candle, commit=True)
+
+    # feed the engine a klines dataframe (as built by Trader.klines_to_dataframe) and get
+    # back the indicator columns for every row of it
+    def update(self, df):
+        times = df['time'].values
+        candles = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float)
+        closed = len(times) - 1
+        if closed < 1:
+            self.reset()
+            return None
+
+        if self.last_time is None:
+            self.rebuild(times[:closed], candles[:closed])
+        else:
+            # the index of the first closed candle the engine has not seen yet
+            start = int(np.searchsorted(times[:closed], self.last_time, side='right'))
+            if start == 0 or times[start - 1] != self.last_time:
+                # the last seen candle is no longer in the chart (restart or a long pause)
+                self.rebuild(times[:closed], candles[:closed])
+            elif (np.diff(times[start - 1:closed]) != self.timeframe).any():
+                # a candle is missing between the last seen candle and the newest one
+                self.rebuild(times[:closed], candles[:closed])
+            else:
+                self.feed(times, candles, start, closed)
+
+        forming = self.step(times[closed], *candles[closed].tolist(), commit=False)
+        rows = len(times)
+        result = {}
+        for column, value in zip(self.columns, forming):
+            history = self.history[column]
+            is_flag = column == 'supertrend_is_uptrend'
+            values = np.full(rows, False if is_flag else nan, dtype=bool if is_flag else float)
+            kept = min(len(history), closed)
+            if kept > 0:
+                values[closed - kept:closed] = list(islice(history, len(history) - kept, None))
+            values[closed] = value
+            result[column] = values
+        return result
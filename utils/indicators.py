@@ -1,5 +1,11 @@
+import numpy as np
 import pandas as pd
 from pandas.api.types import is_datetime64_any_dtype
+from utils import kernels
+
+# The get_* indicators wrap the array kernels of utils/kernels.py in the frames they always
+# returned. The bot computes its indicators with IndicatorEngine and the backtests with the
+# kernels themselves, these are kept for the scripts and notebooks calling them.
 
 def get_drift(x: int) -> int:
     """Returns an int if not zero, otherwise defaults to one."""
@@ -13,6 +19,9 @@ def panda_verify_series(series: pd.Series, min_length: int = None) -> pd.Series:
     has_length = min_length is not None and isinstance(min_length, int)
     if series is not None and isinstance(series, pd.Series):
         return None if has_length and series.size < min_length else series
+def panda_to_array(series: pd.Series) -> np.ndarray:
+    """Returns the values of a Pandas Series as a contiguous float64 array."""
+    return np.ascontiguousarray(series.to_numpy(dtype=np.float64))
 def panda_is_datetime_ordered(df: pd.DataFrame or pd.Series) -> bool:
     """Returns True if the index is a datetime and ordered."""
     index_is_datetime = is_datetime64_any_dtype(df.index)
@@ -35,8 +44,7 @@ def get_atr(high, low, period=None, length=None):
     if high is None or low is None: return
 
     # Calculate Results
-    range_ = high - low
-    atr_ = range_.rolling(period).mean()
+    atr_ = kernels.atr(panda_to_array(high), panda_to_array(low), period)
     atr_return = pd.DataFrame({
         "high": high,
         "low": low,
@@ -58,16 +66,13 @@ def get_adx(high, low, atr, period=None, length=None):
     if high is None or low is None or atr is None: return
 
     # Calculate Results
-    plus_dm = high.diff()
-    minus_dm = low.diff()
-    plus_dm[plus_dm < 0] = 0
-    minus_dm[minus_dm > 0] = 0
-    
-    plus_di = 100 * (plus_dm.ewm(alpha = 1/period).mean() / atr)
-    minus_di = abs(100 * (minus_dm.ewm(alpha = 1/period).mean() / atr))
-    dx = (abs(plus_di - minus_di) / abs(plus_di + minus_di)) * 100
-    adx = ((dx.shift(1) * (period - 1)) + dx) / period
-    adx_smooth = adx.ewm(alpha = 1/period).mean()
+    m = high.size
+    plus_dm, minus_dm = np.empty(m), np.empty(m)
+    plus_di, minus_di = np.empty(m), np.empty(m)
+    adx_smooth = kernels.adx(
+        panda_to_array(high), panda_to_array(low), panda_to_array(atr), period,
+        pdm_out=plus_dm, ndm_out=minus_dm, pdi_out=plus_di, ndi_out=minus_di
+    )
 
     adx_return = pd.DataFrame({
         "high": high,
@@ -94,57 +99,30 @@ def get_supertrend(high, low, close, volume, atr_period=None, multiplier=None, l
     close = panda_verify_series(close, length)
     volume = panda_verify_series(volume, length)
     offset = panda_get_offset(offset)
-    atr = get_atr(high, low, atr_period)['atr']
 
     if high is None or low is None or close is None: return
 
     # Calculate Results
-    m = close.size
-    dir_, trend = [1] * m, [0] * m
-    long, short = [None] * m, [None] * m
+    high_, low_, close_, volume_ = (panda_to_array(series) for series in (high, low, close, volume))
+    upperband, lowerband, volume_weighted_close = kernels.supertrend_bands(
+        high_, low_, close_, volume_, kernels.atr(high_, low_, atr_period), multiplier
+    )
+    dir_, trend, long, short = kernels.supertrend(volume_weighted_close, upperband, lowerband)
 
-    hl_avg = (high + low + close) / 3
-    
-    hl_avg = (hl_avg * volume) / volume.mean()
-    closeB4 = close
-    close = (close * volume) / volume.mean()
-    #print("VoluemeMean:", volume.mean())
-    
-    matr = multiplier * atr
-    upperband = hl_avg + matr
-    lowerband = hl_avg - matr
-
-    for i in range(1, m):
-        if close.iloc[i] > upperband.iloc[i - 1]:
-            dir_[i] = 1
-        elif close.iloc[i] < lowerband.iloc[i - 1]:
-            dir_[i] = -1
-        else:
-            dir_[i] = dir_[i - 1]
-            if dir_[i] > 0 and lowerband.iloc[i] < lowerband.iloc[i - 1]:
-                lowerband.iloc[i] = lowerband.iloc[i - 1]
-            if dir_[i] < 0 and upperband.iloc[i] > upperband.iloc[i - 1]:
-                upperband.iloc[i] = upperband.iloc[i - 1]
-
-        if dir_[i] > 0:
-            trend[i] = long[i] = lowerband.iloc[i]
-        else:
-            trend[i] = short[i] = upperband.iloc[i]
-
-    # Prepare DataFrame to return
+    # Prepare DataFrame to return, from its columns' arrays in one go
     supertrend_return = pd.DataFrame({
-            "high": high,
-            "low": low,
-            "close": closeB4,
-            "volume_weighted_close": close,
-            "volume": volume,
+            "high": high.to_numpy(copy=True),
+            "low": low.to_numpy(copy=True),
+            "close": close.to_numpy(copy=True),
+            "volume_weighted_close": volume_weighted_close,
+            "volume": volume.to_numpy(copy=True),
             "supertrend": trend,
             "supertrend_direction": dir_,
             "supertrend_long": long,
             "supertrend_short": short,
-        }, index=close.index)
-    supertrend_return['supertrend_is_uptrend'] = supertrend_return['supertrend_direction'] == 1
-        
+            "supertrend_is_uptrend": dir_ == 1,
+        }, index=close.index, copy=False)
+
     # Apply offset if needed
     if offset != 0:
         supertrend_return = supertrend_return.shift(offset)
@@ -169,9 +147,10 @@ def get_vwap(high, low, close, volume, anchor=None, offset=None):
         print(f"[!] VWAP price series is not datetime ordered. Results may not be as expected.")
 
     # Calculate Result
-    wp = typical_price * volume
-    vwap  = wp.groupby(wp.index.to_period(anchor)).cumsum()
-    vwap /= volume.groupby(volume.index.to_period(anchor)).cumsum()
+    anchors = typical_price.index.to_period(anchor).asi8
+    vwap = pd.Series(kernels.vwap(
+        panda_to_array(high), panda_to_array(low), panda_to_array(close), panda_to_array(volume), anchors
+    ), index=close.index)
 
     # Offset
     if offset != 0:
@@ -197,31 +176,34 @@ def get_rsi(open_, close, period=None, length=None):
     if open_ is None or close is None: return
 
     # Calculate Results
-    rsi_return = pd.DataFrame({
-        "open": open_,
-        "close": close
-    }, index=open_.index)
+    m = close.size
+    gain, loss = np.empty(m), np.empty(m)
+    ema_gain, ema_loss = np.empty(m), np.empty(m)
     # to calculate RSI, we first need to calculate the exponential weighted aveage gain and loss during the period
-    rsi_return['gain'] = (close - open_).apply(lambda x: x if x > 0 else 0)
-    rsi_return['loss'] = (close - open_).apply(lambda x: -x if x < 0 else 0)
-
-    # here we use the same formula to calculate Exponential Moving Average
-    rsi_return['ema_gain'] = rsi_return['gain'].ewm(span=period, min_periods=period).mean()
-    rsi_return['ema_loss'] = rsi_return['loss'].ewm(span=period, min_periods=period).mean()
-
+    rsi = kernels.rsi(
+        panda_to_array(open_), panda_to_array(close), period,
+        gain_out=gain, loss_out=loss, ema_gain_out=ema_gain, ema_loss_out=ema_loss
+    )
     # the Relative Strength is the ratio between the exponential avg gain divided by the exponential avg loss
-    rsi_return['rs'] = rsi_return['ema_gain'] / rsi_return['ema_loss']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = ema_gain / ema_loss
 
-    # the RSI is calculated based on the Relative Strength using the folcloseing formula
-    rsi_return['rsi'] = 100 - (100 / (rsi_return['rs'] + 1))
-    #max_close = close.max()
-    #rsi_return['rsi_14_close_scaled'] = max_close - (max_close / (rsi_return['rs'] + 1))
+    rsi_return = pd.DataFrame({
+        "open": open_,
+        "close": close,
+        "gain": gain,
+        "loss": loss,
+        "ema_gain": ema_gain,
+        "ema_loss": ema_loss,
+        "rs": rs,
+        "rsi": rsi
+    }, index=open_.index)
 
     return rsi_return
 
 # MFI
 def get_mfi(close, high, low, volume, period=None, length=None, drift=None):
-    """Indicator: RSI"""
+    """Indicator: Money Flow Index (MFI)"""
     # Validate Arguments
     length = int(length) if length and length > 0 else 7
     close = panda_verify_series(close, length)
@@ -234,30 +216,20 @@ def get_mfi(close, high, low, volume, period=None, length=None, drift=None):
     if close is None or high is None or low is None or volume is None: return
 
     # Calculate Results
-    typical_price = (close + high + low) / 3
-    raw_money_flow = typical_price * volume
-
-    tdf = pd.DataFrame({"diff": 0, "rmf": raw_money_flow, "+mf": 0, "-mf": 0})
-
-    tdf.loc[(typical_price.diff(drift) > 0), "diff"] = 1
-    tdf.loc[tdf["diff"] == 1, "+mf"] = raw_money_flow
-
-    tdf.loc[(typical_price.diff(drift) < 0), "diff"] = -1
-    tdf.loc[tdf["diff"] == -1, "-mf"] = raw_money_flow
-
-    psum = tdf["+mf"].rolling(length).sum()
-    nsum = tdf["-mf"].rolling(length).sum()
-    tdf["mr"] = psum / nsum
-    mfi = 100 * psum / (psum + nsum)
-    tdf["mfi"] = mfi
+    m = close.size
+    positive_flow, negative_flow = np.empty(m), np.empty(m)
+    mfi = kernels.mfi(
+        panda_to_array(close), panda_to_array(high), panda_to_array(low), panda_to_array(volume), length, drift,
+        pmf_out=positive_flow, nmf_out=negative_flow
+    )
 
     mfi_return = pd.DataFrame({
         "close": close,
         "high": high,
         "low": low,
         "volume": volume,
-        "pmf": tdf["+mf"],
-        "nmf": tdf["-mf"],
+        "pmf": positive_flow,
+        "nmf": negative_flow,
         "mfi": mfi
     }, index=close.index)
 
@@ -0,0 +1,328 @@
+import math
+import numpy as np
+
+try:
+    # optional, compiles the recursive kernels to machine code when installed
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Array kernels behind the indicators in utils/indicators.py.
+# Every kernel takes contiguous float64 arrays and writes its result into "out"
+# (allocated when not given), so a caller evaluating the same chart size over and over
+# can reuse its buffers. No pandas objects are created here.
+
+# largest growth we allow the rescaled weights of an ewm block to reach
+ewm_block_growth = 1e8
+
+
+def buffer(out, size):
+    return np.empty(size, dtype=np.float64) if out is None else out
+
+
+def diff(x, out=None):
+    out = buffer(out, x.size)
+    if x.size > 0:
+        out[0] = np.nan
+        np.subtract(x[1:], x[:-1], out=out[1:])
+    return out
+
+
+def rolling_sum(x, length, out=None):
+    out = buffer(out, x.size)
+    if x.size < length:
+        out[:] = np.nan
+        return out
+    # add the window up one shifted slice at a time, indicator windows are short
+    n = x.size
+    out[:length - 1] = np.nan
+    window = out[length - 1:]
+    np.copyto(window, x[:n - length + 1])
+    for k in range(1, length):
+        window += x[k:n - length + 1 + k]
+    return out
+
+
+def rolling_mean_loop(x, length, out):
+    # pandas' own rolling mean: compensated running sums of the values added and removed,
+    # so the means are the same to the bit as Series.rolling(length).mean()
+    total = added = removed = 0.0
+    count = negatives = same = 0
+    previous = x[0] if len(x) > 0 else 0.0
+    for i in range(len(x)):
+        if i >= length:
+            value = x[i - length]
+            if value == value:
+                count -= 1
+                y = -value - removed
+                t = total + y
+                removed = t - total - y
+                total = t
+                if math.copysign(1.0, value) < 0:
+                    negatives -= 1
+        value = x[i]
+        if value == value:
+            count += 1
+            y = value - added
+            t = total + y
+            added = t - total - y
+            total = t
+            if math.copysign(1.0, value) < 0:
+                negatives += 1
+            same = same + 1 if value == previous else 1
+            previous = value
+        if count >= length and count > 0:
+            mean = total / count
+            if same >= count:
+                mean = previous
+            elif negatives == 0 and mean < 0:
+                mean = 0.0
+            elif negatives == count and mean > 0:
+                mean = 0.0
+            out[i] = mean
+        else:
+            out[i] = math.nan
+
+
+rolling_mean_loop_compiled = njit(cache=True, nogil=True)(rolling_mean_loop) if njit is not None else None
+
+
+def rolling_mean(x, length, out=None):
+    out = buffer(out, x.size)
+    if rolling_mean_loop_compiled is not None:
+        rolling_mean_loop_compiled(x, length, out)
+        return out
+    means = [0.0] * x.size
+    rolling_mean_loop(x.tolist(), length, means)
+    out[:] = means
+    return out
+
+
+def ewm_mean(x, alpha, min_periods=0, out=None):
+    '''
+    Exponentially weighted mean of x, the same as pandas' Series.ewm(alpha=alpha,
+    min_periods=min_periods).mean() (adjust=True, NaNs keep decaying older values).
+
+    The weighted sums are scanned in blocks: inside a block every value is scaled by
+    factor^-j so a cumulative sum gives the running numerator and denominator, then the
+    sums carried over from the previous blocks are decayed in. The block length keeps
+    the scaling within ewm_block_growth.
+    '''
+    n = x.size
+    out = buffer(out, n)
+    if n == 0:
+        return out
+    factor = 1.0 - alpha
+    block = 1 if factor <= 0 else max(1, min(n, int(math.log(ewm_block_growth) / -math.log(factor))))
+    blocks = -(-n // block)
+    powers = np.arange(block + 1, dtype=np.float64)
+    growth = np.power(factor, -powers[:block])
+    decay = np.power(factor, powers)
+
+    observed = x == x
+    sums = np.zeros((2, blocks * block), dtype=np.float64)
+    np.copyto(sums[0, :n], x, where=observed)
+    sums[1, :n] = observed
+    sums = sums.reshape(2, blocks, block)
+    sums *= growth
+    np.cumsum(sums, axis=2, out=sums)
+    sums *= decay[:block]
+
+    # carry the numerator and denominator of the previous blocks into each block
+    totals = sums[:, :, block - 1].tolist()
+    carried = np.empty((2, blocks, 1), dtype=np.float64)
+    full_decay = decay[block]
+    for i in range(2):
+        carry = 0.0
+        for b in range(blocks):
+            carried[i, b, 0] = carry
+            carry = carry * full_decay + totals[i][b]
+    sums += carried * decay[1:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(sums[0].reshape(-1)[:n], sums[1].reshape(-1)[:n], out=out)
+
+    minimum = max(int(min_periods), 1)
+    if minimum > 1 or not observed.all():
+        out[np.cumsum(observed) < minimum] = np.nan
+    return out
+
+
+def atr(high, low, period, out=None):
+    return rolling_mean(np.subtract(high, low), period, out)
+
+
+def adx(high, low, atr_, period, out=None, pdm_out=None, ndm_out=None, pdi_out=None, ndi_out=None):
+    n = high.size
+    out = buffer(out, n)
+    plus_dm = diff(high, pdm_out)
+    minus_dm = diff(low, ndm_out)
+    plus_dm[plus_dm < 0] = 0
+    minus_dm[minus_dm > 0] = 0
+
+    alpha = 1 / period
+    plus_di = ewm_mean(plus_dm, alpha, out=pdi_out)
+    minus_di = ewm_mean(minus_dm, alpha, out=ndi_out)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di /= atr_
+        plus_di *= 100
+        minus_di /= atr_
+        minus_di *= 100
+        np.abs(minus_di, out=minus_di)
+        # dx
+        dx = np.abs(plus_di - minus_di)
+        dx /= np.abs(plus_di + minus_di)
+        dx *= 100
+    # adx, the dx averaged with the previous one, then smoothed
+    raw = np.empty(n, dtype=np.float64)
+    raw[0] = np.nan
+    np.multiply(dx[:-1], period - 1, out=raw[1:])
+    raw[1:] += dx[1:]
+    raw /= period
+    return ewm_mean(raw, alpha, out=out)
+
+
+def rsi(open_, close, period, out=None, gain_out=None, loss_out=None, ema_gain_out=None, ema_loss_out=None):
+    n = close.size
+    out = buffer(out, n)
+    change = np.subtract(close, open_)
+    gain = np.maximum(change, 0, out=buffer(gain_out, n))
+    loss = np.maximum(np.negative(change, out=change), 0, out=buffer(loss_out, n))
+
+    # the exponential weighted average gain and loss during the period
+    alpha = 2 / (period + 1)
+    ema_gain = ewm_mean(gain, alpha, min_periods=period, out=ema_gain_out)
+    ema_loss = ewm_mean(loss, alpha, min_periods=period, out=ema_loss_out)
+    # the relative strength is their ratio
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(ema_gain, ema_loss, out=out)
+        out += 1
+        np.divide(100, out, out=out)
+        np.subtract(100, out, out=out)
+    return out
+
+
+def mfi(close, high, low, volume, length, drift=1, out=None, pmf_out=None, nmf_out=None):
+    n = close.size
+    out = buffer(out, n)
+    typical_price = np.add(close, high)
+    typical_price += low
+    typical_price /= 3
+    raw_money_flow = typical_price * volume
+
+    change = np.full(n, np.nan)
+    if n > drift:
+        np.subtract(typical_price[drift:], typical_price[:-drift], out=change[drift:])
+    positive_flow = buffer(pmf_out, n)
+    negative_flow = buffer(nmf_out, n)
+    np.copyto(positive_flow, np.where(change > 0, raw_money_flow, 0.0))
+    np.copyto(negative_flow, np.where(change < 0, raw_money_flow, 0.0))
+
+    psum = rolling_sum(positive_flow, length, typical_price)
+    nsum = rolling_sum(negative_flow, length, raw_money_flow)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.add(psum, nsum, out=out)
+        np.divide(psum, out, out=out)
+        out *= 100
+    return out
+
+
+# the volume weighted bands the supertrend ratchets between
+def supertrend_bands(high, low, close, volume, atr_, multiplier, upper_out=None, lower_out=None, vwc_out=None):
+    n = close.size
+    upperband = buffer(upper_out, n)
+    lowerband = buffer(lower_out, n)
+    volume_weighted_close = buffer(vwc_out, n)
+    volume_mean = volume.mean()
+
+    hl_avg = np.add(high, low)
+    hl_avg += close
+    hl_avg /= 3
+    hl_avg *= volume
+    hl_avg /= volume_mean
+    np.multiply(close, volume, out=volume_weighted_close)
+    volume_weighted_close /= volume_mean
+
+    matr = np.multiply(atr_, multiplier)
+    np.add(hl_avg, matr, out=upperband)
+    np.subtract(hl_avg, matr, out=lowerband)
+    return upperband, lowerband, volume_weighted_close
+
+
+def supertrend_loop(volume_weighted_close, upperband, lowerband, direction, trend, long, short):
+    m = len(volume_weighted_close)
+    for i in range(1, m):
+        if volume_weighted_close[i] > upperband[i - 1]:
+            direction[i] = 1
+        elif volume_weighted_close[i] < lowerband[i - 1]:
+            direction[i] = -1
+        else:
+            direction[i] = direction[i - 1]
+            if direction[i] > 0 and lowerband[i] < lowerband[i - 1]:
+                lowerband[i] = lowerband[i - 1]
+            if direction[i] < 0 and upperband[i] > upperband[i - 1]:
+                upperband[i] = upperband[i - 1]
+
+        if direction[i] > 0:
+            trend[i] = long[i] = lowerband[i]
+            short[i] = math.nan
+        else:
+            trend[i] = short[i] = upperband[i]
+            long[i] = math.nan
+
+
+supertrend_loop_compiled = njit(cache=True, nogil=True)(supertrend_loop) if njit is not None else None
+
+
+def supertrend(volume_weighted_close, upperband, lowerband, direction_out=None, trend_out=None, long_out=None, short_out=None):
+    '''
+    Runs the supertrend recursion: the direction flips when the volume weighted close
+    crosses the previous band, otherwise the band on the trend side is ratcheted so it
+    never loosens. upperband and lowerband are updated in place.
+    Returns the direction (1 or -1, int64), the trend line, and the trend line split into
+    its long and short parts (NaN where it's on the other side, and on the first row).
+    '''
+    m = volume_weighted_close.size
+    direction = np.ones(m, dtype=np.int64) if direction_out is None else direction_out
+    trend = buffer(trend_out, m)
+    long = buffer(long_out, m)
+    short = buffer(short_out, m)
+    direction[:1] = 1
+    trend[:1] = 0
+    long[:1] = short[:1] = np.nan
+    if supertrend_loop_compiled is not None:
+        supertrend_loop_compiled(volume_weighted_close, upperband, lowerband, direction, trend, long, short)
+        return direction, trend, long, short
+
+    # plain python floats are far cheaper to index than numpy scalars
+    upper, lower = upperband.tolist(), lowerband.tolist()
+    directions, trends, longs, shorts = direction.tolist(), trend.tolist(), long.tolist(), short.tolist()
+    supertrend_loop(volume_weighted_close.tolist(), upper, lower, directions, trends, longs, shorts)
+    upperband[:] = upper
+    lowerband[:] = lower
+    direction[:] = directions
+    trend[:] = trends
+    long[:] = longs
+    short[:] = shorts
+    return direction, trend, long, short
+
+
+# vwap anchored to the periods in "anchors", an int array holding the period each row
+# belongs to (rows of the same period must be next to each other)
+def vwap(high, low, close, volume, anchors, out=None):
+    n = close.size
+    out = buffer(out, n)
+    typical_price = np.add(high, low)
+    typical_price += close
+    typical_price /= 3
+    typical_price *= volume
+    cumulative_volume = np.empty(n, dtype=np.float64)
+
+    starts = np.flatnonzero(np.diff(anchors)) + 1
+    bounds = np.concatenate(([0], starts, [n]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        np.cumsum(typical_price[start:end], out=out[start:end])
+        np.cumsum(volume[start:end], out=cumulative_volume[start:end])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out /= cumulative_volume
+    return out
@@ -1,14 +1,303 @@
+import os
+import re
+import gzip
+import atexit
+import json
+import time
+import queue
+import shutil
+import sqlite3
+import datetime
+import threading
+import numpy as np
+from loguru import logger
+from utils.config import Config
+from utils.constants import Constants
 
+levels = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
 
-import sqlalchemy
-from utils.constants import Constants
+
+class LogSink:
+    '''
+    Writes the bot's log files from one thread, so the trading threads only ever put a
+    record in a queue of up to log_queue_size of them and never wait on the disk.
+
+    Records below log_level are dropped before anything about them is formatted, and
+    the fields given as callables are only called for the records kept. They're written
+    as 'text' blocks like before or as 'json' lines. When the queue is full new records
+    are dropped, and with the 'sample' backpressure only one in log_sample_every info
+    and debug records is kept once it's half full; the records dropped are counted in
+    the next one written. A file is rotated once it's past log_rotation_bytes or older
+    than log_rotation_seconds, gzipped, and its log_backups latest rotations kept.
+
+    Only one process may write and rotate a file, so the trade shards of the "sharded"
+    execution mode log to their own, with the shard's "suffix" before the extension.
+    '''
+
+    def __init__(self, queue_size=None):
+        self.queue = queue.Queue(maxsize=Config.log_queue_size if queue_size is None else queue_size)
+        self.level = levels[Config.log_level]
+        self.lock = threading.Lock()
+        self.thread = None
+        self.files = {}
+        self.sampled = 0
+        self.dropped = 0
+        self.written = 0
+        self.suffix = None
+
+    def enabled(self, level):
+        return levels[level] >= self.level
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='log-sink', daemon=True)
+                self.thread.start()
+
+    def log(self, path, level, message, fields):
+        if not self.enabled(level):
+            return
+        if Config.log_backpressure == Constants.LogBackpressure.sample and levels[level] < levels['WARNING'] \
+                and self.queue.qsize() >= self.queue.maxsize / 2:
+            with self.lock:
+                self.sampled = self.sampled + 1
+                if self.sampled % Config.log_sample_every != 0:
+                    self.dropped = self.dropped + 1
+                    return
+        fields = {name: value() if callable(value) else value for name, value in fields.items()}
+        if self.suffix is not None:
+            root, extension = os.path.splitext(path)
+            path = f'{root}.{self.suffix}{extension}'
+        self.start()
+        try:
+            self.queue.put_nowait((time.time(), level, path, message, fields))
+        except queue.Full:
+            with self.lock:
+                self.dropped = self.dropped + 1
+
+    def format(self, record):
+        at, level, _, message, fields = record
+        if Config.log_format == Constants.LogFormat.json:
+            return json.dumps(
+                {'time': datetime.datetime.fromtimestamp(at).isoformat(), 'level': level, 'message': message, **fields},
+                default=str
+            ) + '\n'
+        lines = [message] + [f'{name}: {value}' for name, value in fields.items()]
+        return '\n'.join(lines) + Constants.log_text_nl
+
+    def run(self):
+        while True:
+            records = [self.queue.get()]
+            # whatever else is queued goes in the same writes
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            try:
+                if dropped > 0:
+                    records.insert(0, (time.time(), 'WARNING', records[0][2], f'{dropped} log records dropped', {}))
+                for record in records:
+                    self.file(record[2]).write(self.format(record))
+                    self.written = self.written + 1
+                for file, _ in self.files.values():
+                    file.flush()
+            except Exception as e:
+                logger.warning(f'LogSinkError: {e}')
+            for _ in range(len(records) - (1 if dropped > 0 else 0)):
+                self.queue.task_done()
+
+    # the open file of a path, rotated first if it's due
+    def file(self, path):
+        entry = self.files.get(path)
+        if entry is not None:
+            file, opened = entry
+            size = file.tell()
+            if size >= Config.log_rotation_bytes or (size > 0 and time.time() - opened >= Config.log_rotation_seconds):
+                file.close()
+                del self.files[path]
+                self.rotate(path)
+                entry = None
+        if entry is None:
+            directory = os.path.dirname(path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            entry = self.files[path] = (open(path, 'a'), time.time())
+        return entry[0]
+
+    def rotate(self, path):
+        directory, name = os.path.split(path)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        # the index counts the rotations within the same second, after the last one kept,
+        # zero padded so the backups sort by name in the order they were made
+        prefix = f'{name}.{stamp}-'
+        indices = [
+            int(file[len(prefix):-len('.gz')]) for file in os.listdir(directory or '.')
+            if file.startswith(prefix) and file.endswith('.gz') and file[len(prefix):-len('.gz')].isdigit()
+        ]
+        rotated = f'{path}.{stamp}-{max(indices, default=-1) + 1:03d}.gz'
+        with open(path, 'rb') as source, gzip.open(rotated, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+        backups = sorted(
+            file for file in os.listdir(directory or '.') if file.startswith(f'{name}.') and file.endswith('.gz')
+        )
+        for old in backups[:max(0, len(backups) - Config.log_backups)]:
+            os.remove(os.path.join(directory, old))
+
+    # wait until everything queued so far is written, for up to "timeout" seconds if given
+    def flush(self, timeout=None):
+        if self.thread is None:
+            return
+        if timeout is None:
+            self.queue.join()
+            return
+        deadline = time.time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0 and time.time() < deadline:
+                self.queue.all_tasks_done.wait(deadline - time.time())
+
+
+log_sink = LogSink()
+
+
+# log the message and fields to the file at filepath, through the bot's log sink
+def filelog(filepath, content, level='INFO', **fields):
+    log_sink.log(filepath, level, content, fields)
+
+
+# the chart log table of a symbol
+def chart_log_table(symbol):
+    return f'{Constants.chart_log_table_name}_{re.sub(r"[^A-Za-z0-9]", "_", symbol.upper())}'
+
+
+class ChartLogger:
+    '''
+    Keeps the history of the traded charts, their closed candles and indicator values,
+    in a table per symbol of the chart log database, keyed and ordered by close time.
+
+    Only the candles closed since the last ones logged for a symbol are queued, so the
+    traders of a symbol log each candle once, and a writer thread appends them in
+    batches (chart_log_batch_size rows or every chart_log_flush_seconds) over one
+    connection in WAL mode, so reading the log doesn't block it.
+    '''
+
+    def __init__(self, path=None):
+        self.path = f'{Constants.log_dir_name}/{Constants.chart_log_db_filename}' if path is None else path
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # the close time of the last candle queued, by symbol
+        self.last_times = {}
+        self.thread = None
+        self.written = 0
+        self.errors = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='chart-logger', daemon=True)
+                self.thread.start()
+
+    # queue the closed candles of the chart (every row but the forming last one) not logged yet
+    def log(self, symbol, chart):
+        symbol = symbol.upper()
+        times = chart['time'].to_numpy().astype('datetime64[ms]').astype(np.int64)[:-1]
+        with self.lock:
+            last_time = self.last_times.get(symbol)
+            start = 0 if last_time is None else int(np.searchsorted(times, last_time, side='right'))
+            if start >= len(times):
+                return
+            self.last_times[symbol] = int(times[-1])
+        columns = [column for column in chart.columns if column != 'time']
+        values = chart[columns].iloc[start:len(times)]
+        rows = [
+            (int(time_), *[value.item() if hasattr(value, 'item') else value for value in row])
+            for time_, row in zip(times[start:], values.itertuples(index=False, name=None))
+        ]
+        self.start()
+        self.queue.put((symbol, columns, rows))
+
+    def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def run(self):
+        connection = self.connect()
+        tables = {}
+        while True:
+            batch = [self.queue.get()]
+            size = 0 if batch[0] is None else len(batch[0][2])
+            deadline = time.time() + Config.chart_log_flush_seconds
+            while size < Config.chart_log_batch_size and batch[-1] is not None:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item is not None:
+                    size = size + len(item[2])
+            try:
+                self.write(connection, tables, [item for item in batch if item is not None])
+            except Exception as e:
+                self.errors = self.errors + 1
+                logger.warning(f'ChartLogError: {e}')
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def write(self, connection, tables, batch):
+        with connection:
+            for symbol, columns, rows in batch:
+                table = chart_log_table(symbol)
+                known = tables.get(table)
+                if known is None:
+                    connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (time INTEGER PRIMARY KEY)')
+                    known = tables[table] = {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+                for column in columns:
+                    if column not in known:
+                        connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+                        known.add(column)
+                names = ', '.join(f'"{column}"' for column in ['time'] + columns)
+                marks = ', '.join('?' for _ in range(len(columns) + 1))
+                # a candle logged before a restart is kept as it was
+                cursor = connection.executemany(f'INSERT OR IGNORE INTO "{table}" ({names}) VALUES ({marks})', rows)
+                self.written = self.written + max(0, cursor.rowcount)
+
+    # wait until everything queued so far is written
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+
+    # write what's queued and end the writer thread, waiting up to "timeout" seconds if given
+    def stop(self, timeout=None):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+
+chart_logger = ChartLogger()
 
 
-def filelog(filepath, content):
-    with open(filepath, 'a+') as f:
-        f.write(content)
+def chartlog(symbol, chart):
+    chart_logger.log(symbol, chart)
 
 
-def chartlog(chart):
-    db = sqlalchemy.create_engine(f'sqlite:///{Constants.log_dir_name}/{Constants.chart_log_db_filename}')
-    chart.to_sql(Constants.chart_log_table_name, db, if_exists='replace', index=False)
\ No newline at end of file
+# the writer threads are daemons, so what's still queued when the process exits is written
+# first, for up to log_exit_timeout_seconds each
+@atexit.register
+def flush_logs():
+    try:
+        log_sink.flush(timeout=Config.log_exit_timeout_seconds)
+        chart_logger.stop(timeout=Config.log_exit_timeout_seconds)
+    except Exception as e:
+        logger.warning(f'LogSinkError: {e}')